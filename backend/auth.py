@@ -4,60 +4,85 @@ Implementa JWT, roles de usuario y control de acceso
 """
 
 from datetime import datetime, timedelta
-from typing import Optional, List
-from passlib.context import CryptContext
+from typing import Optional, NamedTuple
+from functools import lru_cache
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
+import hashlib
 import os
+import time
+import uuid
+
+from cache import TTLCache
+from database import get_db
+from password_hashing import pwd_context, password_hasher, PasswordHasherBusy
+from revocation import revocation_list
+from refresh_tokens import revoke_user_refresh_tokens, revoke_users_refresh_tokens
+from policy import (
+    UserRole, ROLE_MASKS, POLICY_VERSION,
+    permission_bit, compile_user_mask
+)
+import models_auth
 
 # Configuración de seguridad
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "jwt-secreto-cambiar-en-produccion")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+# Access tokens cortos: se renuevan con refresh tokens (refresh_tokens.py) sin bcrypt
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+
+# Caché de usuarios autenticados (por proceso; el TTL acota la desactualización entre workers)
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "10000"))
 
-# Contexto para hasheo de contraseñas
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Caché de tokens ya verificados (evita HMAC + parseo en cada request)
+JWT_CACHE_MAX_SIZE = int(os.getenv("JWT_CACHE_MAX_SIZE", "50000"))
 
 # OAuth2 para obtener el token
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-# Roles disponibles
-class UserRole:
-    ADMIN = "admin"
-    USER = "user"
-    VIEWER = "viewer"
-
-# Permisos por rol
-ROLE_PERMISSIONS = {
-    UserRole.ADMIN: [
-        "create_palette",
-        "delete_palette",
-        "view_palette",
-        "delete_all_palettes",
-        "view_stats",
-        "manage_users"
-    ],
-    UserRole.USER: [
-        "create_palette",
-        "delete_own_palette",
-        "view_palette",
-        "view_stats"
-    ],
-    UserRole.VIEWER: [
-        "view_palette",
-        "view_stats"
-    ]
-}
+def _password_hasher_busy():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Servicio de autenticación saturado, intenta de nuevo",
+        headers={"Retry-After": "1"},
+    )
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verificar contraseña"""
-    return pwd_context.verify(plain_password, hashed_password)
+    """Verificar contraseña (en el executor dedicado de bcrypt)"""
+    try:
+        return password_hasher.verify(plain_password, hashed_password)
+    except PasswordHasherBusy:
+        raise _password_hasher_busy()
+
+def verify_password_and_update(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    """Verificar contraseña y obtener un hash nuevo si cambió el costo configurado"""
+    try:
+        return password_hasher.verify_and_update(plain_password, hashed_password)
+    except PasswordHasherBusy:
+        raise _password_hasher_busy()
 
 def get_password_hash(password: str) -> str:
-    """Hashear contraseña"""
-    return pwd_context.hash(password)
+    """Hashear contraseña (en el executor dedicado de bcrypt)"""
+    try:
+        return password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise _password_hasher_busy()
+
+async def verify_password_and_update_async(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    """Como verify_password_and_update, para endpoints async (no bloquea ningún hilo)"""
+    try:
+        return await password_hasher.verify_and_update_async(plain_password, hashed_password)
+    except PasswordHasherBusy:
+        raise _password_hasher_busy()
+
+async def get_password_hash_async(password: str) -> str:
+    """Como get_password_hash, para endpoints async (no bloquea ningún hilo)"""
+    try:
+        return await password_hasher.hash_async(password)
+    except PasswordHasherBusy:
+        raise _password_hasher_busy()
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Crear token JWT"""
@@ -67,27 +92,91 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode.update({"exp": expire})
+    # jti identifica el token para poder revocarlo; iat permite revocar por usuario
+    # iat en milisegundos truncados (NumericDate admite decimales): ordena tokens del mismo segundo
+    to_encode.setdefault("jti", uuid.uuid4().hex)
+    to_encode.update({"exp": expire, "iat": int(time.time() * 1000) / 1000})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# Claims verificados indexados por digest del token; cada entrada vive hasta su "exp"
+token_cache = TTLCache(maxsize=JWT_CACHE_MAX_SIZE, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+def _token_digest(token: str) -> bytes:
+    """Digest corto del token (no se guardan tokens en claro en memoria)"""
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+def forget_token(token: str):
+    """Quitar un token del caché de verificación (p. ej. al revocarlo)"""
+    token_cache.pop(_token_digest(token))
+
+def load_user_mask(db: Session, user_id: int, role: str) -> int:
+    """Máscara de permisos efectiva del usuario (rol + overrides)"""
+    overrides = db.query(
+        models_auth.UserPermissionOverride.permission,
+        models_auth.UserPermissionOverride.granted
+    ).filter(models_auth.UserPermissionOverride.user_id == user_id).all()
+    return compile_user_mask(
+        role,
+        grants=[o.permission for o in overrides if o.granted],
+        denials=[o.permission for o in overrides if not o.granted],
+    )
+
+def create_user_access_token(db: Session, user: models_auth.User) -> str:
+    """Token de acceso con uid y máscara de permisos compilada"""
+    return create_access_token(data={
+        "sub": user.username,
+        "role": user.role,
+        "uid": user.id,
+        "perm": load_user_mask(db, user.id, user.role),
+        "pv": POLICY_VERSION,
+    })
+
 def decode_token(token: str) -> dict:
-    """Decodificar token JWT"""
+    """Decodificar token JWT (con caché de tokens ya verificados)"""
+    key = _token_digest(token)
+    payload = token_cache.get(key)
+    if payload is not None:
+        # Re-validar "exp" con reloj de pared: el TTL del caché usa reloj monotónico
+        if payload.get("exp", 0) > time.time():
+            return dict(payload)
+        token_cache.pop(key)
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="No se pudo validar las credenciales",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    
+    exp = payload.get("exp")
+    if exp is not None:
+        ttl = exp - time.time()
+        if ttl > 0:
+            token_cache.set(key, payload, ttl=ttl)
+    return dict(payload)
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     """Obtener usuario actual desde el token"""
     payload = decode_token(token)
     username: str = payload.get("sub")
     role: str = payload.get("role")
+    uid: Optional[int] = payload.get("uid")
+    
+    if "perm" in payload:
+        # Máscaras emitidas con otra asignación de bits no son interpretables
+        if payload.get("pv") != POLICY_VERSION:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token emitido con otra política, renueva la sesión",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        perm = payload["perm"]
+    else:
+        # Tokens anteriores a las máscaras
+        perm = ROLE_MASKS.get(role, 0)
     
     if username is None:
         raise HTTPException(
@@ -95,18 +184,120 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
             detail="No se pudo validar las credenciales",
         )
     
-    return {"username": username, "role": role}
+    if revocation_list.is_revoked(payload.get("jti"), uid, payload.get("iat")):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token revocado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    return {"username": username, "role": role, "uid": uid, "perm": perm}
+
+# ============================================================================
+# CACHÉ DE USUARIOS AUTENTICADOS
+# ============================================================================
+
+class CachedUser(NamedTuple):
+    """Campos del usuario que necesitan los endpoints (sin PII)"""
+    id: int
+    username: str
+    role: str
+    is_active: bool
+
+user_cache = TTLCache(maxsize=USER_CACHE_MAX_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+
+def invalidate_cached_user(user_id: int):
+    """Invalidar la entrada de un usuario (cambios de rol/estado o eliminación)"""
+    user_cache.pop(user_id)
+
+def _load_user(db: Session, uid: Optional[int], username: str) -> Optional[CachedUser]:
+    """Cargar solo las columnas necesarias del usuario"""
+    query = db.query(
+        models_auth.User.id, models_auth.User.username,
+        models_auth.User.role, models_auth.User.is_active
+    )
+    if uid is not None:
+        row = query.filter(models_auth.User.id == uid).first()
+    else:
+        # Tokens emitidos antes de incluir "uid"
+        row = query.filter(models_auth.User.username == username).first()
+    if row is None:
+        return None
+    return CachedUser(row.id, row.username, row.role, bool(row.is_active))
+
+def get_current_db_user(
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+) -> CachedUser:
+    """Obtener el registro del usuario autenticado (caché por uid, como máximo 1 query)"""
+    uid = current_user.get("uid")
+    username = current_user["username"]
+    
+    user = user_cache.get(uid) if uid is not None else None
+    # El username protege contra ids reutilizados tras eliminar usuarios
+    if user is None or user.username != username:
+        user = _load_user(db, uid, username)
+        if user is None or user.username != username:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="No se pudo validar las credenciales",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        user_cache.set(user.id, user)
+    
+    if not user.is_active:
+        raise HTTPException(status_code=403, detail="Usuario desactivado")
+    return user
+
+def revoke_token(db: Session, token: str):
+    """Revocar un token (logout) hasta su expiración"""
+    payload = decode_token(token)
+    if "jti" not in payload:
+        raise HTTPException(status_code=400, detail="Token sin identificador (jti)")
+    revocation_list.revoke(db, payload["jti"], payload["exp"], payload.get("uid"))
+    forget_token(token)
+
+def revoke_user_tokens(db: Session, user_id: int):
+    """Revocar todos los tokens emitidos para un usuario (desactivación o eliminación)"""
+    revocation_list.revoke_user(db, user_id, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+    revoke_user_refresh_tokens(db, user_id)
+    invalidate_cached_user(user_id)
+
+def revoke_users_tokens(db: Session, user_ids: list[int]):
+    """Versión masiva de revoke_user_tokens: confirma la transacción en curso del llamador"""
+    revoke_users_refresh_tokens(db, user_ids)
+    revocation_list.revoke_users(db, user_ids, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+    for user_id in user_ids:
+        invalidate_cached_user(user_id)
+
+def refresh_users_permissions(db: Session, user_ids: list[int]):
+    """Versión masiva de refresh_user_permissions: confirma la transacción en curso del llamador"""
+    revocation_list.revoke_users(db, user_ids, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+    for user_id in user_ids:
+        invalidate_cached_user(user_id)
+
+def refresh_user_permissions(db: Session, user_id: int):
+    """
+    Propagar un cambio de rol/permisos: los access tokens emitidos antes dejan de valer
+    (el cliente los renueva con su refresh token y recibe la máscara nueva)
+    """
+    revocation_list.revoke_user(db, user_id, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+    invalidate_cached_user(user_id)
 
 def check_permission(user: dict, permission: str) -> bool:
     """Verificar si el usuario tiene un permiso específico"""
-    role = user.get("role", UserRole.VIEWER)
-    permissions = ROLE_PERMISSIONS.get(role, [])
-    return permission in permissions
+    mask = user.get("perm")
+    if mask is None:
+        mask = ROLE_MASKS.get(user.get("role", UserRole.VIEWER), 0)
+    return bool(mask & permission_bit(permission))
 
+@lru_cache(maxsize=None)
 def require_permission(permission: str):
-    """Decorador para requerir un permiso específico"""
+    """Dependencia que requiere un permiso (una sola instancia por permiso)"""
+    bit = permission_bit(permission)
+
     async def permission_checker(current_user: dict = Depends(get_current_user)):
-        if not check_permission(current_user, permission):
+        if not current_user["perm"] & bit:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"No tienes permiso para: {permission}"
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Copias de seguridad en línea de la BD SQLite
+
+Usa la API de backup de SQLite (nunca copiar el archivo en vivo: con WAL, el .db solo no es
+consistente). Con WAL la copia se hace en un solo paso sobre una instantánea de lectura,
+que no bloquea a los escritores; sin WAL se copia por pasos de BACKUP_PAGES_PER_STEP
+páginas con una pausa entre pasos, para que los escritores no esperen más que un paso.
+
+Cada copia se verifica (PRAGMA integrity_check), se comprime con gzip y se rota
+(se conservan las BACKUP_KEEP más recientes). Se programa con el mantenimiento
+(BACKUP_INTERVAL_SECONDS) o con POST /admin/backups.
+
+Restaurar (con la API detenida):
+  gunzip -c data/backups/palettes-AAAAMMDDTHHMMSSZ.db.gz > data/palettes.db
+  rm -f data/palettes.db-wal data/palettes.db-shm
+
+Ejecutar: python backend/backup.py
+"""
+
+from datetime import datetime, timezone
+from typing import Optional
+from sqlalchemy.engine import Engine
+import gzip
+import shutil
+import sqlite3
+import threading
+import time
+import sys
+import os
+
+# Agregar el directorio backend al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+from logger_config import app_logger
+from metrics import record_backup
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", "data/backups")
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "1000"))
+BACKUP_STEP_SLEEP_SECONDS = float(os.getenv("BACKUP_STEP_SLEEP_SECONDS", "0.05"))
+# Copias programadas por el mantenimiento (0 = solo bajo demanda)
+BACKUP_INTERVAL_SECONDS = float(os.getenv("BACKUP_INTERVAL_SECONDS", "86400"))
+
+BACKUP_PREFIX = "palettes-"
+BACKUP_SUFFIX = ".db.gz"
+
+
+class BackupError(RuntimeError):
+    """La copia no se pudo completar o no pasó la verificación"""
+
+
+def _copy(source: sqlite3.Connection, path: str):
+    """Copiar la BD con la API de backup (un paso con WAL, por pasos sin WAL)"""
+    wal = source.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    target = sqlite3.connect(path)
+    try:
+        if wal:
+            source.backup(target)
+        else:
+            source.backup(target, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP_SECONDS)
+        # La copia queda en modo rollback (un solo archivo, sin -wal)
+        target.execute("PRAGMA journal_mode=DELETE")
+        problems = [row[0] for row in target.execute("PRAGMA integrity_check")]
+        if problems != ["ok"]:
+            raise BackupError(f"La copia no pasó integrity_check: {'; '.join(problems[:5])}")
+    finally:
+        target.close()
+
+
+def _compress(path: str, destination: str):
+    with open(path, "rb") as src, gzip.open(destination, "wb", compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+
+
+def list_backups(directory: Optional[str] = None) -> list[dict]:
+    """Copias existentes, de la más reciente a la más antigua"""
+    directory = directory or BACKUP_DIR
+    if not os.path.isdir(directory):
+        return []
+    backups = []
+    for name in os.listdir(directory):
+        if name.startswith(BACKUP_PREFIX) and name.endswith(BACKUP_SUFFIX):
+            path = os.path.join(directory, name)
+            backups.append({"name": name, "size_bytes": os.path.getsize(path),
+                            "created_at": datetime.fromtimestamp(os.path.getmtime(path), timezone.utc).isoformat()})
+    # El nombre lleva la fecha UTC: el orden alfabético es el cronológico
+    return sorted(backups, key=lambda b: b["name"], reverse=True)
+
+
+def rotate_backups(directory: Optional[str] = None, keep: Optional[int] = None) -> list[str]:
+    """Borrar las copias más antiguas que excedan `keep`; devuelve los nombres borrados"""
+    directory = directory or BACKUP_DIR
+    keep = BACKUP_KEEP if keep is None else keep
+    removed = [b["name"] for b in list_backups(directory)[keep:]]
+    for name in removed:
+        os.remove(os.path.join(directory, name))
+    return removed
+
+
+_backup_lock = threading.Lock()
+
+
+def run_backup(engine: Engine, directory: Optional[str] = None, keep: Optional[int] = None) -> dict:
+    """
+    Copiar, verificar, comprimir y rotar; devuelve nombre, tamaños y duración
+
+    Una sola copia a la vez por proceso (BackupError si ya hay una en curso).
+    """
+    if engine.dialect.name != "sqlite":
+        raise BackupError("Las copias en línea solo están disponibles con SQLite")
+    if not _backup_lock.acquire(blocking=False):
+        raise BackupError("Ya hay una copia en curso")
+    directory = directory or BACKUP_DIR
+    started = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    name = f"{BACKUP_PREFIX}{stamp}{BACKUP_SUFFIX}"
+    copy_path = os.path.join(directory, f".{name}.db.partial")
+    gz_path = os.path.join(directory, f".{name}.partial")
+    raw = engine.raw_connection()
+    try:
+        _copy(raw.driver_connection, copy_path)
+        raw.close()
+        raw = None
+        _compress(copy_path, gz_path)
+        # Renombrar es atómico: una copia visible siempre está completa
+        os.replace(gz_path, os.path.join(directory, name))
+        result = {
+            "name": name,
+            "database_bytes": os.path.getsize(copy_path),
+            "size_bytes": os.path.getsize(os.path.join(directory, name)),
+        }
+    except Exception as e:
+        record_backup(time.perf_counter() - started, None)
+        app_logger.error(f"Copia de seguridad fallida: {e}")
+        raise
+    finally:
+        if raw is not None:
+            raw.close()
+        for leftover in (copy_path, gz_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        _backup_lock.release()
+
+    result["rotated"] = rotate_backups(directory, keep)
+    result["duration_seconds"] = round(time.perf_counter() - started, 3)
+    record_backup(result["duration_seconds"], result["size_bytes"])
+    app_logger.info(f"Copia de seguridad {name}: {result['size_bytes']} bytes en {result['duration_seconds']} s")
+    return result
+
+
+class BackupJob:
+    """Copia bajo demanda en un hilo de fondo (POST /admin/backups)"""
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self._thread: Optional[threading.Thread] = None
+        self.status = {"state": "idle"}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> bool:
+        """False si ya hay una copia en curso en este proceso"""
+        if self.running or _backup_lock.locked():
+            return False
+
+        def target():
+            self.status = {"state": "running"}
+            try:
+                self.status = {"state": "finished", **run_backup(self.engine)}
+            except Exception as e:
+                self.status = {"state": "failed", "error": str(e)}
+
+        self._thread = threading.Thread(target=target, name="backup", daemon=True)
+        self._thread.start()
+        return True
+
+
+_job: Optional[BackupJob] = None
+
+
+def get_backup_job() -> BackupJob:
+    global _job
+    if _job is None:
+        from database import engine
+        _job = BackupJob(engine)
+    return _job
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    try:
+        result = run_backup(engine)
+    except BackupError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"✅ {result['name']}: {result['size_bytes']:,} bytes "
+          f"({result['database_bytes']:,} sin comprimir) en {result['duration_seconds']} s")
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark del costo de autenticación por request, con carga real a ritmo fijo
+Levanta la API con uvicorn (BD temporal) y le envía --rps requests/s con --clientes
+conexiones concurrentes a un endpoint autenticado (/users/me/profile), repartidas entre
+los tokens de --usuarios usuarios. Se compara decode_token sin caché (JWT_CACHE_MAX_SIZE=0:
+jose en cada request) contra el caché de tokens verificados.
+La latencia se mide desde el instante programado de cada request (carga de lazo abierto:
+si el servidor se atrasa, la espera cuenta).
+Si el host no sostiene el ritmo, "req/s logradas" queda por debajo del objetivo y las
+latencias son de cola; conviene medir también un ritmo por debajo de la saturación.
+Ejecutar: python backend/benchmarks/bench_auth.py [--rps 100 1000] [--segundos 10] [--clientes 50]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND)
+
+import httpx
+
+SECRETO = "bench-auth-secreto"
+
+
+def preparar_bd(carpeta: str, usuarios: int) -> list[str]:
+    """Crear usuarios en la BD de `carpeta` y devolver un access token por usuario"""
+    os.environ["JWT_SECRET_KEY"] = SECRETO
+    os.chdir(carpeta)  # database.py usa ./data/palettes.db
+    import models_auth
+    from auth import create_user_access_token
+    from database import SessionLocal, engine
+    from password_hashing import pwd_context
+
+    models_auth.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    hashed = pwd_context.hash("Password123")
+    users = [models_auth.User(username=f"bench{i}", email=f"bench{i}@x.com", hashed_password=hashed, role="user")
+             for i in range(usuarios)]
+    db.add_all(users)
+    db.commit()
+    tokens = [create_user_access_token(db, user) for user in users]
+    db.close()
+    engine.dispose()
+    return tokens
+
+
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def levantar_api(carpeta: str, puerto: int, con_cache: bool) -> subprocess.Popen:
+    env = dict(os.environ, JWT_SECRET_KEY=SECRETO, PYTHONPATH=BACKEND, MAINTENANCE_ENABLED="false",
+               JWT_CACHE_MAX_SIZE="50000" if con_cache else "0")
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(puerto), "--log-level", "warning"],
+        cwd=carpeta, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    for _ in range(300):
+        try:
+            httpx.get(f"http://127.0.0.1:{puerto}/health", timeout=1)
+            return proceso
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proceso.kill()
+    raise RuntimeError("La API no arrancó")
+
+
+async def cargar(url: str, tokens: list[str], rps: float, segundos: float, clientes: int) -> dict:
+    """Enviar rps*segundos requests a ritmo fijo; latencias en ms desde el instante programado"""
+    loop = asyncio.get_running_loop()
+    limite = asyncio.Semaphore(clientes)
+    latencias, errores = [], 0
+    rnd = random.Random(42)
+    total = int(rps * segundos)
+    limits = httpx.Limits(max_connections=clientes, max_keepalive_connections=clientes)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        # Calentamiento: conexiones abiertas y cada token visto una vez
+        await asyncio.gather(*(client.get(url, headers={"Authorization": f"Bearer {t}"}) for t in tokens[:clientes]))
+        inicio = loop.time() + 0.1
+
+        async def una(i: int):
+            nonlocal errores
+            programado = inicio + i / rps
+            await asyncio.sleep(max(0.0, programado - loop.time()))
+            async with limite:
+                response = await client.get(url, headers={"Authorization": f"Bearer {rnd.choice(tokens)}"})
+            if response.status_code != 200:
+                errores += 1
+            latencias.append((loop.time() - programado) * 1000)
+
+        await asyncio.gather(*(una(i) for i in range(total)))
+        duracion = loop.time() - inicio
+    cuantiles = statistics.quantiles(latencias, n=100)
+    return {"rps": total / duracion, "p50": cuantiles[49], "p99": cuantiles[98], "errores": errores}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rps", type=float, nargs="+", default=[1000])
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--clientes", type=int, default=50)
+    parser.add_argument("--usuarios", type=int, default=500)
+    args = parser.parse_args()
+
+    carpeta = tempfile.mkdtemp()
+    tokens = preparar_bd(carpeta, args.usuarios)
+
+    print("=" * 76)
+    print(f"AUTENTICACIÓN: {args.clientes} clientes, {args.usuarios} usuarios, {args.segundos:.0f} s por prueba")
+    print("=" * 76)
+    print(f"{'':<12}{'req/s objetivo':>16}{'req/s logradas':>16}{'p50 (ms)':>10}{'p99 (ms)':>10}{'errores':>10}")
+    for rps in args.rps:
+        for nombre, con_cache in (("Sin caché", False), ("Con caché", True)):
+            puerto = puerto_libre()
+            api = levantar_api(carpeta, puerto, con_cache)
+            try:
+                r = asyncio.run(cargar(f"http://127.0.0.1:{puerto}/users/me/profile", tokens,
+                                       rps, args.segundos, args.clientes))
+            finally:
+                api.terminate()
+                api.wait()
+            print(f"{nombre:<12}{rps:>16,.0f}{r['rps']:>16,.0f}{r['p50']:>10.2f}{r['p99']:>10.2f}{r['errores']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la exportación en streaming de paletas
+Mide tiempo y memoria pico (RSS) al exportar todo el historial de un usuario
+Ejecutar: python backend/benchmarks/bench_export.py [--filas 1000000] [--formato ndjson|csv] [--gzip]
+"""
+
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, text
+
+import models_auth  # noqa: F401  (registra las tablas)
+from database import Base
+from palette_export import export_palettes
+
+
+def rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--filas", type=int, default=1_000_000)
+    parser.add_argument("--formato", choices=("ndjson", "csv"), default="ndjson")
+    parser.add_argument("--gzip", action="store_true")
+    args = parser.parse_args()
+
+    ruta = os.path.join(tempfile.mkdtemp(), "bench_export.db")
+    engine = create_engine(f"sqlite:///{ruta}")
+    Base.metadata.create_all(bind=engine)
+    print(f"⏳ Insertando {args.filas:,} paletas...")
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, username, email, hashed_password) VALUES (1, 'u', 'u@x', 'x')"))
+        conn.execute(text(
+            "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :filas) "
+            "INSERT INTO palettes_with_users (input_text, polarity, colors, sentiment_label, "
+            "confidence_score, user_id, created_at) "
+            "SELECT 'texto de prueba número ' || i, '0.500', '[\"#FFD700\",\"#FFA500\",\"#FF8C00\"]', "
+            "'Positivo', '0.8', 1, '2024-01-01 12:00:00' FROM n"
+        ), {"filas": args.filas})
+
+    base = rss_mb()
+    inicio = time.perf_counter()
+    total = 0
+    for trozo in export_palettes(engine, args.formato, user_id=1, compress=args.gzip):
+        total += len(trozo)
+    segundos = time.perf_counter() - inicio
+
+    print("")
+    print(f"✅ {args.filas:,} filas en {segundos:.1f} s ({args.filas / segundos:,.0f} filas/s)")
+    print(f"   Salida: {total / 1e6:.1f} MB ({args.formato}{' + gzip' if args.gzip else ''})")
+    print(f"   RSS pico: {rss_mb():.0f} MB (antes de exportar: {base:.0f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la importación masiva de paletas
+Mide filas por segundo al importar un NDJSON/CSV generado (SQLite en modo WAL)
+Ejecutar: python backend/benchmarks/bench_import.py [--filas 200000] [--formato ndjson|csv] [--lote 5000]
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+import models_auth  # noqa: F401  (registra las tablas)
+import counters, rollups, search  # noqa: F401  (triggers, como en la app)
+from database import Base, set_sqlite_pragmas
+from palette_import import import_palettes
+
+FILA = {
+    "input_text": "texto de prueba número {i}",
+    "polarity": "0.500",
+    "colors": "#ffd700,#ffa500,#ff8c00,#ff7f50,#ff6347",
+    "sentiment_label": "positive",
+    "confidence_score": "0.8",
+    "created_at": "2024-01-01T12:00:00",
+}
+
+
+def generar(filas: int, formato: str) -> bytes:
+    buffer = io.StringIO()
+    if formato == "csv":
+        writer = csv.DictWriter(buffer, fieldnames=list(FILA))
+        writer.writeheader()
+        for i in range(filas):
+            writer.writerow({**FILA, "input_text": FILA["input_text"].format(i=i)})
+    else:
+        for i in range(filas):
+            buffer.write(json.dumps({**FILA, "input_text": FILA["input_text"].format(i=i)}) + "\n")
+    return buffer.getvalue().encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--filas", type=int, default=200_000)
+    parser.add_argument("--formato", choices=("ndjson", "csv"), default="ndjson")
+    parser.add_argument("--lote", type=int, default=None)
+    args = parser.parse_args()
+
+    ruta = os.path.join(tempfile.mkdtemp(), "bench_import.db")
+    engine = create_engine(f"sqlite:///{ruta}")
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, username, email, hashed_password) VALUES (1, 'u', 'u@x', 'x')"))
+    db = sessionmaker(bind=engine)()
+
+    datos = generar(args.filas, args.formato)
+    print(f"⏳ Importando {args.filas:,} filas ({len(datos) / 1e6:.1f} MB {args.formato})...")
+    inicio = time.perf_counter()
+    resultado = import_palettes(db, io.BytesIO(datos), args.formato, "bench", owner_id=1, user_id=1,
+                                batch_size=args.lote)
+    segundos = time.perf_counter() - inicio
+    db.close()
+
+    print("")
+    print(f"✅ {resultado['inserted']:,} filas en {segundos:.2f} s ({resultado['inserted'] / segundos:,.0f} filas/s)")
+    print(f"   Rechazadas: {resultado['rejected']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark de los listados (/gallery, /users)
+- Antes: entidades ORM completas (todas las columnas, identity map e instrumentación)
+  solo para armar dicts pequeños
+- Después: solo las columnas devueltas, como tuplas (main.GALLERY_COLUMNS / USER_LIST_COLUMNS)
+Mide latencia (mediana) y memoria pico (tracemalloc) para páginas de 100 y 10.000 filas.
+Ejecutar: python backend/benchmarks/bench_lists.py
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+import models_auth
+from database import Base
+
+P = models_auth.PaletteWithUser
+U = models_auth.User
+GALLERY_COLUMNS = (P.id, P.input_text, P.colors, P.sentiment_label, P.created_at)
+USER_LIST_COLUMNS = (U.id, U.username, U.email, U.full_name, U.role, U.is_active, U.created_at, U.last_login)
+
+
+def galeria_entidades(db, limite):
+    palettes = db.query(P).order_by(P.created_at.desc()).limit(limite).all()
+    return [{"id": p.id, "input_text": p.input_text, "colors": p.colors, "sentiment_label": p.sentiment_label,
+             "created_at": p.created_at.isoformat() if p.created_at else None} for p in palettes]
+
+
+def galeria_columnas(db, limite):
+    palettes = db.query(*GALLERY_COLUMNS).order_by(P.created_at.desc()).limit(limite).all()
+    return [{"id": i, "input_text": t, "colors": c, "sentiment_label": s,
+             "created_at": d.isoformat() if d else None} for i, t, c, s, d in palettes]
+
+
+def _usuario(u):
+    return {"id": u.id, "username": u.username, "email": u.email, "full_name": u.full_name, "role": u.role,
+            "is_active": u.is_active, "created_at": u.created_at.isoformat() if u.created_at else None,
+            "last_login": u.last_login.isoformat() if u.last_login else None}
+
+
+def usuarios_entidades(db, limite):
+    return [_usuario(u) for u in db.query(U).order_by(U.id).limit(limite).all()]
+
+
+def usuarios_columnas(db, limite):
+    return [_usuario(u) for u in db.query(*USER_LIST_COLUMNS).order_by(U.id).limit(limite).all()]
+
+
+def medir(Session, funcion, limite: int, repeticiones: int) -> tuple[float, float]:
+    """Mediana en ms y pico de memoria en KiB (sesión nueva por repetición, como por request)"""
+    tiempos = []
+    for _ in range(repeticiones):
+        db = Session()
+        inicio = time.perf_counter()
+        funcion(db, limite)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        db.close()
+    db = Session()
+    tracemalloc.start()
+    funcion(db, limite)
+    pico = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    db.close()
+    return statistics.median(tiempos), pico
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--filas", type=int, default=20_000)
+    args = parser.parse_args()
+
+    ruta = os.path.join(tempfile.mkdtemp(), "bench_lists.db")
+    engine = create_engine(f"sqlite:///{ruta}")
+    Base.metadata.create_all(bind=engine)
+    rnd = random.Random(42)
+    print(f"⏳ Insertando {args.filas:,} paletas y usuarios...")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO users (id, username, email, hashed_password, full_name, role, is_active, phone, address) "
+            "VALUES (:i, :n, :e, :h, :f, 'user', 1, :c, :c)"
+        ), [{"i": i, "n": f"usuario{i}", "e": f"gAAAAA{'x' * 120}{i}", "h": "$2b$12$" + "h" * 53,
+             "f": f"Usuario {i}", "c": "gAAAAA" + "y" * 100} for i in range(1, args.filas + 1)])
+        conn.execute(text(
+            "INSERT INTO palettes_with_users (input_text, translated_text, polarity, colors, analysis_method, "
+            "confidence_score, sentiment_label, intensity, emotion_type, user_id, created_at) VALUES "
+            "(:t, :t, '0.420', '#ff8800,#ffd700,#87ceeb,#98fb98,#dda0dd', 'hybrid', '0.8', 'positive', "
+            "'medium', 'alegría', 1, datetime('2024-01-01', :d || ' seconds'))"
+        ), [{"t": f"un día feliz en la playa con amigos {rnd.random()}", "d": str(i)} for i in range(args.filas)])
+    Session = sessionmaker(bind=engine)
+
+    print("")
+    print(f"{'listado':<22}{'filas':>8}{'antes (ms)':>12}{'después (ms)':>14}{'antes (KiB)':>13}{'después (KiB)':>15}")
+    for etiqueta, antes, despues in (("galería", galeria_entidades, galeria_columnas),
+                                     ("usuarios", usuarios_entidades, usuarios_columnas)):
+        for limite in (100, 10_000):
+            repeticiones = 50 if limite == 100 else 5
+            t_antes, m_antes = medir(Session, antes, limite, repeticiones)
+            t_despues, m_despues = medir(Session, despues, limite, repeticiones)
+            print(f"{etiqueta:<22}{limite:>8,}{t_antes:>12.2f}{t_despues:>14.2f}{m_antes:>13,.0f}{m_despues:>15,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark de lecturas bajo carga de escritura
+- Antes: un solo motor; las lecturas (tipo /gallery) esperan conexiones del pool que tienen
+  tomadas las escrituras (tipo /analyze), que a su vez esperan el bloqueo de escritura
+- Después: motor de lectura aparte (mode=ro + query_only, database.create_read_engine)
+Ejecutar: python backend/benchmarks/bench_readwrite.py [--segundos 10] [--escritores 8] [--lectores 4]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, event, text
+
+import models_auth  # noqa: F401  (registra las tablas)
+from database import Base, create_read_engine, set_sqlite_pragmas
+
+POOL = 5
+GALERIA = text("SELECT id, input_text, colors, sentiment_label, created_at FROM palettes_with_users "
+               "WHERE user_id = :u ORDER BY created_at DESC LIMIT 50")
+ANALIZAR = text("INSERT INTO palettes_with_users (input_text, polarity, sentiment_label, colors, user_id, created_at) "
+                "VALUES (:t, '0.3', 'positive', '#ff0000,#00ff00', :u, datetime('now'))")
+
+
+def motor_principal(ruta: str):
+    engine = create_engine(f"sqlite:///{ruta}", connect_args={"check_same_thread": False},
+                           pool_size=POOL, max_overflow=0)
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    return engine
+
+
+def carga(escritura, lectura, segundos: float, escritores: int, lectores: int) -> tuple[list, int]:
+    """Latencias de lectura (ms) y escrituras completadas durante `segundos`"""
+    fin = time.perf_counter() + segundos
+    latencias, escrituras = [], [0]
+    candado = threading.Lock()
+
+    def escribir(n):
+        rnd = random.Random(n)
+        while time.perf_counter() < fin:
+            with escritura.begin() as conn:
+                conn.execute(ANALIZAR, {"t": f"texto {rnd.random()}", "u": rnd.randint(1, 100)})
+                # Trabajo dentro de la transacción (perfil, contadores...)
+                time.sleep(0.002)
+            with candado:
+                escrituras[0] += 1
+
+    def leer(n):
+        rnd = random.Random(1000 + n)
+        propias = []
+        while time.perf_counter() < fin:
+            inicio = time.perf_counter()
+            with lectura.connect() as conn:
+                conn.execute(GALERIA, {"u": rnd.randint(1, 100)}).all()
+            propias.append((time.perf_counter() - inicio) * 1000)
+        with candado:
+            latencias.extend(propias)
+
+    hilos = [threading.Thread(target=escribir, args=(i,)) for i in range(escritores)]
+    hilos += [threading.Thread(target=leer, args=(i,)) for i in range(lectores)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return latencias, escrituras[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--escritores", type=int, default=8)
+    parser.add_argument("--lectores", type=int, default=4)
+    parser.add_argument("--filas", type=int, default=100_000)
+    args = parser.parse_args()
+
+    ruta = os.path.join(tempfile.mkdtemp(), "bench_readwrite.db")
+    principal = motor_principal(ruta)
+    Base.metadata.create_all(bind=principal)
+    rnd = random.Random(42)
+    print(f"⏳ Insertando {args.filas:,} paletas...")
+    with principal.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, username, email, hashed_password) VALUES (:i, :n, :e, 'x')"),
+                     [{"i": i, "n": f"u{i}", "e": f"u{i}@x"} for i in range(1, 101)])
+        conn.execute(ANALIZAR, [{"t": f"texto {i}", "u": rnd.randint(1, 100)} for i in range(args.filas)])
+
+    print(f"\n{args.escritores} escritores, {args.lectores} lectores, pool de {POOL}, {args.segundos:.0f} s")
+    print(f"{'':<22}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'lecturas':>10}{'escrituras':>12}")
+    lectura = create_read_engine(f"sqlite:///{ruta}", pool_size=POOL)
+    for etiqueta, motor_lectura in (("un solo motor", principal), ("motor de lectura", lectura)):
+        latencias, escrituras = carga(principal, motor_lectura, args.segundos, args.escritores, args.lectores)
+        cuantiles = statistics.quantiles(latencias, n=100)
+        print(f"{etiqueta:<22}{cuantiles[49]:>10.2f}{cuantiles[94]:>10.2f}{cuantiles[98]:>10.2f}"
+              f"{len(latencias):>10,}{escrituras:>12,}")
+
+
+if __name__ == "__main__":
+    main()
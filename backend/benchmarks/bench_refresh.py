@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark de CPU de bcrypt: re-login periódico vs. refresh tokens
+Simula una población de usuarios activos durante una jornada:
+- Sin refresh: cada usuario repite POST /token (bcrypt) cada vez que expira su access token
+- Con refresh: un solo login por jornada; las renovaciones usan /token/refresh (SHA-256 + SQLite)
+Los costos unitarios se miden en este host; el total se extrapola a la población.
+Ejecutar: python backend/benchmarks/bench_refresh.py [--usuarios 10000] [--horas 8]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Agregar el directorio backend al path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from password_hashing import pwd_context, BCRYPT_ROUNDS
+from refresh_tokens import issue_refresh_token, rotate_refresh_token
+import models_auth
+
+MUESTRAS_BCRYPT = 5
+MUESTRAS_REFRESH = 1000
+
+
+def costo_bcrypt() -> float:
+    """Segundos de CPU por verificación bcrypt con el costo configurado"""
+    hashed = pwd_context.hash("Password123")
+    inicio = time.process_time()
+    for _ in range(MUESTRAS_BCRYPT):
+        pwd_context.verify("Password123", hashed)
+    return (time.process_time() - inicio) / MUESTRAS_BCRYPT
+
+
+def costo_refresh() -> float:
+    """Segundos de CPU por rotación de refresh token contra SQLite en memoria"""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add(models_auth.User(id=1, username="bench", email="bench@example.com",
+                            hashed_password="x", role="user", is_active=True))
+    tokens = [issue_refresh_token(db, 1) for _ in range(MUESTRAS_REFRESH)]
+    db.commit()
+
+    inicio = time.process_time()
+    for token in tokens:
+        rotate_refresh_token(db, token)
+    costo = (time.process_time() - inicio) / MUESTRAS_REFRESH
+    db.close()
+    return costo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--usuarios", type=int, default=10000)
+    parser.add_argument("--horas", type=float, default=8)
+    parser.add_argument("--access-antes", type=int, default=30, help="minutos de vida sin refresh")
+    parser.add_argument("--access-despues", type=int, default=15, help="minutos de vida con refresh")
+    args = parser.parse_args()
+
+    bcrypt_s = costo_bcrypt()
+    refresh_s = costo_refresh()
+    minutos = args.horas * 60
+
+    logins_antes = args.usuarios * max(1, int(minutos // args.access_antes))
+    logins_despues = args.usuarios
+    refreshes = args.usuarios * max(0, int(minutos // args.access_despues) - 1)
+
+    cpu_antes = logins_antes * bcrypt_s
+    cpu_despues = logins_despues * bcrypt_s + refreshes * refresh_s
+
+    print("=" * 70)
+    print(f"{args.usuarios} usuarios activos durante {args.horas:g} h (BCRYPT_ROUNDS={BCRYPT_ROUNDS})")
+    print("=" * 70)
+    print(f"Costo unitario: bcrypt {bcrypt_s * 1000:.1f} ms CPU | refresh {refresh_s * 1000:.3f} ms CPU")
+    print("")
+    print(f"Sin refresh: {logins_antes:>9,} logins bcrypt          -> {cpu_antes / 3600:7.2f} h CPU")
+    print(f"Con refresh: {logins_despues:>9,} logins + {refreshes:,} refreshes -> {cpu_despues / 3600:7.2f} h CPU")
+    print(f"Reducción de CPU de autenticación: {(1 - cpu_despues / cpu_antes) * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark de búsqueda de texto en paletas
+- Antes: input_text LIKE '%palabra%' (recorrido completo; el índice B-tree no sirve)
+- Después: FTS5 con ranking bm25 y paginación por cursor
+Ejecutar: python backend/benchmarks/bench_search.py [--filas 1000000]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+import models_auth  # noqa: F401  (registra las tablas)
+import search
+from database import Base
+
+PALABRAS = ("feliz triste alegre cielo mar playa lluvia sol noche día amor miedo calma "
+            "enojo sorpresa esperanza nostalgia ciudad campo montaña río viento").split()
+
+
+def medir(funcion, repeticiones: int = 20) -> float:
+    """Mediana en milisegundos"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--filas", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    ruta = os.path.join(tempfile.mkdtemp(), "bench_search.db")
+    engine = create_engine(f"sqlite:///{ruta}")
+    Base.metadata.create_all(bind=engine)
+    rnd = random.Random(42)
+
+    print(f"⏳ Insertando {args.filas:,} paletas...")
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, username, email, hashed_password) VALUES (1, 'u', 'u@x', 'x')"))
+        lote = []
+        for i in range(args.filas):
+            lote.append({"t": " ".join(rnd.choices(PALABRAS, k=6)) + f" n{i}"})
+            if len(lote) == 10_000:
+                conn.execute(text("INSERT INTO palettes_with_users (input_text, polarity, colors, user_id) "
+                                  "VALUES (:t, '0', '[]', 1)"), lote)
+                lote = []
+        if lote:
+            conn.execute(text("INSERT INTO palettes_with_users (input_text, polarity, colors, user_id) "
+                              "VALUES (:t, '0', '[]', 1)"), lote)
+
+    db = sessionmaker(bind=engine)()
+    consulta_rara = f"n{args.filas // 2}"
+    like = lambda palabra: db.execute(text(
+        "SELECT id FROM palettes_with_users WHERE input_text LIKE :q ORDER BY id LIMIT 20"
+    ), {"q": f"%{palabra} %"}).all()
+
+    print("")
+    print(f"{'consulta':<28}{'LIKE (ms)':>12}{'relevancia':>12}{'recientes':>12}")
+    for etiqueta, q in (("término raro", consulta_rara), ("prefijo 'esper*'", "esper*"),
+                        ("dos términos", "feliz playa")):
+        antes = medir(lambda: like(q.rstrip("*").split()[0]), 3)
+        relevancia = medir(lambda: search.search_palettes(db, q, user_id=1, limit=20), 5)
+        recientes = medir(lambda: search.search_palettes(db, q, user_id=1, limit=20, sort="recent"))
+        print(f"{etiqueta:<28}{antes:>12.1f}{relevancia:>12.1f}{recientes:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark de escrituras con paletas particionadas
+Varios procesos (como los workers de uvicorn) guardan paletas como /analyze: INSERT con
+triggers (contadores, búsqueda, agregados) + perfil del usuario, una transacción por paleta.
+Con 1 partición todos compiten por el único escritor de SQLite; con N, por N escritores.
+Ejecutar: python backend/benchmarks/bench_shards.py [--segundos 5] [--procesos 8] [--particiones 1 2 4 8]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import models_auth
+from database import ShardRouter
+from profiles import update_profiles
+
+USUARIOS = 1000
+
+
+def escribir(urls: list, segundos: float, semilla: int, resultado):
+    router = ShardRouter(urls, read_pool_size=1)
+    rnd = random.Random(semilla)
+    fin = time.perf_counter() + segundos
+    n = 0
+    while time.perf_counter() < fin:
+        user_id = rnd.randint(1, USUARIOS)
+        shard = router.shard_for_user(user_id)
+        db = router.session(shard)
+        try:
+            palette = models_auth.PaletteWithUser(
+                input_text=f"un día feliz {rnd.random()}", polarity="0.420", colors="#ff8800,#ffd700,#87ceeb",
+                analysis_method="hybrid", confidence_score="0.8", sentiment_label="positive",
+                intensity="medium", emotion_type="alegría", user_id=user_id,
+            )
+            palette.id = router.next_palette_id(db, shard)
+            db.add(palette)
+            update_profiles(db, [palette])
+            db.commit()
+            n += 1
+        finally:
+            db.close()
+    router.dispose()
+    resultado.put(n)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--segundos", type=float, default=5)
+    parser.add_argument("--procesos", type=int, default=8)
+    parser.add_argument("--particiones", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    print(f"{args.procesos} procesos escritores, {args.segundos:.0f} s por prueba")
+    print(f"{'particiones':<14}{'paletas/s':>12}{'aceleración':>14}")
+    base = None
+    for n in args.particiones:
+        carpeta = tempfile.mkdtemp()
+        urls = [f"sqlite:///{carpeta}/shard{i}.db" for i in range(n)]
+        router = ShardRouter(urls, read_pool_size=1)
+        router.create_all(models_auth.Base.metadata)
+        router.dispose()
+
+        resultado = multiprocessing.Queue()
+        procesos = [multiprocessing.Process(target=escribir, args=(urls, args.segundos, i, resultado))
+                    for i in range(args.procesos)]
+        for proceso in procesos:
+            proceso.start()
+        total = sum(resultado.get() for _ in procesos)
+        for proceso in procesos:
+            proceso.join()
+        por_segundo = total / args.segundos
+        base = base or por_segundo
+        print(f"{n:<14}{por_segundo:>12,.0f}{por_segundo / base:>13.2f}x")
+
+
+if __name__ == "__main__":
+    main()
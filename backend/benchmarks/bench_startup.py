@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark del tiempo de arranque (import main) y del costo de la clave de encriptación
+- Antes: encryption.py derivaba la clave con PBKDF2 (100k iteraciones) al importarse
+- Después: import sin derivación; la clave se deriva en el primer uso y queda en el keyfile
+Cada medición corre en un proceso nuevo, como un worker de uvicorn o una sesión de tests.
+Ejecutar: python backend/benchmarks/bench_startup.py [--repeticiones 5]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+IMPORT_MAIN = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+PRIMER_USO = (
+    "import time; import main; from encryption import encrypt_data; "
+    "t = time.perf_counter(); encrypt_data('x'); print(time.perf_counter() - t)"
+)
+PBKDF2 = (
+    "import time; from encryption import generate_key_from_password; "
+    "t = time.perf_counter(); generate_key_from_password('x'); print(time.perf_counter() - t)"
+)
+
+
+def medir(codigo: str, repeticiones: int, env: dict, antes=None) -> float:
+    """Mediana en segundos de `codigo` ejecutado en procesos nuevos"""
+    tiempos = []
+    for _ in range(repeticiones):
+        if antes:
+            antes()
+        salida = subprocess.run(
+            [sys.executable, "-c", codigo], cwd=BACKEND_DIR, env=env,
+            capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        tiempos.append(float(salida))
+    return statistics.median(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    keyfile = os.path.join(tempfile.mkdtemp(), "keys.json")
+    env = {**os.environ, "ENCRYPTION_KEYFILE": keyfile}
+
+    def borrar_keyfile():
+        if os.path.exists(keyfile):
+            os.remove(keyfile)
+
+    import_main = medir(IMPORT_MAIN, args.repeticiones, env)
+    pbkdf2 = medir(PBKDF2, args.repeticiones, env)
+    primer_uso_frio = medir(PRIMER_USO, args.repeticiones, env, antes=borrar_keyfile)
+    medir(PRIMER_USO, 1, env)  # deja el keyfile creado
+    primer_uso_caliente = medir(PRIMER_USO, args.repeticiones, env)
+
+    print("=" * 60)
+    print(f"ARRANQUE (mediana de {args.repeticiones} procesos)")
+    print("=" * 60)
+    print(f"import main (antes, con PBKDF2 al importar): {(import_main + pbkdf2) * 1000:8.1f} ms")
+    print(f"import main (después, inicialización lazy):  {import_main * 1000:8.1f} ms")
+    print(f"Primer cifrado sin keyfile (PBKDF2):         {primer_uso_frio * 1000:8.1f} ms")
+    print(f"Primer cifrado con keyfile cacheado:         {primer_uso_caliente * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -87,19 +87,9 @@ class AdvancedColorGenerator:
         """
         Genera una paleta de colores avanzada con información detallada
         """
-        # Normalizar clave de sentimiento
-        sentiment_key = sentiment_key.replace(" ", "_").lower()
-        if sentiment_key not in cls.EMOTION_COLOR_MAPS:
-            sentiment_key = "neutral"
-            
-        config = cls.EMOTION_COLOR_MAPS[sentiment_key]
+        config = cls._get_config(sentiment_key)
         confidence_factor = max(0.3, min(1.0, confidence))
-        
-        # Generar paleta según esquema de armonía
-        colors = cls._generate_harmonic_palette(config, confidence_factor, num_colors)
-        
-        # Aplicar variaciones dinámicas basadas en confianza
-        colors = cls._apply_confidence_variations(colors, confidence_factor, config)
+        colors = cls.generate_colors(sentiment_key, confidence, num_colors)
         
         # Información detallada de la paleta
         palette_info = {
@@ -116,6 +106,25 @@ class AdvancedColorGenerator:
         
         return palette_info
     
+    @classmethod
+    def generate_colors(cls, sentiment_key: str, confidence: float,
+                        num_colors: int = 5) -> List[str]:
+        """Solo los colores de la paleta (sin descripción ni significados)"""
+        config = cls._get_config(sentiment_key)
+        confidence_factor = max(0.3, min(1.0, confidence))
+        
+        # Generar paleta según esquema de armonía
+        colors = cls._generate_harmonic_palette(config, confidence_factor, num_colors)
+        
+        # Aplicar variaciones dinámicas basadas en confianza
+        return cls._apply_confidence_variations(colors, confidence_factor, config)
+    
+    @classmethod
+    def _get_config(cls, sentiment_key: str) -> Dict:
+        """Configuración de la emoción (normaliza la clave; desconocida = neutral)"""
+        sentiment_key = sentiment_key.replace(" ", "_").lower()
+        return cls.EMOTION_COLOR_MAPS.get(sentiment_key, cls.EMOTION_COLOR_MAPS["neutral"])
+    
     @classmethod
     def _generate_harmonic_palette(cls, config: Dict, confidence: float, 
                                  num_colors: int) -> List[str]:
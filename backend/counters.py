@@ -0,0 +1,120 @@
+"""
+Contadores incrementales en BD
+Triggers de SQLite mantienen los totales en la misma transacción que cada INSERT/UPDATE/DELETE
+(incluidas las operaciones masivas), así los conteos se leen sin COUNT(*)
+"""
+
+from typing import Optional
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+import models_auth
+from database import Base
+from triggers import NOT_DEFERRED, install_triggers, on_bulk_insert
+
+# Nombres de contadores
+USERS_TOTAL = "users"
+USERS_ACTIVE = "users:active"
+USERS_ROLE_PREFIX = "users:role:"
+PALETTES_TOTAL = "palettes"
+
+_UPSERT = (
+    "INSERT INTO stat_counters (name, value) VALUES ({name}, {delta}) "
+    "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value;"
+)
+
+
+def _upsert(name: str, delta: str) -> str:
+    return _UPSERT.format(name=name, delta=delta)
+
+
+def _role(ref: str) -> str:
+    return f"'{USERS_ROLE_PREFIX}' || coalesce({ref}.role, 'user')"
+
+
+_TRIGGERS = {
+    "trg_counters_users_insert": (
+        "AFTER INSERT ON users",
+        _upsert(f"'{USERS_TOTAL}'", "1")
+        + _upsert(f"'{USERS_ACTIVE}'", "coalesce(NEW.is_active, 0)")
+        + _upsert(_role("NEW"), "1"),
+    ),
+    "trg_counters_users_delete": (
+        "AFTER DELETE ON users",
+        _upsert(f"'{USERS_TOTAL}'", "-1")
+        + _upsert(f"'{USERS_ACTIVE}'", "-coalesce(OLD.is_active, 0)")
+        + _upsert(_role("OLD"), "-1"),
+    ),
+    "trg_counters_users_update": (
+        "AFTER UPDATE OF role, is_active ON users",
+        _upsert(f"'{USERS_ACTIVE}'", "coalesce(NEW.is_active, 0) - coalesce(OLD.is_active, 0)")
+        + _upsert(_role("OLD"), "-1")
+        + _upsert(_role("NEW"), "1"),
+    ),
+    "trg_counters_palettes_insert": (
+        "AFTER INSERT ON palettes_with_users WHEN " + NOT_DEFERRED,
+        _upsert(f"'{PALETTES_TOTAL}'", "1"),
+    ),
+    "trg_counters_palettes_delete": (
+        "AFTER DELETE ON palettes_with_users",
+        _upsert(f"'{PALETTES_TOTAL}'", "-1"),
+    ),
+}
+
+
+def install_counter_triggers(target, connection, **kw):
+    """
+    Hook after_create de la metadata: crea los triggers y, si los contadores están
+    vacíos (BD existente o recién creada), los recalcula una vez desde las tablas
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    install_triggers(connection, _TRIGGERS)
+    if connection.execute(text("SELECT COUNT(*) FROM stat_counters")).scalar() == 0:
+        rebuild_counters(connection)
+
+
+def rebuild_counters(connection):
+    """Recalcular todos los contadores con COUNT(*) (reparación o primera instalación)"""
+    connection.execute(text("DELETE FROM stat_counters"))
+    connection.execute(text(
+        "INSERT INTO stat_counters (name, value) "
+        f"SELECT '{USERS_TOTAL}', COUNT(*) FROM users "
+        f"UNION ALL SELECT '{USERS_ACTIVE}', COUNT(*) FROM users WHERE is_active "
+        f"UNION ALL SELECT '{USERS_ROLE_PREFIX}' || coalesce(role, 'user'), COUNT(*) FROM users "
+        "GROUP BY coalesce(role, 'user') "
+        f"UNION ALL SELECT '{PALETTES_TOTAL}', COUNT(*) FROM palettes_with_users"
+    ))
+
+
+@on_bulk_insert
+def apply_bulk_insert(connection, after_id: int):
+    """Inserción masiva: sumar las paletas nuevas de una vez"""
+    connection.execute(text(_upsert(
+        f"'{PALETTES_TOTAL}'", "(SELECT COUNT(*) FROM palettes_with_users WHERE id > :after_id)"
+    )), {"after_id": after_id})
+
+
+def get_counters(db: Session, prefix: Optional[str] = None) -> dict:
+    """Leer contadores (todos o los que empiezan por un prefijo)"""
+    query = db.query(models_auth.StatCounter.name, models_auth.StatCounter.value)
+    if prefix:
+        query = query.filter(models_auth.StatCounter.name.startswith(prefix, autoescape=True))
+    return {name: value for name, value in query}
+
+
+def user_counts(db: Session) -> dict:
+    """Totales de usuarios: total, activos y por rol"""
+    counters = get_counters(db, "users")
+    return {
+        "total": counters.get(USERS_TOTAL, 0),
+        "active": counters.get(USERS_ACTIVE, 0),
+        "by_role": {
+            name[len(USERS_ROLE_PREFIX):]: value
+            for name, value in counters.items()
+            if name.startswith(USERS_ROLE_PREFIX) and value
+        },
+    }
+
+
+event.listen(Base.metadata, "after_create", install_counter_triggers)
@@ -1,5 +1,8 @@
 import os
-from sqlalchemy import create_engine
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -11,11 +14,172 @@ if not os.path.exists(data_dir):
 # URL de la base de datos
 DATABASE_URL = "sqlite:///./data/palettes.db"
 
+# WAL: las lecturas no bloquean a las escrituras (importaciones y trabajos por lotes)
+SQLITE_WAL = os.getenv("SQLITE_WAL", "true").lower() == "true"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Motor de solo lectura para los GET de consulta. Vacío: la misma BD abierta con mode=ro;
+# "primary": sin separación (todo por el motor principal); otra URL: p. ej. una réplica
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", "")
+DATABASE_READ_POOL_SIZE = int(os.getenv("DATABASE_READ_POOL_SIZE", "10"))
+
+# Particionado opcional de las paletas en N archivos SQLite por hash de user_id (0/1 = sin
+# particionar). Cambiar N requiere redistribuir las filas: se fija al crear la instalación
+PALETTE_SHARDS = int(os.getenv("PALETTE_SHARDS", "0"))
+PALETTE_SHARD_URL = os.getenv("PALETTE_SHARD_URL", "sqlite:///./data/palettes_shard{shard}.db")
+
 engine = create_engine(
     DATABASE_URL, 
     connect_args={"check_same_thread": False}
 )
 
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """PRAGMAs por conexión: WAL con synchronous=NORMAL (sin fsync por commit) y espera ante bloqueos"""
+    cursor = dbapi_connection.cursor()
+    # Solo surte efecto en BD nuevas (o tras un VACUUM): permite PRAGMA incremental_vacuum
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    if SQLITE_WAL:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", set_sqlite_pragmas)
+
+def set_sqlite_read_pragmas(dbapi_connection, connection_record):
+    """PRAGMAs de las conexiones de lectura: query_only además de mode=ro, y la misma espera"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+def create_read_engine(url: str = DATABASE_URL, pool_size: int = DATABASE_READ_POOL_SIZE):
+    """
+    Motor de solo lectura sobre `url`
+
+    Con SQLite abre el mismo archivo en modo URI mode=ro (con WAL, los lectores ven cada
+    commit al instante y no compiten por el bloqueo de escritura). Con otros motores, `url`
+    es la réplica.
+    """
+    if not url.startswith("sqlite:///"):
+        return create_engine(url, pool_size=pool_size, pool_pre_ping=True)
+    path = url[len("sqlite:///"):]
+    read_engine = create_engine(
+        f"sqlite:///file:{path}?mode=ro&uri=true",
+        connect_args={"check_same_thread": False},
+        pool_size=pool_size,
+    )
+    event.listen(read_engine, "connect", set_sqlite_read_pragmas)
+    return read_engine
+
+if DATABASE_READ_URL == "primary":
+    read_engine = engine
+else:
+    read_engine = create_read_engine(DATABASE_READ_URL or DATABASE_URL)
+
+def _begin_immediate(conn):
+    """BEGIN IMMEDIATE: la transacción toma el bloqueo de escritura al empezar (sin BUSY_SNAPSHOT)"""
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+def _autocommit_driver(dbapi_connection, connection_record):
+    # El driver no abre transacciones por su cuenta: las abre _begin_immediate
+    dbapi_connection.isolation_level = None
+
+def create_shard_engine(url: str):
+    """Motor de escritura de una partición (mismos PRAGMAs que la BD principal)"""
+    shard_engine = create_engine(url, connect_args={"check_same_thread": False})
+    event.listen(shard_engine, "connect", set_sqlite_pragmas)
+    event.listen(shard_engine, "connect", _autocommit_driver)
+    event.listen(shard_engine, "begin", _begin_immediate)
+    return shard_engine
+
+class ShardRouter:
+    """
+    Enrutado de paletas entre particiones
+
+    Cada partición es una BD completa (mismo esquema y triggers: contadores, búsqueda,
+    agregados y perfiles se mantienen por partición); los usuarios siguen en la principal.
+    Todas las paletas de un usuario viven en shard_for_user(user_id) y los ids se reparten
+    por residuo (id % N == partición), así que un id basta para saber dónde está la paleta.
+    """
+
+    def __init__(self, urls: list[str], read_pool_size: int = DATABASE_READ_POOL_SIZE):
+        self.count = len(urls)
+        self.urls = urls
+        self.engines = [create_shard_engine(url) for url in urls]
+        self.read_engines = [create_read_engine(url, read_pool_size) for url in urls]
+        self._sessions = [sessionmaker(autocommit=False, autoflush=False, bind=e) for e in self.engines]
+        self._read_sessions = [sessionmaker(autocommit=False, autoflush=False, bind=e) for e in self.read_engines]
+        self._executor = ThreadPoolExecutor(max_workers=self.count, thread_name_prefix="shard")
+
+    def shard_for_user(self, user_id: int) -> int:
+        # crc32 y no hash(): el reparto debe ser el mismo en todos los procesos
+        return zlib.crc32(str(user_id).encode()) % self.count
+
+    def shard_for_palette(self, palette_id: int) -> int:
+        return palette_id % self.count
+
+    def session(self, shard: int):
+        return self._sessions[shard]()
+
+    def read_session(self, shard: int):
+        return self._read_sessions[shard]()
+
+    def next_palette_id(self, db, shard: int) -> int:
+        """Siguiente id de la partición (dentro de su transacción de escritura: BEGIN IMMEDIATE)"""
+        last = db.execute(text("SELECT MAX(id) FROM palettes_with_users")).scalar()
+        return ((last // self.count + 1) if last is not None else 0) * self.count + shard
+
+    def fan_out(self, query: Callable) -> list:
+        """Ejecutar query(session, shard) en todas las particiones en paralelo (solo lectura)"""
+        def run(shard):
+            db = self.read_session(shard)
+            try:
+                return query(db, shard)
+            finally:
+                db.close()
+        return list(self._executor.map(run, range(self.count)))
+
+    def create_all(self, metadata):
+        for shard_engine in self.engines:
+            metadata.create_all(bind=shard_engine)
+
+    def dispose(self):
+        self._executor.shutdown(wait=False)
+        for shard_engine in self.engines + self.read_engines:
+            shard_engine.dispose()
+
+shards: Optional[ShardRouter] = (
+    ShardRouter([PALETTE_SHARD_URL.format(shard=i) for i in range(PALETTE_SHARDS)])
+    if PALETTE_SHARDS > 1 else None
+)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+Base = declarative_base()
+
+def create_missing_indexes(target, connection, **kw):
+    """create_all no agrega índices nuevos a tablas existentes: crearlos aquí"""
+    for table in target.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+event.listen(Base.metadata, "after_create", create_missing_indexes)
+
+def get_db():
+    """Dependencia de FastAPI: sesión de BD por request"""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
 
-Base = declarative_base()
\ No newline at end of file
+def get_read_db():
+    """Dependencia de FastAPI para los GET que solo consultan: sesión del motor de lectura"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
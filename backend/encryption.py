@@ -3,18 +3,46 @@ Sistema de Encriptación para Datos Sensibles
 Cifra/descifra datos personales antes de guardar en BD
 """
 
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.exceptions import InvalidTag
 from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.backends import default_backend
+from sqlalchemy.ext.hybrid import hybrid_property
+from typing import Iterable, Optional
 import base64
+import hashlib
+import json
+import threading
 import os
 
+from logger_config import app_logger
+
 # Obtener clave de encriptación desde variable de entorno
 ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY", "encriptacion-key-32-caracteres-largo").encode()
+# Claves adicionales para rotación: "id:clave_base64url,id:clave_base64url" (ids 1-255, 32 bytes)
+ENCRYPTION_KEYS = os.getenv("ENCRYPTION_KEYS", "")
+# Clave con la que se cifra (por defecto la derivada de ENCRYPTION_KEY, id 0)
+ENCRYPTION_ACTIVE_KEY_ID = int(os.getenv("ENCRYPTION_ACTIVE_KEY_ID", "0"))
+# Caché de la derivación PBKDF2 (evita ~100k iteraciones en cada arranque de worker)
+ENCRYPTION_KEYFILE = os.getenv("ENCRYPTION_KEYFILE", "data/.encryption_keys.json")
+
+# ============================================================================
+# FORMATO DE TEXTO CIFRADO
+# ============================================================================
+# v1: "\x01" + base64url(key_id[1] | nonce[12] | ciphertext | tag[16])  (AES-256-GCM)
+#   - El primer carácter identifica la versión: el texto plano se detecta sin excepciones
+#   - Una sola capa de base64 (~1/3 del tamaño del formato anterior)
+# Legado: base64url(token Fernet), que a su vez ya es base64 -> siempre empieza por
+#   "Z0FBQUFB" (base64 de "gAAAA", la cabecera de Fernet). Se migra al leer.
+FORMAT_V1 = "\x01"
+LEGACY_PREFIX = "Z0FBQUFB"
+NONCE_SIZE = 12
+DEFAULT_KEY_ID = 0
 
 def generate_key_from_password(password: str, salt: bytes = b'salt_') -> bytes:
-    """Generar clave de encriptación desde password"""
+    """Derivar 32 bytes de clave desde un password (PBKDF2-HMAC-SHA256)"""
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
         length=32,
@@ -22,18 +50,121 @@ def generate_key_from_password(password: str, salt: bytes = b'salt_') -> bytes:
         iterations=100000,
         backend=default_backend()
     )
-    key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
+    return kdf.derive(password.encode())
+
+# ============================================================================
+# GESTIÓN DE CLAVES
+# ============================================================================
+
+class KeyRing:
+    """Claves activas indexadas por key id; la activa cifra, todas descifran"""
+
+    def __init__(self, keys: dict, active_id: int):
+        if active_id not in keys:
+            raise ValueError(f"La clave activa {active_id} no está configurada")
+        self.keys = keys
+        self.active_id = active_id
+        self._aeads = {key_id: AESGCM(key) for key_id, key in keys.items()}
+        self._legacy_cipher = None
+
+    def aead(self, key_id: int) -> AESGCM:
+        return self._aeads[key_id]
+
+    @property
+    def legacy_cipher(self) -> Fernet:
+        """Fernet solo para leer el formato legado (misma derivación de siempre, id 0)"""
+        if self._legacy_cipher is None:
+            self._legacy_cipher = Fernet(base64.urlsafe_b64encode(self.keys[DEFAULT_KEY_ID]))
+        return self._legacy_cipher
+
+def _keyfile_entry(passphrase: bytes) -> str:
+    """Índice de la clave derivada en el keyfile (cambia si cambia la passphrase o el salt)"""
+    return hashlib.sha256(b"pbkdf2-sha256:100000:salt_:" + passphrase).hexdigest()[:16]
+
+def _load_cached_key(path: str, entry: str) -> Optional[bytes]:
+    try:
+        with open(path) as f:
+            cached = json.load(f).get(entry)
+        return base64.urlsafe_b64decode(cached) if cached else None
+    except (OSError, ValueError):
+        return None
+
+def _store_cached_key(path: str, entry: str, key: bytes):
+    """Guardar la clave derivada en un archivo solo legible por el dueño (0600)"""
+    try:
+        try:
+            with open(path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = {}
+        cached[entry] = base64.urlsafe_b64encode(key).decode()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(cached, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        app_logger.warning(f"No se pudo guardar el keyfile de encriptación: {e}")
+
+def derive_default_key(passphrase: bytes = ENCRYPTION_KEY, keyfile: str = ENCRYPTION_KEYFILE) -> bytes:
+    """Clave id 0: derivada de ENCRYPTION_KEY una sola vez y cacheada en el keyfile"""
+    entry = _keyfile_entry(passphrase)
+    key = _load_cached_key(keyfile, entry) if keyfile else None
+    if key is None:
+        key = generate_key_from_password(passphrase.decode())
+        if keyfile:
+            _store_cached_key(keyfile, entry, key)
     return key
 
-# Inicializar Fernet con la clave
-try:
-    key = generate_key_from_password(ENCRYPTION_KEY.decode())
-    cipher_suite = Fernet(key)
-except Exception as e:
-    print(f"Error inicializando encriptación: {e}")
-    # Generar una clave temporal para desarrollo
-    key = Fernet.generate_key()
-    cipher_suite = Fernet(key)
+def parse_keys(spec: str) -> dict:
+    """Parsear ENCRYPTION_KEYS ("id:clave_base64url,...")"""
+    keys = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        key_id, _, encoded = item.partition(":")
+        key = base64.urlsafe_b64decode(encoded)
+        if not 1 <= int(key_id) <= 255 or len(key) != 32:
+            raise ValueError(f"Clave de encriptación inválida: id {key_id}")
+        keys[int(key_id)] = key
+    return keys
+
+def build_keyring() -> KeyRing:
+    """Construir el keyring; una configuración de rotación inválida es un error fatal"""
+    try:
+        default_key = derive_default_key()
+    except Exception as e:
+        app_logger.error(f"Error inicializando encriptación: {e}")
+        # Generar una clave temporal para desarrollo
+        default_key = AESGCM.generate_key(bit_length=256)
+    keys = {DEFAULT_KEY_ID: default_key}
+    keys.update(parse_keys(ENCRYPTION_KEYS))
+    return KeyRing(keys, ENCRYPTION_ACTIVE_KEY_ID)
+
+# Inicialización perezosa: importar este módulo no deriva claves
+_keyring: Optional[KeyRing] = None
+_keyring_lock = threading.Lock()
+
+def get_keyring() -> KeyRing:
+    global _keyring
+    if _keyring is None:
+        with _keyring_lock:
+            if _keyring is None:
+                _keyring = build_keyring()
+    return _keyring
+
+def set_keyring(keyring: Optional[KeyRing]):
+    """Reemplazar el keyring (rotación de claves, tests); None fuerza reinicializar"""
+    global _keyring
+    with _keyring_lock:
+        _keyring = keyring
+
+def is_encrypted(value: Optional[str]) -> bool:
+    """Detectar si un valor está cifrado (cualquier formato) sin descifrarlo"""
+    return bool(value) and (value[0] == FORMAT_V1 or value.startswith(LEGACY_PREFIX))
+
+def needs_upgrade(value: Optional[str]) -> bool:
+    """Valor cifrado con el formato legado (Fernet + doble base64)"""
+    return bool(value) and value.startswith(LEGACY_PREFIX)
 
 def encrypt_data(data: str) -> str:
     """
@@ -43,39 +174,122 @@ def encrypt_data(data: str) -> str:
         data: Texto plano a encriptar
     
     Returns:
-        Texto encriptado en base64
+        Texto cifrado en formato v1
     """
     if not data:
         return data
     
-    try:
-        encrypted = cipher_suite.encrypt(data.encode())
-        return base64.urlsafe_b64encode(encrypted).decode()
-    except Exception as e:
-        print(f"Error encriptando datos: {e}")
-        return data
+    keyring = get_keyring()
+    header = bytes([keyring.active_id])
+    nonce = os.urandom(NONCE_SIZE)
+    sealed = keyring.aead(keyring.active_id).encrypt(nonce, data.encode(), FORMAT_V1.encode() + header)
+    return FORMAT_V1 + base64.urlsafe_b64encode(header + nonce + sealed).decode()
+
+def _decrypt_v1(value: str) -> str:
+    blob = base64.urlsafe_b64decode(value[1:])
+    header, nonce, sealed = blob[:1], blob[1:1 + NONCE_SIZE], blob[1 + NONCE_SIZE:]
+    return get_keyring().aead(header[0]).decrypt(nonce, sealed, FORMAT_V1.encode() + header).decode()
+
+def _decrypt_legacy(value: str) -> str:
+    return get_keyring().legacy_cipher.decrypt(base64.urlsafe_b64decode(value.encode())).decode()
+
+def ciphertext_key_id(value: Optional[str]) -> Optional[int]:
+    """Key id de un valor v1 (None si no es v1)"""
+    if not value or value[0] != FORMAT_V1:
+        return None
+    return base64.urlsafe_b64decode(value[1:5])[0]
 
 def decrypt_data(encrypted_data: str) -> str:
     """
     Desencriptar datos sensibles
     
     Args:
-        encrypted_data: Texto encriptado en base64
+        encrypted_data: Texto cifrado (v1 o legado) o texto plano
     
     Returns:
-        Texto plano desencriptado
+        Texto plano (los valores no cifrados se devuelven tal cual)
     """
     if not encrypted_data:
         return encrypted_data
     
+    if encrypted_data[0] == FORMAT_V1:
+        decrypt = _decrypt_v1
+    elif encrypted_data.startswith(LEGACY_PREFIX):
+        decrypt = _decrypt_legacy
+    else:
+        return encrypted_data
+    
     try:
-        decoded = base64.urlsafe_b64decode(encrypted_data.encode())
-        decrypted = cipher_suite.decrypt(decoded)
-        return decrypted.decode()
-    except Exception as e:
-        print(f"Error desencriptando datos: {e}")
+        return decrypt(encrypted_data)
+    except (InvalidTag, InvalidToken, ValueError, KeyError) as e:
+        # Cifrado con otra clave (o con un key id no configurado) o dañado
+        app_logger.error(f"Error desencriptando datos: {type(e).__name__}")
         return encrypted_data
 
+def decrypt_many(values: Iterable[Optional[str]]) -> list:
+    """
+    Desencriptar en lote (p. ej. una página de usuarios)
+    
+    Los valores vacíos o en texto plano se devuelven sin costo de descifrado.
+    """
+    return [decrypt_data(value) if is_encrypted(value) else value for value in values]
+
+def upgrade_ciphertext(value: Optional[str]) -> Optional[str]:
+    """Re-cifrar un valor legado al formato v1 (None si no hace falta)"""
+    if not needs_upgrade(value):
+        return None
+    plaintext = decrypt_data(value)
+    return encrypt_data(plaintext) if plaintext != value else None
+
+def reencrypt_ciphertext(value: Optional[str]) -> Optional[str]:
+    """
+    Re-cifrar con la clave activa un valor cifrado con otra clave o en formato legado
+    
+    A diferencia de decrypt_data, los errores se propagan: nunca se re-cifra un texto
+    que no se pudo descifrar. Devuelve None si el valor ya está al día o no está cifrado.
+    """
+    if not is_encrypted(value) or ciphertext_key_id(value) == get_keyring().active_id:
+        return None
+    plaintext = _decrypt_v1(value) if value[0] == FORMAT_V1 else _decrypt_legacy(value)
+    return encrypt_data(plaintext)
+
+def upgrade_fields(obj, fields: Iterable[str]) -> bool:
+    """Migrar al formato v1 los atributos legados de un objeto (True si cambió alguno)"""
+    changed = False
+    for field in fields:
+        upgraded = upgrade_ciphertext(getattr(obj, field))
+        if upgraded is not None:
+            setattr(obj, field, upgraded)
+            changed = True
+    return changed
+
+def encrypted_property(column_attr: str) -> hybrid_property:
+    """
+    Atributo de modelo que cifra al asignar y descifra perezosamente al leer
+    
+    El texto plano se memoiza por instancia junto al cifrado del que salió: un refresh
+    o un cambio de la columna invalida la memo. A nivel de clase devuelve la columna cifrada.
+    """
+    memo_key = f"_{column_attr}_plaintext"
+
+    def fget(self):
+        ciphertext = getattr(self, column_attr)
+        if not ciphertext:
+            return ciphertext
+        memo = self.__dict__.get(memo_key)
+        if memo is not None and memo[0] == ciphertext:
+            return memo[1]
+        plaintext = decrypt_data(ciphertext)
+        self.__dict__[memo_key] = (ciphertext, plaintext)
+        return plaintext
+
+    def fset(self, value):
+        ciphertext = encrypt_data(value) if value else value
+        setattr(self, column_attr, ciphertext)
+        self.__dict__[memo_key] = (ciphertext, value)
+
+    return hybrid_property(fget, fset, expr=lambda cls: getattr(cls, column_attr))
+
 def encrypt_dict(data: dict, fields_to_encrypt: list) -> dict:
     """
     Encriptar campos específicos de un diccionario
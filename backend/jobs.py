@@ -0,0 +1,67 @@
+"""
+Utilidades para trabajos por lotes
+Checkpoints reanudables en BD y limitación de ritmo para no competir con el tráfico en vivo
+"""
+
+from typing import Optional
+from sqlalchemy.orm import Session
+import json
+import time
+
+import models_auth
+
+
+class RateLimiter:
+    """Limita filas por segundo durmiendo entre lotes (0 = sin límite)"""
+
+    def __init__(self, rows_per_second: float):
+        self.rows_per_second = rows_per_second
+        self._started = time.monotonic()
+        self._rows = 0
+
+    def throttle(self, rows: int):
+        self._rows += rows
+        if self.rows_per_second <= 0:
+            return
+        expected = self._rows / self.rows_per_second
+        elapsed = time.monotonic() - self._started
+        if expected > elapsed:
+            time.sleep(expected - elapsed)
+
+
+def load_checkpoint(db: Session, name: str, params: Optional[dict] = None) -> models_auth.JobCheckpoint:
+    """
+    Obtener el checkpoint de un trabajo (creándolo si no existe)
+
+    Si los parámetros cambiaron (p. ej. otra clave destino), el trabajo empieza de cero.
+    """
+    encoded = json.dumps(params or {}, sort_keys=True)
+    checkpoint = db.get(models_auth.JobCheckpoint, name)
+    if checkpoint is None:
+        checkpoint = models_auth.JobCheckpoint(name=name, last_id=0, processed=0,
+                                               params=encoded, finished=False,
+                                               updated_at=time.time())
+        db.add(checkpoint)
+        db.commit()
+    elif checkpoint.params != encoded:
+        reset_checkpoint(db, checkpoint, params)
+    return checkpoint
+
+
+def save_checkpoint(db: Session, checkpoint: models_auth.JobCheckpoint, last_id: int,
+                    processed: int, finished: bool = False):
+    """Avanzar el checkpoint (se confirma junto con el lote en el mismo commit)"""
+    checkpoint.last_id = last_id
+    checkpoint.processed += processed
+    checkpoint.finished = finished
+    checkpoint.updated_at = time.time()
+
+
+def reset_checkpoint(db: Session, checkpoint: models_auth.JobCheckpoint, params: Optional[dict] = None):
+    """Reiniciar un trabajo desde el principio"""
+    checkpoint.last_id = 0
+    checkpoint.processed = 0
+    checkpoint.finished = False
+    checkpoint.params = json.dumps(params or {}, sort_keys=True)
+    checkpoint.updated_at = time.time()
+    db.commit()
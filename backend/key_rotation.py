@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Rotación de claves: re-encriptación en línea de los datos personales de usuarios
+
+Procedimiento:
+  1. Añadir la clave nueva a ENCRYPTION_KEYS en todos los workers (siguen cifrando con la vieja)
+  2. Cambiar ENCRYPTION_ACTIVE_KEY_ID a la nueva y reiniciar los workers
+  3. Ejecutar este trabajo: python backend/key_rotation.py  (o POST /admin/reencrypt)
+  4. Al terminar, la clave vieja puede quitarse de ENCRYPTION_KEYS
+
+Recorre `users` por lotes en orden de id (keyset), confirma cada lote junto con su
+checkpoint (se reanuda donde quedó) y limita filas por segundo para no competir con el tráfico.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from sqlalchemy import bindparam, func, update
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import InvalidToken
+import threading
+import time
+import sys
+import os
+
+# Agregar el directorio backend al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+import models_auth
+from encryption import get_keyring, reencrypt_ciphertext
+from jobs import RateLimiter, load_checkpoint, reset_checkpoint, save_checkpoint
+from logger_config import app_logger
+from metrics import record_reencryption_chunk
+
+REENCRYPT_CHUNK_SIZE = int(os.getenv("REENCRYPT_CHUNK_SIZE", "500"))
+REENCRYPT_WORKERS = int(os.getenv("REENCRYPT_WORKERS", str(min(4, os.cpu_count() or 1))))
+REENCRYPT_MAX_ROWS_PER_SECOND = float(os.getenv("REENCRYPT_MAX_ROWS_PER_SECOND", "1000"))
+
+JOB_NAME = "reencrypt_users"
+_users = models_auth.User.__table__
+
+# UPDATE condicional: si el tráfico en vivo cambió la fila entre la lectura y la escritura,
+# el valor nuevo ya fue cifrado con la clave activa y no se pisa
+_update_row = update(_users).where(
+    _users.c.id == bindparam("b_id"),
+    _users.c.phone.is_not_distinct_from(bindparam("b_phone")),
+    _users.c.address.is_not_distinct_from(bindparam("b_address")),
+).values(phone=bindparam("n_phone"), address=bindparam("n_address"))
+
+
+def _reencrypt_row(row) -> tuple[Optional[dict], bool]:
+    """(parámetros del UPDATE o None si la fila ya está al día, falló)"""
+    try:
+        phone = reencrypt_ciphertext(row.phone)
+        address = reencrypt_ciphertext(row.address)
+    except (InvalidTag, InvalidToken, ValueError, KeyError) as e:
+        app_logger.error(f"Re-encriptación: no se pudo descifrar el usuario {row.id}: {type(e).__name__}")
+        return None, True
+    if phone is None and address is None:
+        return None, False
+    return {
+        "b_id": row.id, "b_phone": row.phone, "b_address": row.address,
+        "n_phone": phone if phone is not None else row.phone,
+        "n_address": address if address is not None else row.address,
+    }, False
+
+
+class ReencryptionJob:
+    """Trabajo reanudable; una sola ejecución a la vez por proceso"""
+
+    def __init__(self, session_factory, chunk_size: int = REENCRYPT_CHUNK_SIZE,
+                 workers: int = REENCRYPT_WORKERS,
+                 max_rows_per_second: float = REENCRYPT_MAX_ROWS_PER_SECOND):
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.max_rows_per_second = max_rows_per_second
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.status = {"state": "idle"}
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def run(self, restart: bool = False) -> dict:
+        """Ejecutar hasta terminar (o hasta stop()); devuelve el estado final"""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("La re-encriptación ya está en curso")
+        try:
+            self._stop.clear()
+            self._run(restart)
+        except Exception as e:
+            self.status["state"] = "failed"
+            self.status["error"] = str(e)
+            app_logger.error(f"Re-encriptación fallida: {e}")
+            raise
+        finally:
+            self._lock.release()
+        return dict(self.status)
+
+    def start(self, restart: bool = False) -> bool:
+        """Ejecutar en un hilo de fondo (False si ya hay una ejecución en curso)"""
+        if self.running:
+            return False
+
+        def target():
+            try:
+                self.run(restart)
+            except Exception:
+                pass  # ya registrado en el estado
+
+        self._thread = threading.Thread(target=target, name="reencrypt", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """Detener tras el lote en curso (el checkpoint permite reanudar)"""
+        self._stop.set()
+
+    def _run(self, restart: bool):
+        target_key_id = get_keyring().active_id
+        db = self.session_factory()
+        try:
+            checkpoint = load_checkpoint(db, JOB_NAME, {"target_key_id": target_key_id})
+            if restart:
+                reset_checkpoint(db, checkpoint, {"target_key_id": target_key_id})
+
+            remaining = db.query(func.count(models_auth.User.id)).filter(
+                models_auth.User.id > checkpoint.last_id
+            ).scalar()
+            total = checkpoint.processed + remaining
+            started = time.monotonic()
+            processed = updated = failed = 0
+            self.status = {
+                "state": "running", "target_key_id": target_key_id,
+                "last_id": checkpoint.last_id, "processed": checkpoint.processed,
+                "total": total, "updated": 0, "failed": 0, "rows_per_second": 0.0,
+            }
+            if checkpoint.finished:
+                self.status["state"] = "finished"
+                return
+
+            limiter = RateLimiter(self.max_rows_per_second)
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="reencrypt") as pool:
+                while not self._stop.is_set():
+                    rows = db.query(
+                        _users.c.id, _users.c.phone, _users.c.address
+                    ).filter(
+                        _users.c.id > checkpoint.last_id
+                    ).order_by(_users.c.id).limit(self.chunk_size).all()
+                    if not rows:
+                        save_checkpoint(db, checkpoint, checkpoint.last_id, 0, finished=True)
+                        db.commit()
+                        self.status["state"] = "finished"
+                        break
+
+                    results = list(pool.map(_reencrypt_row, rows))
+                    params = [p for p, _ in results if p is not None]
+                    chunk_failed = sum(1 for _, error in results if error)
+                    if params:
+                        db.execute(_update_row, params)
+                    # El lote y su checkpoint se confirman juntos
+                    save_checkpoint(db, checkpoint, rows[-1].id, len(rows))
+                    db.commit()
+
+                    processed += len(rows)
+                    updated += len(params)
+                    failed += chunk_failed
+                    rate = processed / max(time.monotonic() - started, 1e-9)
+                    self.status.update(
+                        last_id=checkpoint.last_id, processed=checkpoint.processed,
+                        updated=updated, failed=failed, rows_per_second=round(rate, 1),
+                    )
+                    record_reencryption_chunk(
+                        len(params), len(rows) - len(params) - chunk_failed, chunk_failed,
+                        checkpoint.processed / total if total else 1.0, rate, checkpoint.last_id,
+                    )
+                    limiter.throttle(len(rows))
+                else:
+                    self.status["state"] = "stopped"
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        app_logger.info(
+            f"Re-encriptación {self.status['state']}: {updated} actualizados, "
+            f"{failed} con error, hasta id {self.status['last_id']}"
+        )
+
+
+_job: Optional[ReencryptionJob] = None
+
+
+def get_reencryption_job() -> ReencryptionJob:
+    """Trabajo global del proceso (lo usa el endpoint de administración)"""
+    global _job
+    if _job is None:
+        from database import SessionLocal
+        _job = ReencryptionJob(SessionLocal)
+    return _job
+
+
+if __name__ == "__main__":
+    import argparse
+    from database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Re-encriptar teléfono y dirección con la clave activa")
+    parser.add_argument("--lote", type=int, default=REENCRYPT_CHUNK_SIZE, help="Filas por lote")
+    parser.add_argument("--hilos", type=int, default=REENCRYPT_WORKERS)
+    parser.add_argument("--filas-por-segundo", type=float, default=REENCRYPT_MAX_ROWS_PER_SECOND,
+                        help="Límite de ritmo (0 = sin límite)")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignorar el checkpoint y empezar de cero")
+    args = parser.parse_args()
+
+    models_auth.Base.metadata.create_all(bind=engine)
+    job = ReencryptionJob(SessionLocal, args.lote, args.hilos, args.filas_por_segundo)
+    print(f"🔐 Re-encriptando con la clave {get_keyring().active_id}...")
+    try:
+        status = job.run(restart=args.reiniciar)
+    except KeyboardInterrupt:
+        print("\n⏸️  Interrumpido: se reanudará desde el último lote confirmado")
+        sys.exit(1)
+    print(f"✅ {status['state']}: {status['updated']} actualizados, {status['failed']} con error "
+          f"({status['processed']}/{status['total']} filas, {status['rows_per_second']} filas/s)")
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Migración de la tabla heredada `palettes` a `palettes_with_users`
+
+Procedimiento:
+  1. python backend/legacy_migration.py --propietario admin
+     Copia las filas por lotes en orden de id (INSERT ... SELECT). Cada lote se confirma
+     junto con su checkpoint: si se interrumpe, vuelve a ejecutarse y sigue donde quedó.
+  2. python backend/legacy_migration.py --archivar data/palettes_legacy.csv.gz
+     Guarda una copia de la tabla heredada y la elimina (solo si la migración terminó).
+
+La tabla heredada ya no se crea al arrancar; se lee por reflexión, con una MetaData propia,
+para que ningún create_all la vuelva a crear.
+"""
+
+from typing import Optional
+from sqlalchemy import MetaData, String, Table, cast, func, insert, inspect, literal, select
+from sqlalchemy.engine import Engine
+import csv
+import gzip
+import json
+import threading
+import sys
+import os
+
+# Agregar el directorio backend al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+import models_auth
+from jobs import RateLimiter, load_checkpoint, reset_checkpoint, save_checkpoint
+from logger_config import app_logger
+from profiles import rebuild_profiles
+
+LEGACY_CHUNK_SIZE = int(os.getenv("LEGACY_MIGRATION_CHUNK_SIZE", "1000"))
+LEGACY_MAX_ROWS_PER_SECOND = float(os.getenv("LEGACY_MIGRATION_MAX_ROWS_PER_SECOND", "5000"))
+
+JOB_NAME = "migrate_legacy_palettes"
+LEGACY_TABLE = "palettes"
+_palettes = models_auth.PaletteWithUser.__table__
+
+# Columnas que se copian tal cual (confidence_score era Float y ahora es texto)
+_COPIED = (
+    "input_text", "translated_text", "polarity", "colors", "created_at",
+    "analysis_method", "sentiment_label", "intensity", "emotion_type",
+)
+
+
+class LegacyMigrationError(RuntimeError):
+    """La migración o el archivado no pueden continuar"""
+
+
+def legacy_table(engine: Engine) -> Optional[Table]:
+    """Tabla heredada por reflexión (None si ya no existe)"""
+    if not inspect(engine).has_table(LEGACY_TABLE):
+        return None
+    return Table(LEGACY_TABLE, MetaData(), autoload_with=engine)
+
+
+def _copy_chunk(legacy: Table, owner_id: int, after_id: int, upper_id: int):
+    """INSERT ... SELECT de las filas heredadas con id en (after_id, upper_id]"""
+    source = select(
+        *(legacy.c[name] for name in _COPIED),
+        cast(legacy.c.confidence_score, String),
+        literal(owner_id),
+    ).where(legacy.c.id > after_id, legacy.c.id <= upper_id).order_by(legacy.c.id)
+    return insert(_palettes).from_select([*_COPIED, "confidence_score", "user_id"], source)
+
+
+def migrate_legacy_palettes(session_factory, owner_id: int, chunk_size: int = LEGACY_CHUNK_SIZE,
+                            max_rows_per_second: float = LEGACY_MAX_ROWS_PER_SECOND,
+                            restart: bool = False, stop: Optional[threading.Event] = None) -> dict:
+    """
+    Copiar la tabla heredada bajo un propietario, por lotes y de forma reanudable
+
+    Args:
+        owner_id: Usuario dueño de las paletas migradas
+        max_rows_per_second: Límite de ritmo para no bloquear al tráfico en vivo (0 = sin límite)
+        restart: Ignorar el checkpoint (vuelve a copiar todo: solo tras limpiar lo ya migrado)
+        stop: Evento para detener la migración tras el lote en curso
+
+    Returns:
+        Estado: state (finished/stopped), migrated, last_id, total
+    """
+    db = session_factory()
+    try:
+        legacy = legacy_table(db.get_bind())
+        if legacy is None:
+            return {"state": "finished", "migrated": 0, "last_id": 0, "total": 0}
+        if db.get(models_auth.User, owner_id) is None:
+            raise LegacyMigrationError(f"El propietario {owner_id} no existe")
+
+        params = {"owner_id": owner_id}
+        existing = db.get(models_auth.JobCheckpoint, JOB_NAME)
+        if (existing is not None and existing.processed and not restart
+                and existing.params != json.dumps(params, sort_keys=True)):
+            # Cambiar de propietario a mitad de camino duplicaría las filas ya copiadas
+            raise LegacyMigrationError("La migración ya empezó con otro propietario")
+        checkpoint = load_checkpoint(db, JOB_NAME, params)
+        if restart:
+            reset_checkpoint(db, checkpoint, params)
+
+        total = db.query(func.count()).select_from(legacy).scalar()
+        limiter = RateLimiter(max_rows_per_second)
+        state = "finished"
+        finished_now = False
+        while not checkpoint.finished:
+            if stop is not None and stop.is_set():
+                state = "stopped"
+                break
+            # Límite superior del lote por keyset: el INSERT ... SELECT copia un rango de ids
+            chunk = select(legacy.c.id).where(
+                legacy.c.id > checkpoint.last_id
+            ).order_by(legacy.c.id).limit(chunk_size).subquery()
+            upper_id = db.execute(select(func.max(chunk.c.id))).scalar()
+            if upper_id is None:
+                save_checkpoint(db, checkpoint, checkpoint.last_id, 0, finished=True)
+                db.commit()
+                finished_now = True
+                break
+            copied = db.execute(_copy_chunk(legacy, owner_id, checkpoint.last_id, upper_id)).rowcount
+            # El lote y su checkpoint se confirman juntos
+            save_checkpoint(db, checkpoint, upper_id, copied)
+            db.commit()
+            limiter.throttle(copied)
+
+        status = {"state": state, "migrated": checkpoint.processed,
+                  "last_id": checkpoint.last_id, "total": total}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    if finished_now:
+        # INSERT ... SELECT no pasa por los perfiles: recalcular el del propietario
+        rebuild_profiles(session_factory, [owner_id])
+    app_logger.info(f"Migración de paletas heredadas {state}: {status['migrated']}/{total} filas")
+    return status
+
+
+def archive_legacy_table(session_factory, path: str) -> int:
+    """
+    Guardar la tabla heredada en un CSV comprimido y eliminarla
+
+    Solo procede si la migración terminó y no quedan filas posteriores al checkpoint.
+    Devuelve las filas archivadas.
+    """
+    db = session_factory()
+    try:
+        engine = db.get_bind()
+        legacy = legacy_table(engine)
+        if legacy is None:
+            return 0
+        checkpoint = db.get(models_auth.JobCheckpoint, JOB_NAME)
+        if checkpoint is None or not checkpoint.finished:
+            raise LegacyMigrationError("La migración no ha terminado")
+        pending = db.query(func.count()).select_from(legacy).filter(
+            legacy.c.id > checkpoint.last_id
+        ).scalar()
+        if pending:
+            raise LegacyMigrationError(f"Hay {pending} filas heredadas sin migrar")
+    finally:
+        db.close()
+
+    archived = 0
+    with engine.connect() as conn, gzip.open(path, "wt", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(legacy.c.keys())
+        result = conn.execution_options(stream_results=True, yield_per=LEGACY_CHUNK_SIZE).execute(
+            select(legacy).order_by(legacy.c.id)
+        )
+        for partition in result.partitions():
+            writer.writerows(partition)
+            archived += len(partition)
+    with engine.begin() as conn:
+        legacy.drop(conn)
+    app_logger.info(f"Tabla heredada archivada en {path} ({archived} filas) y eliminada")
+    return archived
+
+
+if __name__ == "__main__":
+    import argparse
+    import signal
+    from database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Migrar la tabla heredada palettes a palettes_with_users")
+    parser.add_argument("--propietario", help="Usuario (nombre) dueño de las paletas migradas")
+    parser.add_argument("--lote", type=int, default=LEGACY_CHUNK_SIZE, help="Filas por lote")
+    parser.add_argument("--filas-por-segundo", type=float, default=LEGACY_MAX_ROWS_PER_SECOND,
+                        help="Límite de ritmo (0 = sin límite)")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignorar el checkpoint y empezar de cero")
+    parser.add_argument("--archivar", metavar="RUTA.csv.gz",
+                        help="Tras migrar: guardar la tabla heredada en RUTA y eliminarla")
+    args = parser.parse_args()
+
+    models_auth.Base.metadata.create_all(bind=engine)
+    try:
+        if args.archivar:
+            filas = archive_legacy_table(SessionLocal, args.archivar)
+            print(f"✅ {filas} filas archivadas en {args.archivar}; tabla '{LEGACY_TABLE}' eliminada")
+            sys.exit(0)
+        if not args.propietario:
+            parser.error("--propietario es obligatorio para migrar")
+        db = SessionLocal()
+        owner = db.query(models_auth.User).filter(models_auth.User.username == args.propietario).first()
+        db.close()
+        if owner is None:
+            print(f"❌ No existe el usuario {args.propietario}")
+            sys.exit(1)
+
+        stop = threading.Event()
+        signal.signal(signal.SIGINT, lambda *_: stop.set())
+        print(f"📦 Migrando paletas heredadas a {owner.username} (id {owner.id})...")
+        status = migrate_legacy_palettes(SessionLocal, owner.id, args.lote, args.filas_por_segundo,
+                                         restart=args.reiniciar, stop=stop)
+    except LegacyMigrationError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    if status["state"] == "stopped":
+        print(f"⏸️  Detenida en el id {status['last_id']}: se reanudará desde ahí")
+        sys.exit(1)
+    print(f"✅ {status['migrated']}/{status['total']} filas migradas")
@@ -1,45 +1,70 @@
-from fastapi import FastAPI, Depends, HTTPException, Request, status
+from fastapi import FastAPI, Depends, File, HTTPException, Query, Request, UploadFile, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
-from fastapi.security import OAuth2PasswordRequestForm
+from fastapi.responses import Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, validator
-from textblob import TextBlob
-from deep_translator import GoogleTranslator
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-import numpy as np
-import colorsys
 from typing import Optional
+from itertools import islice
+import heapq
 import time
 from contextlib import asynccontextmanager
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import uuid
 import os
 
 # Importar sistema de logging y métricas
 from logger_config import app_logger, event_logger
 from metrics import (
     record_palette_created, record_palette_deleted, record_api_request,
-    record_error, record_translation, update_system_metrics, 
+    record_error, update_system_metrics, 
     update_database_metrics, set_app_info, metrics_exporter
 )
 
 # Importar autenticación y encriptación
 from auth import (
-    get_password_hash, verify_password, create_access_token,
+    get_password_hash, get_password_hash_async, verify_password_and_update_async,
+    create_user_access_token, refresh_user_permissions, load_user_mask,
     get_current_user, get_current_active_user, get_current_admin,
-    require_permission, UserRole
+    get_current_db_user, invalidate_cached_user, CachedUser, check_permission,
+    require_permission, UserRole, oauth2_scheme, revoke_token, revoke_user_tokens,
+    ACCESS_TOKEN_EXPIRE_MINUTES
+)
+from revocation import revocation_list
+from policy import ROLE_PERMISSIONS, PERMISSION_BITS, mask_permissions
+from encryption import decrypt_many, upgrade_fields
+from schemas import UserCreate, UserResponse, Token, RefreshRequest
+from key_rotation import get_reencryption_job
+from refresh_tokens import (
+    issue_refresh_token, rotate_refresh_token, revoke_refresh_token, prune_refresh_tokens
 )
-from encryption import encrypt_data, decrypt_data
-from schemas import UserCreate, UserResponse, Token, PasswordChange
 
-import models
 import models_auth
-from database import SessionLocal, engine
-from color_generator import AdvancedColorGenerator
+from counters import user_counts, get_counters, USERS_TOTAL, PALETTES_TOTAL
+from search import search_palettes, InvalidSearchQuery
+from rollups import sentiment_series, check_range, backfill_pending, GLOBAL_USER_ID
+from palette_export import export_palettes, EXPORT_FORMATS
+from palette_import import import_palettes, import_status, InvalidImport
+from palette_admin import palette_filter_conditions, bulk_delete_palettes
+from profiles import get_profile, update_profiles
+from retention import archived_page, get_archive_engine, get_archive_job
+from maintenance import get_maintenance_scheduler, load_monitor
+from backup import get_backup_job, list_backups
+from user_admin import (
+    user_filter_conditions, select_user_ids, bulk_set_role, bulk_set_status, bulk_delete
+)
+from database import SessionLocal, engine, get_db, get_read_db, shards
+from sentiment import (
+    translate_text, score_text, get_enhanced_sentiment, generate_advanced_colors,
+    generate_dynamic_palette
+)
 
-# Crear tablas
-models.Base.metadata.create_all(bind=engine)
+# Crear tablas (la tabla heredada `palettes` ya no se crea: ver legacy_migration.py)
 models_auth.Base.metadata.create_all(bind=engine)
+if shards is not None:
+    shards.create_all(models_auth.Base.metadata)
 
 # Configurar información de la aplicación
 set_app_info(version="2.0.0", python_version="3.12")
@@ -60,6 +85,19 @@ async def lifespan(app: FastAPI):
     
     update_system_metrics()
     
+    # Cargar tokens revocados vigentes y sincronizar con otros workers
+    db = SessionLocal()
+    try:
+        revocation_list.load(db)
+        app_logger.info("✅ Lista de revocación cargada")
+    except Exception as e:
+        app_logger.error(f"⚠️ Error cargando revocaciones: {e}")
+    finally:
+        db.close()
+    revocation_list.start_background_sync(SessionLocal, extra_prune=[prune_refresh_tokens])
+    # ANALYZE, optimize, vacuum incremental y checkpoints del WAL en ventanas de poca carga
+    get_maintenance_scheduler().start()
+    
     # Crear usuario admin por defecto
     db = SessionLocal()
     try:
@@ -77,8 +115,8 @@ async def lifespan(app: FastAPI):
                 hashed_password=get_password_hash(admin_password),
                 full_name="Administrador del Sistema",
                 role=UserRole.ADMIN,
-                phone=encrypt_data("555-0000"),  # ← ENCRIPTADO
-                address=encrypt_data("Oficina Central")  # ← ENCRIPTADO
+                phone="555-0000",  # ← se encripta al asignar
+                address="Oficina Central"
             )
             db.add(admin_user)
             db.commit()
@@ -94,6 +132,8 @@ async def lifespan(app: FastAPI):
     yield
     
     # ========== SHUTDOWN ==========
+    revocation_list.stop_background_sync()
+    get_maintenance_scheduler().stop()
     app_logger.info("👋 Cerrando aplicación")
 
 app = FastAPI(
@@ -119,6 +159,7 @@ async def log_requests(request: Request, call_next):
     endpoint = request.url.path
     method = request.method
     client_ip = request.client.host if request.client else "unknown"
+    load_monitor.record()
     
     app_logger.info(f"📥 {method} {endpoint} desde {client_ip}")
     
@@ -136,9 +177,6 @@ async def log_requests(request: Request, call_next):
         record_error("request_processing", "error")
         raise
 
-# Analizadores
-vader_analyzer = SentimentIntensityAnalyzer()
-
 # Modelos Pydantic
 class TextInput(BaseModel):
     text: str
@@ -165,132 +203,89 @@ class AnalysisResponse(BaseModel):
     intensity: str
     emotion_details: dict
 
-ENHANCED_PALETTES = {
-    "very_positive": {"emotion": "Alegría intensa", "description": "Colores vibrantes"},
-    "positive": {"emotion": "Optimismo", "description": "Colores cálidos"},
-    "slightly_positive": {"emotion": "Satisfacción", "description": "Colores suaves"},
-    "neutral": {"emotion": "Equilibrio", "description": "Colores balanceados"},
-    "slightly_negative": {"emotion": "Melancolía", "description": "Tonos grises"},
-    "negative": {"emotion": "Tristeza", "description": "Colores oscuros"},
-    "very_negative": {"emotion": "Angustia", "description": "Colores intensos oscuros"}
-}
-
-def get_db():
-    db = SessionLocal()
-    try:
+# ============================================================================
+# PARTICIONES DE PALETAS (PALETTE_SHARDS)
+# ============================================================================
+
+def get_palette_db(db_user: CachedUser = Depends(get_current_db_user), db: Session = Depends(get_db)):
+    """Sesión de escritura donde viven las paletas del usuario (su partición, si las hay)"""
+    if shards is None:
         yield db
+        return
+    shard_db = shards.session(shards.shard_for_user(db_user.id))
+    try:
+        yield shard_db
     finally:
-        db.close()
+        shard_db.close()
 
-# Funciones auxiliares
-def translate_text(text: str, target_lang: str = 'en') -> str:
+def get_palette_read_db(db_user: CachedUser = Depends(get_current_db_user), db: Session = Depends(get_read_db)):
+    """Como get_palette_db, para consultas (motor de solo lectura)"""
+    if shards is None:
+        yield db
+        return
+    shard_db = shards.read_session(shards.shard_for_user(db_user.id))
     try:
-        translated = GoogleTranslator(source='auto', target=target_lang).translate(text)
-        record_translation("auto", target_lang)
-        return translated if translated else text
-    except Exception as e:
-        app_logger.warning(f"⚠️ Error traducción: {e}")
-        return text
-
-def analyze_with_textblob(text: str) -> tuple[float, float]:
-    blob = TextBlob(text)
-    return blob.sentiment.polarity, blob.sentiment.subjectivity
-
-def analyze_with_vader(text: str) -> tuple[float, dict]:
-    scores = vader_analyzer.polarity_scores(text)
-    return scores['compound'], scores
-
-def hybrid_analysis(text: str) -> tuple[float, float, dict]:
-    tb_polarity, tb_subjectivity = analyze_with_textblob(text)
-    vader_polarity, vader_scores = analyze_with_vader(text)
-    combined_polarity = (vader_polarity * 0.6) + (tb_polarity * 0.4)
-    agreement = 1 - abs(tb_polarity - vader_polarity) / 2
-    confidence = max(0.3, agreement)
-    
-    analysis_details = {
-        "textblob_polarity": round(tb_polarity, 3),
-        "vader_compound": round(vader_polarity, 3),
-        "agreement_score": round(agreement, 3)
-    }
-    return combined_polarity, confidence, analysis_details
+        yield shard_db
+    finally:
+        shard_db.close()
 
-def get_enhanced_sentiment(polarity: float, confidence: float = 1.0) -> tuple[str, str, dict]:
-    intensity_factor = abs(polarity) * confidence
-    
-    if polarity > 0.6: sentiment_key = "very_positive"
-    elif polarity > 0.3: sentiment_key = "positive"
-    elif polarity > 0.05: sentiment_key = "slightly_positive"
-    elif polarity < -0.6: sentiment_key = "very_negative"
-    elif polarity < -0.3: sentiment_key = "negative"
-    elif polarity < -0.05: sentiment_key = "slightly_negative"
-    else: sentiment_key = "neutral"
-    
-    if intensity_factor > 0.7: intensity = "muy alta"
-    elif intensity_factor > 0.4: intensity = "alta"
-    elif intensity_factor > 0.2: intensity = "media"
-    else: intensity = "baja"
-    
-    sentiment_label = sentiment_key.replace("_", " ")
-    return sentiment_label, intensity, ENHANCED_PALETTES[sentiment_key]
-
-def generate_advanced_colors(sentiment_key: str, confidence: float) -> dict:
-    return AdvancedColorGenerator.generate_advanced_palette(sentiment_key, confidence)
-
-def generate_dynamic_palette(polarity: float, confidence: float) -> list[str]:
-    base_hue = np.interp(polarity, [-1, 1], [0, 120]) / 360.0
-    base_saturation = np.interp(confidence, [0, 1], [0.45, 0.95])
-    base_lightness = np.interp(abs(polarity), [0, 1], [0.9, 0.5])
-
-    palette_hsl = [
-        (base_hue, base_saturation, min(0.95, base_lightness + 0.15)),
-        ((base_hue - 30/360.0) % 1.0, base_saturation, base_lightness),
-        (base_hue, base_saturation, base_lightness),
-        ((base_hue + 30/360.0) % 1.0, base_saturation, base_lightness),
-        (base_hue, base_saturation, max(0.2, base_lightness - 0.15))
-    ]
-
-    palette_hex = []
-    for h, s, l in palette_hsl:
-        rgb = colorsys.hls_to_rgb(h, l, s)
-        hex_color = f"#{''.join(f'{int(c * 255):02x}' for c in rgb)}"
-        palette_hex.append(hex_color)
-    return palette_hex
+def require_unsharded():
+    """Funciones que aún recorren una sola BD de paletas"""
+    if shards is not None:
+        raise HTTPException(status_code=501, detail="No disponible con las paletas particionadas (PALETTE_SHARDS)")
 
 # ============================================================================
 # ENDPOINTS DE AUTENTICACIÓN
 # ============================================================================
 
-@app.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
-    """Registrar nuevo usuario con datos encriptados"""
-    app_logger.info(f"📝 Registro de usuario: {user.username}")
-    
-    # Verificar si existe
-    existing = db.query(models_auth.User).filter(
-        (models_auth.User.username == user.username) | 
-        (models_auth.User.email == user.email)
-    ).first()
-    
-    if existing:
-        raise HTTPException(status_code=400, detail="Usuario o email ya existe")
-    
+# /register y /token son async: bcrypt se espera en el event loop (asyncio.wrap_future) y
+# el trabajo de BD va en llamadas cortas al threadpool, antes y después. Mientras bcrypt
+# trabaja no se retiene ni un hilo del threadpool ni una conexión del pool.
+
+def _user_exists(db: Session, username: str, email: str) -> bool:
+    try:
+        return db.query(models_auth.User.id).filter(
+            (models_auth.User.username == username) |
+            (models_auth.User.email == email)
+        ).first() is not None
+    finally:
+        db.close()  # devuelve la conexión al pool antes de esperar a bcrypt
+
+def _create_user(db: Session, user: UserCreate, hashed_password: str) -> UserResponse:
     # Crear usuario con datos encriptados
     db_user = models_auth.User(
         username=user.username,
         email=user.email,
-        hashed_password=get_password_hash(user.password),
+        hashed_password=hashed_password,
         full_name=user.full_name,
-        phone=encrypt_data(user.phone) if user.phone else None,  # ← ENCRIPTADO
-        address=encrypt_data(user.address) if user.address else None,  # ← ENCRIPTADO
+        phone=user.phone,  # ← se encripta al asignar
+        address=user.address,
         role=UserRole.USER
     )
-    
     db.add(db_user)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # Otro registro con el mismo usuario o email ganó mientras se hasheaba
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Usuario o email ya existe")
     db.refresh(db_user)
+    return UserResponse.model_validate(db_user)
+
+@app.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
+async def register_user(user: UserCreate, db: Session = Depends(get_db)):
+    """Registrar nuevo usuario con datos encriptados"""
+    app_logger.info(f"📝 Registro de usuario: {user.username}")
+    
+    # Verificar si existe
+    if await run_in_threadpool(_user_exists, db, user.username, user.email):
+        raise HTTPException(status_code=400, detail="Usuario o email ya existe")
+    
+    hashed_password = await get_password_hash_async(user.password)
+    created = await run_in_threadpool(_create_user, db, user, hashed_password)
     
     app_logger.info(f"✅ Usuario {user.username} registrado")
-    return db_user
+    return created
 
 from fastapi import Form, Depends, HTTPException, status
 from sqlalchemy.orm import Session
@@ -309,17 +304,19 @@ class LoginForm:
         self.grant_type = grant_type
 
 
-@app.post("/token", response_model=Token)
-def login(form_data: LoginForm = Depends(), db: Session = Depends(get_db)):
-    """Login con JWT"""
-    app_logger.info(f"🔐 Login: {form_data.username}")
-    
-    user = db.query(models_auth.User).filter(
-        models_auth.User.username == form_data.username
-    ).first()
-    
-    if not user or not verify_password(form_data.password, user.hashed_password):
-        app_logger.warning(f"❌ Login fallido: {form_data.username}")
+def _login_credentials(db: Session, username: str) -> Optional[tuple]:
+    """(id, hash) del usuario, o None; la conexión vuelve al pool antes de bcrypt"""
+    try:
+        return db.query(models_auth.User.id, models_auth.User.hashed_password).filter(
+            models_auth.User.username == username
+        ).first()
+    finally:
+        db.close()
+
+def _complete_login(db: Session, user_id: int, verified_hash: str, new_hash: Optional[str]) -> dict:
+    user = db.get(models_auth.User, user_id)
+    if user is None or user.hashed_password != verified_hash:
+        # Borrado o cambio de contraseña mientras se verificaba
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Credenciales incorrectas",
@@ -329,43 +326,103 @@ def login(form_data: LoginForm = Depends(), db: Session = Depends(get_db)):
     if not user.is_active:
         raise HTTPException(status_code=403, detail="Usuario desactivado")
     
+    if new_hash:
+        # El costo bcrypt configurado cambió: re-hashear de forma transparente
+        user.hashed_password = new_hash
+        app_logger.info(f"🔁 Contraseña re-hasheada con nuevo costo: {user.username}")
+    
     user.last_login = datetime.utcnow()
+    refresh_token = issue_refresh_token(db, user.id)
     db.commit()
     
-    access_token = create_access_token(
-        data={"sub": user.username, "role": user.role}
-    )
+    access_token = create_user_access_token(db, user)
     
     app_logger.info(f"✅ Login exitoso: {user.username}")
     
     return {
         "access_token": access_token,
         "token_type": "bearer",
-        "user": user
+        "user": UserResponse.model_validate(user),
+        "refresh_token": refresh_token,
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    }
+
+@app.post("/token", response_model=Token)
+async def login(form_data: LoginForm = Depends(), db: Session = Depends(get_db)):
+    """Login con JWT"""
+    app_logger.info(f"🔐 Login: {form_data.username}")
+    
+    credentials = await run_in_threadpool(_login_credentials, db, form_data.username)
+    
+    verified, new_hash = (False, None)
+    if credentials:
+        verified, new_hash = await verify_password_and_update_async(form_data.password, credentials.hashed_password)
+    
+    if not verified:
+        app_logger.warning(f"❌ Login fallido: {form_data.username}")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Credenciales incorrectas",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    return await run_in_threadpool(_complete_login, db, credentials.id, credentials.hashed_password, new_hash)
+
+
+@app.post("/token/refresh", response_model=Token)
+def refresh_access_token(body: RefreshRequest, db: Session = Depends(get_db)):
+    """Renovar el access token con un refresh token (rotativo, sin bcrypt)"""
+    user, refresh_token = rotate_refresh_token(db, body.refresh_token)
+    access_token = create_user_access_token(db, user)
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "user": user,
+        "refresh_token": refresh_token,
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60
     }
 
 
+@app.post("/logout")
+def logout(
+    body: Optional[RefreshRequest] = None,
+    token: str = Depends(oauth2_scheme),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Revocar el token actual (y su refresh token, si se envía)"""
+    revoke_token(db, token)
+    if body is not None:
+        revoke_refresh_token(db, body.refresh_token)
+    app_logger.info(f"👋 Logout: {current_user['username']}")
+    return {"message": "Sesión cerrada"}
+
+
 @app.get("/users/me", response_model=UserResponse)
-async def get_current_user_info(
-    current_user: dict = Depends(get_current_active_user),
+def get_current_user_info(
+    db_user: CachedUser = Depends(get_current_db_user),
     db: Session = Depends(get_db)
 ):
-    """Obtener info del usuario actual (con datos desencriptados)"""
-    user = db.query(models_auth.User).filter(
-        models_auth.User.username == current_user["username"]
-    ).first()
+    """Obtener info del usuario actual (phone/address se descifran solo si se leen)"""
+    user = db.get(models_auth.User, db_user.id)
     
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
-    # DESENCRIPTAR datos para mostrar
-    if user.phone:
-        user.phone = decrypt_data(user.phone)
-    if user.address:
-        user.address = decrypt_data(user.address)
+    # Migración perezosa: valores en formato legado se re-cifran al leerlos
+    if upgrade_fields(user, ("phone_encrypted", "address_encrypted")):
+        db.commit()
     
     return user
 
+@app.get("/users/me/profile")
+def get_my_profile(
+    db_user: CachedUser = Depends(get_current_db_user),
+    db: Session = Depends(get_palette_read_db)
+):
+    """Perfil emocional del usuario actual (se lee de su fila acumulada, sin recorrer el historial)"""
+    return get_profile(db, db_user.id)
+
 # ============================================================================
 # ENDPOINTS PRINCIPALES (CON AUTENTICACIÓN)
 # ============================================================================
@@ -379,7 +436,8 @@ async def health():
     return {"status": "healthy", "security": "enabled"}
 
 @app.get("/metrics")
-async def get_metrics():
+def get_metrics(db: Session = Depends(get_db)):
+    update_database_metrics(db)
     metrics_text = metrics_exporter.get_metrics_text()
     return Response(content=metrics_text, media_type="text/plain")
 
@@ -387,7 +445,8 @@ async def get_metrics():
 def analyze_text(
     request: TextInput,
     current_user: dict = Depends(require_permission("create_palette")),  # ← REQUIERE AUTH
-    db: Session = Depends(get_db)
+    db_user: CachedUser = Depends(get_current_db_user),
+    db: Session = Depends(get_palette_db)
 ):
     """Analizar texto (requiere autenticación)"""
     start_time = time.time()
@@ -398,17 +457,8 @@ def analyze_text(
         original_text = request.text
         translated_text = translate_text(original_text)
         
-        if request.method == "textblob":
-            polarity, subjectivity = analyze_with_textblob(translated_text)
-            confidence = 1 - subjectivity
-            analysis_details = {"subjectivity": round(subjectivity, 3)}
-        elif request.method == "vader":
-            polarity, vader_scores = analyze_with_vader(translated_text)
-            confidence = abs(polarity)
-            analysis_details = {"vader_scores": vader_scores}
-        else:
-            polarity, confidence, analysis_details = hybrid_analysis(translated_text)
-        
+        polarity, confidence, analysis_details = score_text(translated_text, request.method)
+
         sentiment_label, intensity, palette_info = get_enhanced_sentiment(polarity, confidence)
         
         try:
@@ -446,10 +496,6 @@ def analyze_text(
         
         # Guardar asociado al usuario
         try:
-            user = db.query(models_auth.User).filter(
-                models_auth.User.username == current_user["username"]
-            ).first()
-            
             db_palette = models_auth.PaletteWithUser(
                 input_text=original_text,
                 translated_text=translated_text,
@@ -460,11 +506,14 @@ def analyze_text(
                 sentiment_label=sentiment_label,
                 intensity=intensity,
                 emotion_type=emotion_details.get("emotion"),
-                user_id=user.id
+                user_id=db_user.id
             )
+            if shards is not None:
+                db_palette.id = shards.next_palette_id(db, shards.shard_for_user(db_user.id))
             db.add(db_palette)
+            update_profiles(db, [db_palette])
             db.commit()
-            app_logger.info(f"💾 Paleta guardada (user: {user.id})")
+            app_logger.info(f"💾 Paleta guardada (user: {db_user.id})")
         except Exception as e:
             app_logger.error(f"❌ Error BD: {e}")
         
@@ -485,78 +534,236 @@ def analyze_text(
         record_error("analysis", "critical")
         raise HTTPException(status_code=500, detail="Error interno")
 
+# Listados: solo las columnas que se devuelven, como tuplas (sin entidades ORM ni identity map)
+_P = models_auth.PaletteWithUser
+GALLERY_COLUMNS = (_P.id, _P.input_text, _P.colors, _P.sentiment_label, _P.created_at)
+
+def _gallery_rows(session: Session, user_id: Optional[int], limit: int) -> list:
+    query = session.query(*GALLERY_COLUMNS)
+    if user_id is not None:
+        query = query.filter(_P.user_id == user_id)
+    return query.order_by(_P.created_at.desc()).limit(limit).all()
+
 @app.get("/gallery")
 def get_gallery(
     current_user: dict = Depends(require_permission("view_palette")),  # ← REQUIERE AUTH
     limit: int = 50,
-    db: Session = Depends(get_db)
+    db_user: CachedUser = Depends(get_current_db_user),
+    db: Session = Depends(get_palette_read_db)
 ):
     """Ver galería (solo paletas del usuario o todas si es admin)"""
     limit = min(limit, 100)
     
-    if current_user["role"] == UserRole.ADMIN:
-        palettes = db.query(models_auth.PaletteWithUser).order_by(
-            models_auth.PaletteWithUser.created_at.desc()
-        ).limit(limit).all()
+    if current_user["role"] != UserRole.ADMIN:
+        palettes = _gallery_rows(db, db_user.id, limit)
+    elif shards is None:
+        palettes = _gallery_rows(db, None, limit)
     else:
-        user = db.query(models_auth.User).filter(
-            models_auth.User.username == current_user["username"]
-        ).first()
-        palettes = db.query(models_auth.PaletteWithUser).filter(
-            models_auth.PaletteWithUser.user_id == user.id
-        ).order_by(
-            models_auth.PaletteWithUser.created_at.desc()
-        ).limit(limit).all()
+        # Las más recientes de cada partición, mezcladas por fecha
+        palettes = list(islice(heapq.merge(
+            *shards.fan_out(lambda session, shard: _gallery_rows(session, None, limit)),
+            key=lambda p: p.created_at or datetime.min, reverse=True
+        ), limit))
     
     return {"total": len(palettes), "palettes": [
         {
-            "id": p.id,
-            "input_text": p.input_text,
-            "colors": p.colors,
-            "sentiment_label": p.sentiment_label,
-            "created_at": p.created_at.isoformat() if p.created_at else None
+            "id": palette_id,
+            "input_text": input_text,
+            "colors": colors,
+            "sentiment_label": sentiment_label,
+            "created_at": created_at.isoformat() if created_at else None
         }
-        for p in palettes
+        for palette_id, input_text, colors, sentiment_label, created_at in palettes
     ]}
 
+@app.get("/palettes/search", dependencies=[Depends(require_unsharded)])
+def search_palettes_endpoint(
+    q: str = Query(..., min_length=1, max_length=200, description="Palabras; 'feli*' busca por prefijo"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    sort: str = Query("relevance", pattern="^(relevance|recent)$"),
+    current_user: dict = Depends(require_permission("view_palette")),
+    db_user: CachedUser = Depends(get_current_db_user),
+    db: Session = Depends(get_read_db)
+):
+    """Búsqueda de texto completo (mismas reglas de visibilidad que la galería)"""
+    user_id = None if current_user["role"] == UserRole.ADMIN else db_user.id
+    try:
+        results, next_cursor = search_palettes(db, q, user_id, limit, cursor, sort)
+    except InvalidSearchQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"results": results, "next_cursor": next_cursor}
+
+@app.get("/palettes/export")
+def export_palettes_endpoint(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    user_id: Optional[int] = Query(None, description="Solo admin: exportar las paletas de un usuario"),
+    current_user: dict = Depends(require_permission("view_palette")),
+    db_user: CachedUser = Depends(get_current_db_user),
+    db: Session = Depends(get_read_db)
+):
+    """Exportar el historial en streaming (memoria constante; gzip si el cliente lo acepta)"""
+    if current_user["role"] != UserRole.ADMIN:
+        user_id = db_user.id
+    if shards is None:
+        source = db.get_bind()
+    elif user_id is None:
+        source = shards.read_engines
+    else:
+        source = shards.read_engines[shards.shard_for_user(user_id)]
+    compress = "gzip" in request.headers.get("accept-encoding", "")
+    headers = {"Content-Disposition": f'attachment; filename="palettes.{format}"'}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export_palettes(source, format, user_id, compress),
+        media_type=EXPORT_FORMATS[format],
+        headers=headers
+    )
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Fechas de query a UTC sin zona (como se guardan en la BD)"""
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value and value.tzinfo else value
+
+@app.get("/palettes/archive", dependencies=[Depends(require_unsharded)])
+def archived_palettes_endpoint(
+    user_id: Optional[int] = Query(None, description="Solo admin: paletas archivadas de un usuario"),
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    cursor: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=100),
+    current_user: dict = Depends(require_permission("view_palette")),
+    db_user: CachedUser = Depends(get_current_db_user),
+    archive: Engine = Depends(get_archive_engine)
+):
+    """Paletas archivadas por la política de retención (camino lento: BD de archivo)"""
+    if current_user["role"] != UserRole.ADMIN:
+        user_id = db_user.id
+    palettes, next_cursor = archived_page(archive, user_id, _naive_utc(from_), _naive_utc(to), cursor, limit)
+    return {"palettes": palettes, "next_cursor": next_cursor}
+
+@app.post("/palettes/import", dependencies=[Depends(require_unsharded)])
+def import_palettes_endpoint(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(ndjson|csv)$",
+                                  description="Por defecto, según la extensión del archivo"),
+    import_id: Optional[str] = Query(None, description="Reutilizarlo para reanudar una importación"),
+    user_id: Optional[int] = Query(None, description="Solo admin: importar para otro usuario"),
+    recompute: bool = Query(False, description="Calcular sentimiento y colores que falten"),
+    method: str = Query("hybrid", pattern="^(hybrid|textblob|vader)$"),
+    current_user: dict = Depends(require_permission("create_palette")),
+    db_user: CachedUser = Depends(get_current_db_user),
+    db: Session = Depends(get_db)
+):
+    """Importar paletas desde NDJSON o CSV (por lotes; reanudable con el mismo import_id)"""
+    if format is None:
+        extension = os.path.splitext(file.filename or "")[1].lstrip(".").lower()
+        format = {"jsonl": "ndjson"}.get(extension, extension)
+        if format not in ("ndjson", "csv"):
+            raise HTTPException(status_code=400, detail="Indique format=ndjson o format=csv")
+    if user_id is None or current_user["role"] != UserRole.ADMIN:
+        user_id = db_user.id
+    elif db.get(models_auth.User, user_id) is None:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    import_id = import_id or uuid.uuid4().hex
+
+    try:
+        result = import_palettes(db, file.file, format, import_id, db_user.id, user_id,
+                                 recompute=recompute, method=method)
+    except InvalidImport as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    app_logger.info(
+        f"📥 Importación {import_id} por {current_user['username']}: "
+        f"{result['inserted']} paletas, {result['rejected']} rechazadas"
+    )
+    return result
+
+@app.get("/palettes/import/{import_id}", dependencies=[Depends(require_unsharded)])
+def import_status_endpoint(
+    import_id: str,
+    current_user: dict = Depends(require_permission("create_palette")),
+    db_user: CachedUser = Depends(get_current_db_user),
+    db: Session = Depends(get_read_db)
+):
+    """Progreso de una importación propia"""
+    try:
+        result = import_status(db, db_user.id, import_id)
+    except InvalidImport as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Importación no encontrada")
+    return result
+
 @app.delete("/palettes/{palette_id}")
 def delete_palette(
     palette_id: int,
     current_user: dict = Depends(get_current_active_user),  # ← REQUIERE AUTH
+    db_user: CachedUser = Depends(get_current_db_user),
     db: Session = Depends(get_db)
 ):
-    """Eliminar paleta (solo propietario o admin)"""
-    palette = db.query(models_auth.PaletteWithUser).filter(
-        models_auth.PaletteWithUser.id == palette_id
-    ).first()
-    
-    if not palette:
-        raise HTTPException(status_code=404, detail="Paleta no encontrada")
-    
-    user = db.query(models_auth.User).filter(
-        models_auth.User.username == current_user["username"]
-    ).first()
-    
-    # Solo el dueño o admin puede eliminar
-    if palette.user_id != user.id and current_user["role"] != UserRole.ADMIN:
-        raise HTTPException(status_code=403, detail="Sin permiso")
-    
-    db.delete(palette)
-    db.commit()
+    """Eliminar paleta (solo propietario o con permiso delete_all_palettes)"""
+    # El id indica la partición: no hace falta saber de quién es la paleta
+    palette_db = db if shards is None else shards.session(shards.shard_for_palette(palette_id))
+    try:
+        palette = palette_db.query(models_auth.PaletteWithUser).filter(
+            models_auth.PaletteWithUser.id == palette_id
+        ).first()
+        
+        if not palette:
+            raise HTTPException(status_code=404, detail="Paleta no encontrada")
+        
+        # Solo el dueño o quien tenga delete_all_palettes puede eliminar
+        if palette.user_id != db_user.id and not check_permission(current_user, "delete_all_palettes"):
+            raise HTTPException(status_code=403, detail="Sin permiso")
+        
+        update_profiles(palette_db, [palette], sign=-1)
+        palette_db.delete(palette)
+        palette_db.commit()
+    finally:
+        if palette_db is not db:
+            palette_db.close()
     
     record_palette_deleted("manual")
     event_logger.log_palette_deleted(palette_id, user_action=True)
     
     return {"message": "Paleta eliminada", "id": palette_id}
 
+class PaletteBulkDelete(BaseModel):
+    """Selección de paletas a borrar: lista de ids y/o filtros"""
+    ids: Optional[list[int]] = None
+    user_id: Optional[int] = None
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+    sentiment: Optional[str] = None
+
+@app.post("/palettes/bulk/delete", dependencies=[Depends(require_unsharded)])
+def bulk_delete_palettes_endpoint(
+    selection: PaletteBulkDelete,
+    current_user: dict = Depends(require_permission("delete_all_palettes")),
+    db: Session = Depends(get_db)
+):
+    """Borrado masivo en lotes (requiere delete_all_palettes)"""
+    conditions = palette_filter_conditions(selection.user_id, selection.created_from,
+                                           selection.created_to, selection.sentiment)
+    if selection.ids is None and not conditions:
+        raise HTTPException(400, "Indica ids o al menos un filtro")
+    deleted = bulk_delete_palettes(db, selection.ids, conditions)
+    app_logger.warning(f"{current_user['username']} eliminó {deleted} paletas en bloque")
+    return {"message": "Paletas eliminadas", "deleted": deleted}
+
 @app.get("/stats")
 def get_stats(
     current_user: dict = Depends(require_permission("view_stats")),  # ← REQUIERE AUTH
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
-    """Estadísticas (requiere autenticación)"""
-    total_palettes = db.query(models_auth.PaletteWithUser).count()
-    total_users = db.query(models_auth.User).count()
+    """Estadísticas (requiere autenticación; totales de los contadores incrementales)"""
+    counters = get_counters(db)
+    total_palettes = counters.get(PALETTES_TOTAL, 0)
+    total_users = counters.get(USERS_TOTAL, 0)
+    if shards is not None:
+        # Cada partición lleva sus propios contadores de paletas
+        total_palettes = sum(shards.fan_out(lambda session, shard: get_counters(session).get(PALETTES_TOTAL, 0)))
     
     return {
         "total_palettes": total_palettes,
@@ -565,6 +772,36 @@ def get_stats(
         "security": "enabled"
     }
 
+@app.get("/analytics/sentiment", dependencies=[Depends(require_unsharded)])
+def sentiment_analytics(
+    granularity: str = Query("day", pattern="^(hour|day)$"),
+    from_: Optional[datetime] = Query(None, alias="from", description="Por defecto: 30 días (o 24 h) antes de 'to'"),
+    to: Optional[datetime] = Query(None, description="Por defecto: ahora (UTC)"),
+    user_id: Optional[int] = Query(None, description="Solo admin: un usuario (por defecto, global)"),
+    current_user: dict = Depends(require_permission("view_stats")),
+    db_user: CachedUser = Depends(get_current_db_user),
+    db: Session = Depends(get_read_db)
+):
+    """Distribución de sentimiento por hora o por día (agregados incrementales, ver rollups.py)"""
+    to = _naive_utc(to) if to else datetime.utcnow()
+    from_ = _naive_utc(from_) if from_ else to - (timedelta(hours=24) if granularity == "hour" else timedelta(days=30))
+    try:
+        check_range(granularity, from_, to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if current_user["role"] != UserRole.ADMIN:
+        user_id = db_user.id
+    scope = GLOBAL_USER_ID if user_id is None else user_id
+    return {
+        "granularity": granularity,
+        "from": from_.isoformat(),
+        "to": to.isoformat(),
+        "user_id": user_id,
+        "series": sentiment_series(db, granularity, from_, to, scope),
+        # Paletas previas a los agregados aún sin sumar (las agrega el mantenimiento)
+        "backfill_pending": backfill_pending(db),
+    }
+
 # ===== ADMIN ENDPOINTS =====
 from typing import List
 
@@ -574,40 +811,137 @@ class UserRoleUpdate(BaseModel):
 class UserStatusUpdate(BaseModel):
     is_active: bool
 
+class UserPermissionsUpdate(BaseModel):
+    grant: List[str] = []
+    deny: List[str] = []
+
 class UserAdminResponse(BaseModel):
     id: int
     username: str
     email: str
-    full_name: str = None
+    full_name: Optional[str] = None
     role: str
     is_active: bool
-    created_at: str = None
-    last_login: str = None
+    created_at: Optional[str] = None
+    last_login: Optional[str] = None
     class Config:
         from_attributes = True
 
-@app.get("/users", response_model=List[UserAdminResponse])
-async def list_all_users(current_user: dict = Depends(get_current_admin), db: Session = Depends(get_db)):
-    users = db.query(models_auth.User).all()
-    return [{
+class UserPageResponse(BaseModel):
+    items: List[UserAdminResponse]
+    next_after_id: Optional[int] = None  # None = última página
+    counts: dict
+
+_U = models_auth.User
+USER_LIST_COLUMNS = (_U.id, _U.username, _U.email, _U.full_name, _U.role, _U.is_active,
+                     _U.created_at, _U.last_login)
+
+@app.get("/users", response_model=UserPageResponse)
+def list_all_users(
+    limit: int = Query(50, ge=1, le=500),
+    after_id: int = Query(0, ge=0, description="Último id de la página anterior (keyset)"),
+    role: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    q: Optional[str] = Query(None, min_length=1, description="Prefijo de username"),
+    current_user: dict = Depends(get_current_admin),
+    db: Session = Depends(get_read_db)
+):
+    """Listado paginado por id; los totales salen de los contadores incrementales"""
+    users = db.query(*USER_LIST_COLUMNS).filter(
+        _U.id > after_id,
+        *user_filter_conditions(role, is_active, created_from, created_to, q)
+    ).order_by(_U.id).limit(limit + 1).all()
+    has_more = len(users) > limit
+    users = users[:limit]
+    
+    # Solo se descifra la página devuelta
+    emails = decrypt_many([u.email for u in users])
+    items = [{
         "id": u.id,
         "username": u.username,
-        "email": decrypt_data(u.email) if u.email else u.email,
+        "email": email,
         "full_name": u.full_name,
         "role": u.role,
         "is_active": u.is_active,
         "created_at": u.created_at.isoformat() if u.created_at else None,
         "last_login": u.last_login.isoformat() if u.last_login else None
-    } for u in users]
+    } for u, email in zip(users, emails)]
+    return {
+        "items": items,
+        "next_after_id": users[-1].id if has_more else None,
+        "counts": user_counts(db)
+    }
+
+class UserSelection(BaseModel):
+    """Usuarios afectados por una operación masiva: lista de ids y/o filtros"""
+    ids: Optional[List[int]] = None
+    role: Optional[str] = None
+    is_active: Optional[bool] = None
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+    q: Optional[str] = None
+
+class BulkRoleUpdate(BaseModel):
+    selection: UserSelection
+    role: str
+
+class BulkStatusUpdate(BaseModel):
+    selection: UserSelection
+    is_active: bool
+
+def _resolve_selection(db: Session, selection: UserSelection, current_user: dict,
+                       protect_self: bool, self_error: str) -> List[int]:
+    conditions = user_filter_conditions(selection.role, selection.is_active,
+                                        selection.created_from, selection.created_to, selection.q)
+    if selection.ids is None and not conditions:
+        raise HTTPException(400, "Indica ids o al menos un filtro")
+    if not protect_self:
+        return select_user_ids(db, selection.ids, conditions)
+    # Un filtro puede abarcar al propio admin: se excluye; pedirlo explícitamente es un error
+    if selection.ids is not None and current_user["uid"] in selection.ids:
+        raise HTTPException(400, self_error)
+    return select_user_ids(db, selection.ids, conditions, exclude_id=current_user["uid"])
+
+@app.put("/users/bulk/role")
+def bulk_update_user_role(update: BulkRoleUpdate, current_user: dict = Depends(get_current_admin), db: Session = Depends(get_db)):
+    if update.role not in ROLE_PERMISSIONS:
+        raise HTTPException(400, f"Rol inválido. Debe ser uno de: {', '.join(ROLE_PERMISSIONS)}")
+    user_ids = _resolve_selection(db, update.selection, current_user,
+                                  update.role != "admin", "No puedes quitarte tu rol de admin")
+    changed = bulk_set_role(db, user_ids, update.role)
+    app_logger.warning(f"Admin {current_user['username']} cambió el rol de {len(changed)} usuarios a {update.role}")
+    return {"message": "Roles actualizados", "affected": len(changed), "new_role": update.role}
+
+@app.put("/users/bulk/status")
+def bulk_update_user_status(update: BulkStatusUpdate, current_user: dict = Depends(get_current_admin), db: Session = Depends(get_db)):
+    user_ids = _resolve_selection(db, update.selection, current_user,
+                                  not update.is_active, "No puedes desactivarte a ti mismo")
+    changed = bulk_set_status(db, user_ids, update.is_active)
+    app_logger.warning(f"Admin {current_user['username']} cambió el estado de {len(changed)} usuarios")
+    return {"message": "Estados actualizados", "affected": len(changed), "is_active": update.is_active}
+
+@app.post("/users/bulk/delete", dependencies=[Depends(require_unsharded)])
+def bulk_delete_users(selection: UserSelection, current_user: dict = Depends(get_current_admin), db: Session = Depends(get_db)):
+    user_ids = _resolve_selection(db, selection, current_user, True, "No puedes eliminar tu propia cuenta")
+    deleted = bulk_delete(db, user_ids)
+    app_logger.warning(f"Admin {current_user['username']} eliminó {deleted} usuarios")
+    return {"message": "Usuarios eliminados", "affected": deleted}
 
 @app.put("/users/{user_id}/role")
 async def update_user_role(user_id: int, role_update: UserRoleUpdate, current_user: dict = Depends(get_current_admin), db: Session = Depends(get_db)):
     user = db.query(models_auth.User).filter(models_auth.User.id == user_id).first()
     if not user: raise HTTPException(404, "Usuario no encontrado")
+    if role_update.role not in ROLE_PERMISSIONS:
+        raise HTTPException(400, f"Rol inválido. Debe ser uno de: {', '.join(ROLE_PERMISSIONS)}")
     if user.username == current_user["username"] and role_update.role != "admin":
         raise HTTPException(400, "No puedes quitarte tu rol de admin")
+    previous_role = user.role
     user.role = role_update.role
     db.commit()
+    if previous_role != role_update.role:
+        refresh_user_permissions(db, user_id)
     return {"message": "Rol actualizado", "user_id": user_id, "new_role": role_update.role}
 
 @app.put("/users/{user_id}/status")
@@ -618,8 +952,125 @@ async def update_user_status(user_id: int, status_update: UserStatusUpdate, curr
         raise HTTPException(400, "No puedes desactivarte a ti mismo")
     user.is_active = status_update.is_active
     db.commit()
+    if status_update.is_active:
+        # Los cortes por usuario siguen vigentes: solo los tokens emitidos después valen
+        invalidate_cached_user(user_id)
+    else:
+        revoke_user_tokens(db, user_id)
     return {"message": "Estado actualizado", "user_id": user_id, "is_active": status_update.is_active}
 
+@app.put("/users/{user_id}/permissions")
+async def update_user_permissions(user_id: int, update: UserPermissionsUpdate, current_user: dict = Depends(get_current_admin), db: Session = Depends(get_db)):
+    user = db.query(models_auth.User).filter(models_auth.User.id == user_id).first()
+    if not user: raise HTTPException(404, "Usuario no encontrado")
+    unknown = [p for p in update.grant + update.deny if p not in PERMISSION_BITS]
+    if unknown:
+        raise HTTPException(400, f"Permisos desconocidos: {', '.join(unknown)}")
+    if set(update.grant) & set(update.deny):
+        raise HTTPException(400, "Un permiso no puede concederse y denegarse a la vez")
+    # Reemplazar los overrides del usuario
+    db.query(models_auth.UserPermissionOverride).filter(
+        models_auth.UserPermissionOverride.user_id == user_id
+    ).delete(synchronize_session=False)
+    db.add_all(
+        [models_auth.UserPermissionOverride(user_id=user_id, permission=p, granted=True) for p in update.grant] +
+        [models_auth.UserPermissionOverride(user_id=user_id, permission=p, granted=False) for p in update.deny]
+    )
+    db.commit()
+    refresh_user_permissions(db, user_id)
+    return {"user_id": user_id, "permissions": mask_permissions(load_user_mask(db, user_id, user.role))}
+
+@app.delete("/users/{user_id}")
+async def delete_user(user_id: int, current_user: dict = Depends(get_current_admin), db: Session = Depends(get_db)):
+    user = db.query(models_auth.User).filter(models_auth.User.id == user_id).first()
+    if not user: raise HTTPException(404, "Usuario no encontrado")
+    if user.username == current_user["username"]:
+        raise HTTPException(400, "No puedes eliminar tu propia cuenta")
+    # user_id es NOT NULL: borrar primero sus paletas
+    if shards is not None:
+        shard_db = shards.session(shards.shard_for_user(user_id))
+        try:
+            for model in (models_auth.PaletteWithUser, models_auth.UserProfile):
+                shard_db.query(model).filter(model.user_id == user_id).delete(synchronize_session=False)
+            shard_db.commit()
+        finally:
+            shard_db.close()
+    db.query(models_auth.PaletteWithUser).filter(
+        models_auth.PaletteWithUser.user_id == user_id
+    ).delete(synchronize_session=False)
+    db.query(models_auth.RefreshToken).filter(
+        models_auth.RefreshToken.user_id == user_id
+    ).delete(synchronize_session=False)
+    db.query(models_auth.UserPermissionOverride).filter(
+        models_auth.UserPermissionOverride.user_id == user_id
+    ).delete(synchronize_session=False)
+    db.query(models_auth.UserProfile).filter(
+        models_auth.UserProfile.user_id == user_id
+    ).delete(synchronize_session=False)
+    db.delete(user)
+    db.commit()
+    revoke_user_tokens(db, user_id)
+    app_logger.warning(f"Admin {current_user['username']} eliminó al usuario {user.username}")
+    return {"message": "Usuario eliminado", "user_id": user_id}
+
+class ReencryptRequest(BaseModel):
+    restart: bool = False
+
+@app.post("/admin/reencrypt", status_code=status.HTTP_202_ACCEPTED)
+async def start_reencryption(request: Optional[ReencryptRequest] = None, current_user: dict = Depends(get_current_admin)):
+    """Re-encriptar datos personales con la clave activa (en segundo plano, reanudable)"""
+    job = get_reencryption_job()
+    if not job.start(restart=request.restart if request else False):
+        raise HTTPException(409, "La re-encriptación ya está en curso")
+    app_logger.warning(f"Admin {current_user['username']} inició la re-encriptación de datos")
+    return {"message": "Re-encriptación iniciada"}
+
+@app.get("/admin/reencrypt")
+async def reencryption_status(current_user: dict = Depends(get_current_admin)):
+    return get_reencryption_job().status
+
+@app.delete("/admin/reencrypt")
+async def stop_reencryption(current_user: dict = Depends(get_current_admin)):
+    """Detener tras el lote en curso; una nueva ejecución continúa desde el checkpoint"""
+    get_reencryption_job().stop()
+    return {"message": "Re-encriptación detenida"}
+
+@app.get("/admin/maintenance")
+async def maintenance_status(current_user: dict = Depends(get_current_admin)):
+    """Última ejecución de cada tarea de mantenimiento en este worker"""
+    return {"requests_per_second": round(load_monitor.rate(), 3), "tasks": get_maintenance_scheduler().status}
+
+@app.post("/admin/retention", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(require_unsharded)])
+async def start_archiving(current_user: dict = Depends(get_current_admin)):
+    """Archivar las paletas vencidas según la política de retención (en segundo plano)"""
+    if not get_archive_job().start():
+        raise HTTPException(409, "El archivado ya está en curso")
+    app_logger.warning(f"Admin {current_user['username']} inició el archivado de paletas")
+    return {"message": "Archivado iniciado"}
+
+@app.get("/admin/retention")
+async def archiving_status(current_user: dict = Depends(get_current_admin)):
+    return get_archive_job().status
+
+@app.delete("/admin/retention")
+async def stop_archiving(current_user: dict = Depends(get_current_admin)):
+    """Detener tras el lote en curso"""
+    get_archive_job().stop()
+    return {"message": "Archivado detenido"}
+
+@app.post("/admin/backups", status_code=status.HTTP_202_ACCEPTED)
+async def start_backup(current_user: dict = Depends(get_current_admin)):
+    """Copia de seguridad en línea de la BD (en segundo plano)"""
+    if not get_backup_job().start():
+        raise HTTPException(409, "Ya hay una copia de seguridad en curso")
+    app_logger.warning(f"Admin {current_user['username']} inició una copia de seguridad")
+    return {"message": "Copia de seguridad iniciada"}
+
+@app.get("/admin/backups")
+async def backup_status(current_user: dict = Depends(get_current_admin)):
+    """Estado de la última copia pedida en este worker y copias disponibles"""
+    return {"job": get_backup_job().status, "backups": list_backups()}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
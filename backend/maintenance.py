@@ -0,0 +1,303 @@
+"""
+Mantenimiento de la BD SQLite en segundo plano
+
+Un hilo por worker revisa cada MAINTENANCE_TICK_SECONDS qué tareas tocan y las ejecuta
+solo en ventanas de poca carga (requests/s del propio worker en el último minuto):
+  - wal_checkpoint     PRAGMA wal_checkpoint(TRUNCATE): el WAL vuelve a tamaño cero
+  - incremental_vacuum devuelve al sistema páginas libres (auto_vacuum=INCREMENTAL)
+  - optimize           PRAGMA optimize
+  - analyze            ANALYZE acotado con analysis_limit
+  - backup             copia de seguridad en línea (backup.py; BACKUP_INTERVAL_SECONDS, 0 = no)
+  - rollup_backfill    backfill pendiente de los agregados de sentimiento (rollups.py)
+  - archive            archivado por política de retención (retention.py; sin política, no hace nada)
+
+Las tareas largas y reanudables (PAUSABLE_TASKS) además se detienen entre lotes si la carga
+sube durante la ejecución; la siguiente ventana de poca carga sigue desde su checkpoint.
+
+Si el WAL supera MAINTENANCE_WAL_MAX_BYTES el checkpoint se hace aunque haya carga: con
+lectores continuos el checkpoint automático de SQLite no llega a reiniciar el archivo.
+
+Coordinación entre workers: cada tarea tiene una fila en job_checkpoints
+("maintenance:<tarea>") con la hora de la última ejecución. Un worker la reclama con un
+UPDATE condicional (SQLite serializa las escrituras): solo uno gana cada ejecución.
+"""
+
+from datetime import datetime, timezone
+from typing import Callable, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+import json
+import socket
+import threading
+import time
+import os
+
+from backup import BACKUP_INTERVAL_SECONDS, run_backup
+from logger_config import app_logger
+from metrics import record_maintenance_task, record_pages_reclaimed, set_sqlite_wal_size
+from rollups import backfill_rollups
+
+MAINTENANCE_ENABLED = os.getenv("MAINTENANCE_ENABLED", "true").lower() == "true"
+MAINTENANCE_TICK_SECONDS = float(os.getenv("MAINTENANCE_TICK_SECONDS", "30"))
+# Carga baja: como mucho MAINTENANCE_MAX_RPS requests/s de media en la ventana
+MAINTENANCE_LOAD_WINDOW_SECONDS = int(os.getenv("MAINTENANCE_LOAD_WINDOW_SECONDS", "60"))
+MAINTENANCE_MAX_RPS = float(os.getenv("MAINTENANCE_MAX_RPS", "1"))
+MAINTENANCE_WAL_MAX_BYTES = int(os.getenv("MAINTENANCE_WAL_MAX_BYTES", str(64 * 1024 * 1024)))
+MAINTENANCE_VACUUM_PAGES = int(os.getenv("MAINTENANCE_VACUUM_PAGES", "5000"))
+# Filas muestreadas por índice en ANALYZE (0 = todas)
+MAINTENANCE_ANALYSIS_LIMIT = int(os.getenv("MAINTENANCE_ANALYSIS_LIMIT", "1000"))
+
+# Tarea -> segundos entre ejecuciones (en este orden: el checkpoint, al final, recoge lo que
+# escribieron las demás)
+MAINTENANCE_INTERVALS = {
+    "rollup_backfill": float(os.getenv("MAINTENANCE_ROLLUP_BACKFILL_SECONDS", "300")),
+    "archive": float(os.getenv("MAINTENANCE_ARCHIVE_SECONDS", "3600")),
+    "incremental_vacuum": float(os.getenv("MAINTENANCE_VACUUM_SECONDS", "3600")),
+    "optimize": float(os.getenv("MAINTENANCE_OPTIMIZE_SECONDS", "3600")),
+    "analyze": float(os.getenv("MAINTENANCE_ANALYZE_SECONDS", "86400")),
+    **({"backup": BACKUP_INTERVAL_SECONDS} if BACKUP_INTERVAL_SECONDS > 0 else {}),
+    "wal_checkpoint": float(os.getenv("MAINTENANCE_WAL_CHECKPOINT_SECONDS", "300")),
+}
+
+
+class LoadMonitor:
+    """Requests por segundo en una ventana deslizante (cubetas de un segundo, O(1) por request)"""
+
+    def __init__(self, window: int = MAINTENANCE_LOAD_WINDOW_SECONDS):
+        self.window = window
+        self._seconds = [0] * window
+        self._counts = [0] * window
+        self._lock = threading.Lock()
+
+    def record(self, now: Optional[float] = None):
+        second = int(time.time() if now is None else now)
+        i = second % self.window
+        with self._lock:
+            if self._seconds[i] != second:
+                self._seconds[i] = second
+                self._counts[i] = 0
+            self._counts[i] += 1
+
+    def rate(self, now: Optional[float] = None) -> float:
+        second = int(time.time() if now is None else now)
+        with self._lock:
+            total = sum(count for s, count in zip(self._seconds, self._counts) if second - s < self.window)
+        return total / self.window
+
+
+load_monitor = LoadMonitor()
+
+
+# ============================================================================
+# TAREAS (cada una con su propia conexión; executescript ejecuta el PRAGMA hasta el final)
+# ============================================================================
+
+def _script(engine: Engine, sql: str):
+    raw = engine.raw_connection()
+    try:
+        raw.driver_connection.executescript(sql)
+    finally:
+        raw.close()
+
+
+def _pragma(engine: Engine, sql: str):
+    raw = engine.raw_connection()
+    try:
+        return raw.driver_connection.execute(sql).fetchone()
+    finally:
+        raw.close()
+
+
+def wal_size(engine: Engine) -> int:
+    """Bytes del archivo -wal (0 si no hay WAL o la BD no es un archivo SQLite)"""
+    if engine.dialect.name != "sqlite" or not engine.url.database:
+        return 0
+    try:
+        return os.path.getsize(engine.url.database + "-wal")
+    except OSError:
+        return 0
+
+
+def wal_checkpoint(engine: Engine) -> dict:
+    """Checkpoint TRUNCATE: espera a los lectores (busy_timeout) y vacía el WAL"""
+    busy, wal_pages, checkpointed = _pragma(engine, "PRAGMA wal_checkpoint(TRUNCATE)")
+    return {"busy": bool(busy), "wal_pages": wal_pages, "checkpointed": checkpointed}
+
+
+def incremental_vacuum(engine: Engine, pages: int = MAINTENANCE_VACUUM_PAGES) -> dict:
+    """Liberar hasta `pages` páginas libres (sin efecto si auto_vacuum no es INCREMENTAL)"""
+    before = _pragma(engine, "PRAGMA freelist_count")[0]
+    if _pragma(engine, "PRAGMA auto_vacuum")[0] != 2:
+        return {"pages_reclaimed": 0, "freelist": before}
+    _script(engine, f"PRAGMA incremental_vacuum({int(pages)})")
+    after = _pragma(engine, "PRAGMA freelist_count")[0]
+    return {"pages_reclaimed": before - after, "freelist": after}
+
+
+def vacuum(engine: Engine) -> dict:
+    """VACUUM completo pasando a auto_vacuum=INCREMENTAL (reescribe el archivo; bloquea la BD)"""
+    before = _pragma(engine, "PRAGMA freelist_count")[0]
+    _script(engine, "PRAGMA auto_vacuum=INCREMENTAL; VACUUM")
+    return {"pages_reclaimed": before - _pragma(engine, "PRAGMA freelist_count")[0]}
+
+
+def optimize(engine: Engine) -> dict:
+    _script(engine, "PRAGMA optimize")
+    return {}
+
+
+def analyze(engine: Engine) -> dict:
+    _script(engine, f"PRAGMA analysis_limit={MAINTENANCE_ANALYSIS_LIMIT}; ANALYZE")
+    return {}
+
+
+def rollup_backfill(engine: Engine, should_pause: Optional[Callable[[], bool]] = None) -> dict:
+    """Backfill de los agregados por lotes; sin nada pendiente solo lee su checkpoint"""
+    return backfill_rollups(sessionmaker(bind=engine), should_pause=should_pause)
+
+
+def archive(engine: Engine, should_pause: Optional[Callable[[], bool]] = None) -> dict:
+    """
+    Archivado por retención con el trabajo global del proceso (el de /admin/retention,
+    sobre la BD principal): comparte su estado y no se solapa con una ejecución manual
+    """
+    from database import shards
+    from retention import get_archive_job  # retention importa tareas de este módulo
+    if shards is not None:
+        return {"state": "sharded"}
+    job = get_archive_job()
+    if job.running:
+        return {"state": "running"}
+    return job.run(should_pause=should_pause)
+
+
+TASKS: dict[str, Callable[[Engine], dict]] = {
+    "wal_checkpoint": wal_checkpoint,
+    "incremental_vacuum": incremental_vacuum,
+    "optimize": optimize,
+    "analyze": analyze,
+    "backup": lambda engine: run_backup(engine),
+    "rollup_backfill": rollup_backfill,
+    "archive": archive,
+}
+# Tareas que reciben should_pause y se detienen entre lotes si sube la carga
+PAUSABLE_TASKS = {"rollup_backfill", "archive"}
+
+
+class MaintenanceScheduler:
+    """Programador de tareas de mantenimiento; un hilo por proceso"""
+
+    def __init__(self, engine: Engine, intervals: Optional[dict] = None,
+                 monitor: LoadMonitor = load_monitor):
+        self.engine = engine
+        self.intervals = dict(MAINTENANCE_INTERVALS if intervals is None else intervals)
+        self.monitor = monitor
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{id(self)}"
+        self._next_due: dict[str, float] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.status: dict[str, dict] = {}
+
+    def _claim(self, task: str, interval: float, now: float) -> bool:
+        """Reclamar la ejecución de una tarea para este worker (False si no toca o la tiene otro)"""
+        params = {"name": f"maintenance:{task}"}
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO job_checkpoints (name, last_id, processed, params, finished, updated_at) "
+                "VALUES (:name, 0, 0, NULL, 0, 0) ON CONFLICT(name) DO NOTHING"
+            ), params)
+            claimed = conn.execute(text(
+                "UPDATE job_checkpoints SET updated_at = :now, processed = processed + 1, params = :owner "
+                "WHERE name = :name AND updated_at <= :due"
+            ), {**params, "now": now, "due": now - interval,
+                "owner": json.dumps({"owner": self.owner})}).rowcount == 1
+            if not claimed:
+                last_run = conn.execute(text(
+                    "SELECT updated_at FROM job_checkpoints WHERE name = :name"
+                ), params).scalar()
+                self._next_due[task] = last_run + interval
+        if claimed:
+            self._next_due[task] = now + interval
+        return claimed
+
+    def run_pending(self, now: Optional[float] = None) -> list[str]:
+        """Ejecutar las tareas que tocan (si la carga lo permite); devuelve las ejecutadas"""
+        if self.engine.dialect.name != "sqlite":
+            return []
+        now = time.time() if now is None else now
+        size = wal_size(self.engine)
+        set_sqlite_wal_size(size)
+        low_load = self.monitor.rate(now) <= MAINTENANCE_MAX_RPS
+        ran = []
+        for task, interval in self.intervals.items():
+            urgent = task == "wal_checkpoint" and size > MAINTENANCE_WAL_MAX_BYTES
+            if urgent:
+                # Con carga no se espera a la ventana, pero sí se evita repetirlo en cada tick
+                interval = min(interval, MAINTENANCE_TICK_SECONDS)
+            elif not low_load:
+                continue
+            if self._next_due.get(task, 0) > now or not self._claim(task, interval, now):
+                continue
+            self._run(task)
+            ran.append(task)
+        if ran:
+            set_sqlite_wal_size(wal_size(self.engine))
+        return ran
+
+    def _busy(self) -> bool:
+        return self.monitor.rate() > MAINTENANCE_MAX_RPS
+
+    def _run(self, task: str):
+        started = time.perf_counter()
+        try:
+            if task in PAUSABLE_TASKS:
+                result = TASKS[task](self.engine, should_pause=self._busy)
+            else:
+                result = TASKS[task](self.engine)
+            ok = True
+        except Exception as e:
+            result = {"error": str(e)}
+            ok = False
+            app_logger.error(f"Mantenimiento {task} fallido: {e}")
+        duration = time.perf_counter() - started
+        record_maintenance_task(task, duration, ok)
+        if result.get("pages_reclaimed"):
+            record_pages_reclaimed(result["pages_reclaimed"])
+        self.status[task] = {
+            "last_run": datetime.now(timezone.utc).isoformat(),
+            "duration_seconds": round(duration, 3), "ok": ok, **result,
+        }
+        app_logger.info(f"Mantenimiento {task}: {duration:.2f} s {result}")
+
+    def start(self):
+        """Hilo daemon del programador (no hace nada si MAINTENANCE_ENABLED=false)"""
+        if not MAINTENANCE_ENABLED or self._thread is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(MAINTENANCE_TICK_SECONDS):
+                try:
+                    self.run_pending()
+                except Exception as e:
+                    app_logger.error(f"Programador de mantenimiento: {e}")
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name="maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+
+_scheduler: Optional[MaintenanceScheduler] = None
+
+
+def get_maintenance_scheduler() -> MaintenanceScheduler:
+    """Programador global del proceso, sobre la BD principal"""
+    global _scheduler
+    if _scheduler is None:
+        from database import engine
+        _scheduler = MaintenanceScheduler(engine)
+    return _scheduler
@@ -7,7 +7,7 @@ from prometheus_client import Counter, Histogram, Gauge, Info, generate_latest,
 from prometheus_client.exposition import start_http_server
 import time
 from functools import wraps
-from typing import Callable
+from typing import Callable, Optional
 import psutil
 import os
 
@@ -87,7 +87,87 @@ confidence_scores = Histogram(
     buckets=(0.0, 0.2, 0.4, 0.6, 0.8, 0.9, 0.95, 1.0)
 )
 
+password_hash_queue_seconds = Histogram(
+    'password_hash_queue_seconds',
+    'Tiempo de espera en cola del executor de bcrypt',
+    ['operation'],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+
+password_hash_duration_seconds = Histogram(
+    'password_hash_duration_seconds',
+    'Duración de hash/verificación bcrypt',
+    ['operation'],
+    buckets=(0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0)
+)
+
+password_hash_rejected_total = Counter(
+    'password_hash_rejected_total',
+    'Operaciones bcrypt rechazadas por sobrecarga (503)',
+    ['operation']
+)
+
+reencryption_rows_total = Counter(
+    'reencryption_rows_total',
+    'Filas procesadas por el trabajo de re-encriptación',
+    ['result']
+)
+
+maintenance_task_duration_seconds = Histogram(
+    'maintenance_task_duration_seconds',
+    'Duración de las tareas de mantenimiento de la BD',
+    ['task', 'result'],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0)
+)
+
+maintenance_pages_reclaimed_total = Counter(
+    'maintenance_pages_reclaimed_total',
+    'Páginas de SQLite devueltas al sistema por incremental_vacuum'
+)
+
+backup_duration_seconds = Histogram(
+    'backup_duration_seconds',
+    'Duración de las copias de seguridad (copia, verificación y compresión)',
+    ['result'],
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0)
+)
+
 # Gauges
+sqlite_wal_size_bytes = Gauge(
+    'sqlite_wal_size_bytes',
+    'Tamaño del archivo WAL de la BD principal'
+)
+
+backup_size_bytes = Gauge(
+    'backup_size_bytes',
+    'Tamaño comprimido de la última copia de seguridad'
+)
+
+backup_last_success_timestamp = Gauge(
+    'backup_last_success_timestamp',
+    'Hora (epoch) de la última copia de seguridad verificada'
+)
+
+reencryption_progress_ratio = Gauge(
+    'reencryption_progress_ratio',
+    'Progreso del trabajo de re-encriptación (0-1)'
+)
+
+reencryption_rows_per_second = Gauge(
+    'reencryption_rows_per_second',
+    'Throughput del trabajo de re-encriptación'
+)
+
+reencryption_last_id = Gauge(
+    'reencryption_last_id',
+    'Último id de usuario procesado por la re-encriptación'
+)
+
+password_hash_in_flight = Gauge(
+    'password_hash_in_flight',
+    'Operaciones bcrypt en ejecución o en cola'
+)
+
 active_database_connections = Gauge(
     'active_database_connections',
     'Conexiones activas a la base de datos'
@@ -225,11 +305,19 @@ def record_palette_created(sentiment_type: str, method: str,
     sentiment_polarity.observe(polarity)
     confidence_scores.observe(confidence)
 
-def record_palette_deleted(deletion_type: str = "manual"):
-    """Registrar eliminación de paleta"""
+def record_palettes_imported(by_sentiment: dict):
+    """Registrar paletas importadas en bloque ({sentimiento: cantidad})"""
+    for sentiment_type, count in by_sentiment.items():
+        palettes_created_total.labels(
+            sentiment_type=sentiment_type,
+            analysis_method="import"
+        ).inc(count)
+
+def record_palette_deleted(deletion_type: str = "manual", count: int = 1):
+    """Registrar eliminación de paleta (count > 1 para borrados masivos)"""
     palettes_deleted_total.labels(
         deletion_type=deletion_type
-    ).inc()
+    ).inc(count)
 
 def record_api_request(endpoint: str, method: str, status: int):
     """Registrar request a la API"""
@@ -257,6 +345,42 @@ def record_translation(source_lang: str, target_lang: str):
         target_lang=target_lang
     ).inc()
 
+def record_password_hash(operation: str, queue_time: float, duration: float):
+    """Registrar una operación del executor de contraseñas"""
+    password_hash_queue_seconds.labels(operation=operation).observe(queue_time)
+    password_hash_duration_seconds.labels(operation=operation).observe(duration)
+
+def record_password_hash_rejected(operation: str):
+    """Registrar una operación rechazada por sobrecarga"""
+    password_hash_rejected_total.labels(operation=operation).inc()
+
+def record_reencryption_chunk(updated: int, skipped: int, failed: int,
+                              progress: float, rows_per_second: float, last_id: int):
+    """Registrar un lote del trabajo de re-encriptación"""
+    reencryption_rows_total.labels(result="updated").inc(updated)
+    reencryption_rows_total.labels(result="skipped").inc(skipped)
+    reencryption_rows_total.labels(result="failed").inc(failed)
+    reencryption_progress_ratio.set(progress)
+    reencryption_rows_per_second.set(rows_per_second)
+    reencryption_last_id.set(last_id)
+
+def record_maintenance_task(task: str, duration: float, ok: bool):
+    """Registrar una ejecución del programador de mantenimiento"""
+    maintenance_task_duration_seconds.labels(task=task, result="ok" if ok else "error").observe(duration)
+
+def record_pages_reclaimed(pages: int):
+    maintenance_pages_reclaimed_total.inc(pages)
+
+def set_sqlite_wal_size(size: int):
+    sqlite_wal_size_bytes.set(size)
+
+def record_backup(duration: float, size: Optional[int]):
+    """Registrar una copia de seguridad (size=None si falló)"""
+    backup_duration_seconds.labels(result="error" if size is None else "ok").observe(duration)
+    if size is not None:
+        backup_size_bytes.set(size)
+        backup_last_success_timestamp.set(time.time())
+
 def update_system_metrics():
     """Actualizar métricas del sistema"""
     cpu_percent = psutil.cpu_percent(interval=1)
@@ -269,10 +393,10 @@ def update_system_metrics():
     system_disk_usage.labels(mount_point='/').set(disk.percent)
 
 def update_database_metrics(db_session):
-    """Actualizar métricas de base de datos"""
+    """Actualizar métricas de base de datos (lee el contador incremental, sin COUNT(*))"""
     try:
-        from models import Palette
-        total = db_session.query(Palette).count()
+        from counters import get_counters, PALETTES_TOTAL
+        total = get_counters(db_session, PALETTES_TOTAL).get(PALETTES_TOTAL, 0)
         total_palettes_in_db.set(total)
     except Exception:
         pass
@@ -2,10 +2,11 @@
 Modelos de base de datos para autenticación y usuarios
 """
 
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database import Base
+from encryption import encrypted_property
 
 class User(Base):
     """Modelo de Usuario con roles y permisos"""
@@ -21,13 +22,23 @@ class User(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     last_login = Column(DateTime(timezone=True), nullable=True)
     
-    # Datos personales encriptados
-    phone = Column(String, nullable=True)  # Encriptado
-    address = Column(String, nullable=True)  # Encriptado
+    # Datos personales encriptados (columnas con el texto cifrado)
+    phone_encrypted = Column("phone", String, nullable=True)
+    address_encrypted = Column("address", String, nullable=True)
+    # Acceso en texto plano: se cifra al asignar y se descifra solo al leer
+    phone = encrypted_property("phone_encrypted")
+    address = encrypted_property("address_encrypted")
     
     # Relación con paletas
     palettes = relationship("PaletteWithUser", back_populates="owner")
 
+    # Listado de administración: filtros + paginación por id (keyset)
+    __table_args__ = (
+        Index("ix_users_role_id", "role", "id"),
+        Index("ix_users_is_active_id", "is_active", "id"),
+        Index("ix_users_created_at", "created_at"),
+    )
+
 class PaletteWithUser(Base):
     """Modelo de Paleta extendido con relación a usuario"""
     __tablename__ = "palettes_with_users"
@@ -47,4 +58,99 @@ class PaletteWithUser(Base):
     
     # Relación con usuario
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    owner = relationship("User", back_populates="palettes")
\ No newline at end of file
+    owner = relationship("User", back_populates="palettes")
+
+    # Galería por usuario y borrados masivos por usuario o rango de fechas
+    __table_args__ = (
+        Index("ix_palettes_with_users_user_id_id", "user_id", "id"),
+        Index("ix_palettes_with_users_created_at", "created_at"),
+    )
+
+class RevokedToken(Base):
+    """Revocación de tokens: por jti (logout) o de todos los tokens de un usuario (jti NULL)"""
+    __tablename__ = "revoked_tokens"
+    # AUTOINCREMENT: ids monotónicos para la sincronización incremental entre workers
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True)
+    jti = Column(String, unique=True, nullable=True)
+    user_id = Column(Integer, index=True, nullable=True)
+    revoked_at = Column(Float, nullable=False)  # epoch, segundos
+    expires_at = Column(Float, index=True, nullable=False)  # después de esto se puede purgar
+
+class RefreshToken(Base):
+    """Refresh token rotativo (solo se guarda su hash SHA-256)"""
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True)
+    token_hash = Column(String, unique=True, index=True, nullable=False)
+    # Todas las rotaciones de un mismo login comparten familia (detección de reuso)
+    family_id = Column(String, index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
+    issued_at = Column(Float, nullable=False)  # epoch, segundos
+    expires_at = Column(Float, index=True, nullable=False)
+    revoked_at = Column(Float, nullable=True)
+
+class UserPermissionOverride(Base):
+    """Permiso concedido o denegado a un usuario por encima de su rol"""
+    __tablename__ = "user_permission_overrides"
+    __table_args__ = (UniqueConstraint("user_id", "permission"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
+    permission = Column(String, nullable=False)
+    granted = Column(Boolean, nullable=False)  # True = concedido, False = denegado
+
+class JobCheckpoint(Base):
+    """Progreso de trabajos por lotes reanudables (re-encriptación, migraciones, etc.)"""
+    __tablename__ = "job_checkpoints"
+
+    name = Column(String, primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)  # keyset: último id procesado
+    processed = Column(Integer, nullable=False, default=0)
+    params = Column(String, nullable=True)  # JSON con los parámetros del trabajo
+    finished = Column(Boolean, nullable=False, default=False)
+    updated_at = Column(Float, nullable=False)  # epoch, segundos
+
+class StatCounter(Base):
+    """Contadores incrementales mantenidos por triggers (ver counters.py)"""
+    __tablename__ = "stat_counters"
+
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+class _SentimentRollup:
+    """Agregados de sentimiento por intervalo (ver rollups.py); user_id 0 = global"""
+    user_id = Column(Integer, primary_key=True)
+    bucket = Column(String, primary_key=True)  # 'YYYY-MM-DD HH:00' o 'YYYY-MM-DD' (UTC)
+    sentiment_label = Column(String, primary_key=True)
+    analysis_method = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    polarity_n = Column(Integer, nullable=False, default=0)  # filas con polaridad
+    polarity_sum = Column(Float, nullable=False, default=0.0)
+    polarity_sumsq = Column(Float, nullable=False, default=0.0)
+    confidence_n = Column(Integer, nullable=False, default=0)
+    confidence_sum = Column(Float, nullable=False, default=0.0)
+    confidence_sumsq = Column(Float, nullable=False, default=0.0)
+
+class SentimentRollupHourly(_SentimentRollup, Base):
+    __tablename__ = "sentiment_rollup_hourly"
+
+class SentimentRollupDaily(_SentimentRollup, Base):
+    __tablename__ = "sentiment_rollup_daily"
+
+class UserProfile(Base):
+    """Perfil emocional acumulado por usuario (ver profiles.py); se actualiza por paleta"""
+    __tablename__ = "user_profiles"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    palettes = Column(Integer, nullable=False, default=0)
+    polarity_n = Column(Integer, nullable=False, default=0)
+    polarity_sum = Column(Float, nullable=False, default=0.0)
+    # Ánimo reciente: media de polaridad con peso exp(-(mood_at - t) / tau), referida a mood_at
+    mood_sum = Column(Float, nullable=False, default=0.0)
+    mood_weight = Column(Float, nullable=False, default=0.0)
+    mood_at = Column(Float, nullable=False, default=0.0)  # epoch, segundos
+    sentiments = Column(String, nullable=False, default="{}")  # JSON {etiqueta: n}
+    hues = Column(String, nullable=False, default="[]")  # JSON: colores por sector de tono
+    updated_at = Column(Float, nullable=False)  # epoch, segundos
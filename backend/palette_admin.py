@@ -0,0 +1,76 @@
+"""
+Borrado masivo de paletas
+DELETE por conjuntos en lotes cortos: cada lote es su propia transacción para que el
+lock de escritura de SQLite no bloquee al resto de la API durante un borrado grande
+"""
+
+from datetime import datetime
+from typing import Optional
+from sqlalchemy.orm import Session
+import os
+
+import models_auth
+from metrics import record_palette_deleted
+from profiles import update_profiles
+
+PALETTE_DELETE_CHUNK_SIZE = int(os.getenv("PALETTE_DELETE_CHUNK_SIZE", "500"))
+
+
+def palette_filter_conditions(user_id: Optional[int] = None,
+                              created_from: Optional[datetime] = None,
+                              created_to: Optional[datetime] = None,
+                              sentiment: Optional[str] = None) -> list:
+    """Condiciones SQL de la selección de paletas"""
+    Palette = models_auth.PaletteWithUser
+    conditions = []
+    if user_id is not None:
+        conditions.append(Palette.user_id == user_id)
+    if created_from is not None:
+        conditions.append(Palette.created_at >= created_from)
+    if created_to is not None:
+        conditions.append(Palette.created_at < created_to)
+    if sentiment is not None:
+        conditions.append(Palette.sentiment_label == sentiment)
+    return conditions
+
+
+def _delete_chunk(db: Session, ids: list[int]) -> int:
+    Palette = models_auth.PaletteWithUser
+    # Los perfiles restan lo que sumaron estas paletas, en la misma transacción
+    update_profiles(db, db.query(Palette.user_id, Palette.polarity, Palette.sentiment_label,
+                                 Palette.colors, Palette.created_at).filter(Palette.id.in_(ids)).all(), sign=-1)
+    deleted = db.query(Palette).filter(Palette.id.in_(ids)).delete(synchronize_session=False)
+    db.commit()
+    record_palette_deleted("bulk", deleted)
+    return deleted
+
+
+def bulk_delete_palettes(db: Session, ids: Optional[list[int]] = None, conditions: list = (),
+                         chunk_size: Optional[int] = None) -> int:
+    """
+    Borrar paletas por lista de ids y/o condiciones; devuelve cuántas se borraron
+
+    Se avanza por id (keyset) para no volver a recorrer filas que no coinciden.
+    """
+    Palette = models_auth.PaletteWithUser
+    chunk_size = chunk_size or PALETTE_DELETE_CHUNK_SIZE
+    deleted = 0
+    if ids is not None:
+        ids = sorted(set(ids))
+        for i in range(0, len(ids), chunk_size):
+            chunk = ids[i:i + chunk_size]
+            if conditions:
+                chunk = [row.id for row in db.query(Palette.id).filter(Palette.id.in_(chunk), *conditions)]
+            if chunk:
+                deleted += _delete_chunk(db, chunk)
+        return deleted
+
+    last_id = 0
+    while True:
+        chunk = [row.id for row in db.query(Palette.id).filter(
+            Palette.id > last_id, *conditions
+        ).order_by(Palette.id).limit(chunk_size)]
+        if not chunk:
+            return deleted
+        deleted += _delete_chunk(db, chunk)
+        last_id = chunk[-1]
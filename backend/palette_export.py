@@ -0,0 +1,111 @@
+"""
+Exportación en streaming del historial de paletas (NDJSON / CSV)
+Cursor del lado del servidor con proyección de columnas: la memoria no depende del número de filas
+"""
+
+from typing import Iterator, Optional, Sequence, Union
+from itertools import chain
+from sqlalchemy import String, select, type_coerce
+from sqlalchemy.engine import Engine
+from json.encoder import encode_basestring
+import csv
+import io
+import zlib
+
+import models_auth
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+# Filas por lote del cursor y bytes acumulados antes de enviar un trozo al cliente
+EXPORT_YIELD_PER = 2000
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+_P = models_auth.PaletteWithUser
+EXPORT_COLUMNS = (
+    _P.id, _P.user_id, _P.input_text, _P.translated_text, _P.polarity, _P.colors,
+    _P.sentiment_label, _P.intensity, _P.emotion_type, _P.confidence_score,
+    _P.analysis_method,
+    # Texto tal cual está guardado: evita parsear un datetime por fila solo para volver a formatearlo
+    type_coerce(_P.created_at, String).label("created_at"),
+)
+FIELDNAMES = [column.key for column in EXPORT_COLUMNS]
+
+
+def _rows(engine: Engine, user_id: Optional[int]) -> Iterator[tuple]:
+    """Filas como tuplas, por lotes de EXPORT_YIELD_PER (conexión propia del generador)"""
+    query = select(*EXPORT_COLUMNS).order_by(_P.id)
+    if user_id is not None:
+        query = query.where(_P.user_id == user_id)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=EXPORT_YIELD_PER).execute(query)
+        for partition in result.partitions():
+            yield from partition
+
+
+def _iso(value):
+    """'YYYY-MM-DD HH:MM:SS[.ffffff]' (SQLite) o datetime -> ISO 8601, como el resto de la API"""
+    if value is None:
+        return None
+    return value.replace(" ", "T", 1) if isinstance(value, str) else value.isoformat()
+
+
+def _json(value) -> str:
+    if value is None:
+        return "null"
+    return encode_basestring(value) if isinstance(value, str) else str(value)
+
+
+# Las columnas son fijas: armar cada línea con una plantilla es ~4x más rápido que
+# json.dumps(dict(...)) por fila (encode_basestring es el escape en C de json)
+_NDJSON_LINE = "{{" + ",".join(f'"{name}":{{}}' for name in FIELDNAMES) + "}}\n"
+
+
+def _ndjson(rows: Iterator[tuple]) -> Iterator[str]:
+    line, js = _NDJSON_LINE.format, _json
+    for row in rows:
+        *values, created_at = row
+        yield line(*map(js, values), js(_iso(created_at)))
+
+
+def _csv(rows: Iterator[tuple]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDNAMES)
+    created_at = len(FIELDNAMES) - 1
+    for row in rows:
+        row = list(row)
+        row[created_at] = _iso(row[created_at])
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def export_palettes(engine: Union[Engine, Sequence[Engine]], fmt: str, user_id: Optional[int] = None,
+                    compress: bool = False) -> Iterator[bytes]:
+    """
+    Generador de bytes para StreamingResponse
+
+    Args:
+        engine: BD de paletas, o varias (particiones: se exportan una tras otra)
+        user_id: Solo paletas de este usuario (None = todas)
+        compress: Emitir gzip incremental (Content-Encoding: gzip)
+    """
+    engines = engine if isinstance(engine, (list, tuple)) else [engine]
+    rows = chain.from_iterable(_rows(e, user_id) for e in engines)
+    lines = (_ndjson if fmt == "ndjson" else _csv)(rows)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    pending, size = [], 0
+    for line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            data = "".join(pending).encode()
+            pending, size = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = "".join(pending).encode()
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
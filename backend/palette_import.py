@@ -0,0 +1,325 @@
+"""
+Importación en streaming de paletas (NDJSON / CSV)
+Lee la subida fila a fila, valida con un esquema ligero e inserta por lotes con executemany.
+Cada lote se confirma junto con el checkpoint de la importación: volver a subir el mismo
+archivo con el mismo import_id salta las filas ya confirmadas.
+"""
+
+from collections import Counter
+from datetime import datetime, timezone
+from itertools import islice
+from typing import IO, Iterator, Optional
+from sqlalchemy.orm import Session
+import csv
+import io
+import json
+import os
+import re
+
+import counters, rollups, search  # noqa: F401  (registran sus appliers de inserción masiva)
+import models_auth
+from color_generator import AdvancedColorGenerator
+from jobs import load_checkpoint, save_checkpoint
+from metrics import record_palettes_imported
+from profiles import PaletteSample, update_profiles
+from sentiment import ENHANCED_PALETTES, get_enhanced_sentiment, score_many
+from triggers import deferred_palette_triggers
+
+IMPORT_FORMATS = ("ndjson", "csv")
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+# Errores detallados en la respuesta (el resto solo se cuentan como rechazados)
+IMPORT_MAX_ERRORS = 100
+IMPORT_MAX_TEXT = 1000
+
+# Hasta 10 colores #rrggbb separados por comas: una sola expresión por fila
+_COLORS = re.compile(r"#[0-9a-fA-F]{6}(?:,#[0-9a-fA-F]{6}){0,9}")
+_IMPORT_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+# Etiquetas de la métrica: las del analizador; cualquier otra cuenta como "other"
+_METRIC_LABELS = frozenset(key.replace("_", " ") for key in ENHANCED_PALETTES)
+
+# Columnas del INSERT, en el orden de las tuplas de _insert_params
+_COLUMNS = (
+    "input_text", "translated_text", "polarity", "confidence_score", "colors",
+    "sentiment_label", "intensity", "emotion_type", "analysis_method", "created_at", "user_id",
+)
+
+
+class InvalidImport(ValueError):
+    """Archivo, formato o import_id inválidos: la importación se detiene"""
+
+
+class InvalidRow(ValueError):
+    """Fila rechazada: se cuenta y la importación sigue"""
+
+
+# ============================================================================
+# ESQUEMA DE FILA
+# ============================================================================
+
+def _text(raw: dict, field: str, required: bool = False, max_length: int = IMPORT_MAX_TEXT) -> Optional[str]:
+    value = raw.get(field)
+    if value is None or value == "":
+        if required:
+            raise InvalidRow(f"{field}: requerido")
+        return None
+    if not isinstance(value, str):
+        raise InvalidRow(f"{field}: debe ser texto")
+    value = value.strip()
+    if len(value) > max_length:
+        raise InvalidRow(f"{field}: excede {max_length} caracteres")
+    return value or None
+
+
+def _number(raw: dict, field: str, low: float, high: float) -> Optional[float]:
+    value = raw.get(field)
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise InvalidRow(f"{field}: debe ser numérico")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise InvalidRow(f"{field}: debe ser numérico") from None
+    if not low <= number <= high:  # NaN tampoco pasa
+        raise InvalidRow(f"{field}: fuera de rango [{low}, {high}]")
+    return number
+
+
+def _colors(raw: dict) -> Optional[str]:
+    value = raw.get("colors")
+    if value is None or value == "" or value == []:
+        return None
+    if isinstance(value, list) and all(isinstance(color, str) for color in value):
+        value = ",".join(value)
+    if not isinstance(value, str) or not _COLORS.fullmatch(value := value.replace(" ", "")):
+        raise InvalidRow("colors: se esperan hasta 10 colores #rrggbb")
+    return value
+
+
+def _timestamp(value: datetime) -> str:
+    # Mismo formato que DateTime de SQLAlchemy en SQLite (las filas van por executemany directo)
+    return value.isoformat(" ", "microseconds")
+
+
+def _created_at(raw: dict) -> Optional[str]:
+    value = raw.get("created_at")
+    if value is None or value == "":
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise InvalidRow("created_at: fecha ISO 8601 inválida") from None
+    # Se guarda en UTC sin zona, como CURRENT_TIMESTAMP
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    elif len(value) in (19, 26) and value[10] in "T ":
+        # Ya viene como 'YYYY-MM-DD[T ]HH:MM:SS[.ffffff]': reformatear costaría más que validar
+        return value.replace("T", " ", 1)
+    return _timestamp(parsed)
+
+
+def validate_row(raw, require_colors: bool = True) -> dict:
+    """
+    Validar y normalizar una fila de importación
+
+    Solo input_text es obligatorio (y colors, salvo que se recalculen). Los números
+    pueden venir como texto: así se aceptan los archivos generados por /palettes/export.
+    """
+    if not isinstance(raw, dict):
+        raise InvalidRow("se esperaba un objeto")
+    input_text = _text(raw, "input_text", required=True)
+    if input_text is None or len(input_text) < 2:
+        raise InvalidRow("input_text: debe tener al menos 2 caracteres")
+    colors = _colors(raw)
+    if colors is None and require_colors:
+        raise InvalidRow("colors: requerido (o importar con recompute=true)")
+    return {
+        "input_text": input_text,
+        "translated_text": _text(raw, "translated_text"),
+        "polarity": _number(raw, "polarity", -1.0, 1.0),
+        "confidence_score": _number(raw, "confidence_score", 0.0, 1.0),
+        "colors": colors,
+        "sentiment_label": _text(raw, "sentiment_label", max_length=32),
+        "intensity": _text(raw, "intensity", max_length=32),
+        "emotion_type": _text(raw, "emotion_type", max_length=64),
+        "analysis_method": _text(raw, "analysis_method", max_length=32) or "import",
+        "created_at": _created_at(raw),
+    }
+
+
+# ============================================================================
+# LECTURA INCREMENTAL
+# ============================================================================
+
+def _ndjson_records(text: IO[str]) -> Iterator:
+    """Líneas no vacías; json.loads se aplica al validar (las filas ya importadas no se parsean)"""
+    return (line for line in text if not line.isspace())
+
+
+def _csv_records(text: IO[str]) -> Iterator:
+    reader = csv.DictReader(text)
+    if not reader.fieldnames or "input_text" not in reader.fieldnames:
+        raise InvalidImport("El CSV debe tener encabezado con la columna input_text")
+    return reader
+
+
+# ============================================================================
+# RECÁLCULO Y ESCRITURA
+# ============================================================================
+
+def fill_missing(rows: list[dict], method: str = "hybrid"):
+    """Completar polaridad/sentimiento y colores que falten, por lotes y sin traducir"""
+    unscored = [row for row in rows if row["polarity"] is None]
+    if unscored:
+        scores = score_many((row["translated_text"] or row["input_text"] for row in unscored), method)
+        for row, (polarity, confidence) in zip(unscored, scores):
+            row["polarity"] = polarity
+            if row["confidence_score"] is None:
+                row["confidence_score"] = confidence
+    for row in rows:
+        if row["sentiment_label"] is None and row["polarity"] is not None:
+            confidence = row["confidence_score"] if row["confidence_score"] is not None else 1.0
+            label, intensity, palette_info = get_enhanced_sentiment(row["polarity"], confidence)
+            row["sentiment_label"] = label
+            row["intensity"] = row["intensity"] or intensity
+            row["emotion_type"] = row["emotion_type"] or palette_info["emotion"]
+    for row in rows:
+        if row["colors"] is None:
+            # Solo los colores: sin descripción ni significados de generate_advanced_colors
+            confidence = row["confidence_score"] if row["confidence_score"] is not None else 0.5
+            row["colors"] = ",".join(AdvancedColorGenerator.generate_colors(row["sentiment_label"] or "neutral", confidence))
+
+
+def _insert_sql(dialect) -> str:
+    mark = "?" if dialect.paramstyle == "qmark" else "%s"
+    return (f"INSERT INTO {models_auth.PaletteWithUser.__tablename__} ({', '.join(_COLUMNS)}) "
+            f"VALUES ({', '.join([mark] * len(_COLUMNS))})")
+
+
+def _insert_params(rows: list[dict], user_id: int) -> list[tuple]:
+    """
+    Tuplas para executemany del driver, con el formato de /analyze (números como texto)
+
+    Se salta el procesamiento de parámetros de SQLAlchemy: con lotes grandes era
+    casi la mitad del tiempo de la importación.
+    """
+    now = _timestamp(datetime.now(timezone.utc).replace(tzinfo=None))
+    return [(
+        row["input_text"], row["translated_text"],
+        None if row["polarity"] is None else f"{row['polarity']:.3f}",
+        None if row["confidence_score"] is None else str(row["confidence_score"]),
+        row["colors"], row["sentiment_label"], row["intensity"], row["emotion_type"],
+        row["analysis_method"], row["created_at"] or now, user_id,
+    ) for row in rows]
+
+
+def _checkpoint_name(owner_id: int, import_id: str) -> str:
+    return f"import:{owner_id}:{import_id}"
+
+
+def check_import_id(import_id: str) -> str:
+    if not _IMPORT_ID.fullmatch(import_id or ""):
+        raise InvalidImport("import_id: 1 a 64 caracteres [A-Za-z0-9_-]")
+    return import_id
+
+
+def _status(import_id: str, checkpoint: models_auth.JobCheckpoint, errors: Optional[list] = None) -> dict:
+    status = {
+        "import_id": import_id,
+        "state": "finished" if checkpoint.finished else "in_progress",
+        "rows": checkpoint.last_id,
+        "inserted": checkpoint.processed,
+        "rejected": checkpoint.last_id - checkpoint.processed,
+        "updated_at": datetime.fromtimestamp(checkpoint.updated_at, timezone.utc).isoformat(),
+    }
+    if errors is not None:
+        status["errors"] = errors
+    return status
+
+
+def import_palettes(db: Session, stream: IO[bytes], fmt: str, import_id: str, owner_id: int,
+                    user_id: int, recompute: bool = False, method: str = "hybrid",
+                    batch_size: Optional[int] = None) -> dict:
+    """
+    Importar paletas desde un archivo binario, sin cargarlo entero en memoria
+
+    Args:
+        import_id: Identificador de la importación (clave del checkpoint junto con owner_id)
+        owner_id: Usuario que sube el archivo
+        user_id: Dueño de las paletas importadas
+        recompute: Calcular sentimiento y colores que falten (si no, colors es obligatorio)
+
+    Returns:
+        Estado de la importación con los primeros IMPORT_MAX_ERRORS errores de esta subida
+    """
+    if fmt not in IMPORT_FORMATS:
+        raise InvalidImport(f"Formato no soportado: {fmt}")
+    check_import_id(import_id)
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    checkpoint = load_checkpoint(db, _checkpoint_name(owner_id, import_id), {
+        "user_id": user_id, "format": fmt, "recompute": recompute, "method": method,
+    })
+    if checkpoint.finished:
+        return _status(import_id, checkpoint, errors=[])
+
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="" if fmt == "csv" else None)
+    insert_sql = _insert_sql(db.get_bind().dialect)
+
+    errors = []
+    try:
+        records = _ndjson_records(text) if fmt == "ndjson" else _csv_records(text)
+        parse = json.loads if fmt == "ndjson" else None
+        # Reanudar: las filas ya confirmadas se leen pero no se validan
+        row_number = checkpoint.last_id
+        for _ in islice(records, row_number):
+            pass
+
+        while True:
+            batch, consumed = [], 0
+            for record in islice(records, batch_size):
+                consumed += 1
+                try:
+                    batch.append(validate_row(parse(record) if parse else record,
+                                              require_colors=not recompute))
+                except ValueError as e:  # InvalidRow o JSON mal formado
+                    if len(errors) < IMPORT_MAX_ERRORS:
+                        errors.append({"row": row_number + consumed, "error": str(e)})
+            if not consumed:
+                break
+            if recompute:
+                fill_missing(batch, method)
+            if batch:
+                # Contadores, índice de búsqueda y agregados: una sentencia por lote, no por fila
+                params = _insert_params(batch, user_id)
+                connection = db.connection()
+                with deferred_palette_triggers(connection):
+                    connection.exec_driver_sql(insert_sql, params)
+                update_profiles(db, (PaletteSample(user_id, p[2], p[5], p[4], p[9]) for p in params))
+            row_number += consumed
+            # El lote y su checkpoint se confirman juntos
+            save_checkpoint(db, checkpoint, row_number, len(batch))
+            db.commit()
+            record_palettes_imported(Counter(
+                row["sentiment_label"] if row["sentiment_label"] in _METRIC_LABELS else "other"
+                for row in batch
+            ))
+
+        save_checkpoint(db, checkpoint, row_number, 0, finished=True)
+        db.commit()
+    except UnicodeDecodeError:
+        db.rollback()
+        raise InvalidImport(f"El archivo no es UTF-8 válido (después de la fila {checkpoint.last_id})") from None
+    except csv.Error as e:
+        db.rollback()
+        raise InvalidImport(f"CSV mal formado (después de la fila {checkpoint.last_id}): {e}") from None
+    finally:
+        text.detach()  # el archivo lo cierra quien lo abrió
+    return _status(import_id, checkpoint, errors)
+
+
+def import_status(db: Session, owner_id: int, import_id: str) -> Optional[dict]:
+    """Progreso de una importación (None si no existe)"""
+    checkpoint = db.get(models_auth.JobCheckpoint, _checkpoint_name(owner_id, check_import_id(import_id)))
+    if checkpoint is None:
+        return None
+    return _status(import_id, checkpoint)
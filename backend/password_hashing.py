@@ -0,0 +1,141 @@
+"""
+Executor dedicado para hasheo y verificación de contraseñas (bcrypt)
+Aísla bcrypt del threadpool compartido con concurrencia fija y rechazo rápido por sobrecarga
+Calibrar costo: python backend/password_hashing.py --objetivo-ms 250
+"""
+
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Optional
+from passlib.context import CryptContext
+import asyncio
+import threading
+import time
+import os
+
+from metrics import record_password_hash, record_password_hash_rejected, password_hash_in_flight
+
+# Costo bcrypt configurado; los hashes con otro costo se re-hashean al hacer login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Hilos dedicados a bcrypt (bcrypt libera el GIL) y máximo de operaciones en espera
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE_MAX = int(os.getenv("PASSWORD_HASH_QUEUE_MAX", "16"))
+
+# Contexto para hasheo de contraseñas (min = max = costo configurado => needs_update al cambiarlo)
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_desired_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_desired_rounds=BCRYPT_ROUNDS,
+)
+
+
+class PasswordHasherBusy(Exception):
+    """El executor de contraseñas está saturado"""
+
+
+class PasswordHasher:
+    """Executor acotado: `workers` operaciones en paralelo y hasta `max_pending` en cola"""
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS,
+                 max_pending: int = PASSWORD_HASH_QUEUE_MAX):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+
+    def submit(self, operation: str, func: Callable, *args) -> Future:
+        """Encolar una operación o lanzar PasswordHasherBusy sin esperar"""
+        if not self._slots.acquire(blocking=False):
+            record_password_hash_rejected(operation)
+            raise PasswordHasherBusy(operation)
+
+        enqueued_at = time.perf_counter()
+        password_hash_in_flight.inc()
+
+        def task():
+            started_at = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                record_password_hash(operation, started_at - enqueued_at,
+                                     time.perf_counter() - started_at)
+
+        def release(_future):
+            password_hash_in_flight.dec()
+            self._slots.release()
+
+        try:
+            future = self._executor.submit(task)
+        except BaseException:
+            release(None)
+            raise
+        future.add_done_callback(release)
+        return future
+
+    def hash(self, password: str) -> str:
+        return self.submit("hash", pwd_context.hash, password).result()
+
+    def verify(self, password: str, hashed: str) -> bool:
+        return self.submit("verify", pwd_context.verify, password, hashed).result()
+
+    def verify_and_update(self, password: str, hashed: str) -> tuple[bool, Optional[str]]:
+        """Verificar y, si el costo del hash difiere del configurado, devolver un hash nuevo"""
+        return self.submit("verify", pwd_context.verify_and_update, password, hashed).result()
+
+    # Variantes para endpoints async: esperan en el event loop, sin ocupar un hilo del threadpool
+    async def hash_async(self, password: str) -> str:
+        return await asyncio.wrap_future(self.submit("hash", pwd_context.hash, password))
+
+    async def verify_and_update_async(self, password: str, hashed: str) -> tuple[bool, Optional[str]]:
+        return await asyncio.wrap_future(
+            self.submit("verify", pwd_context.verify_and_update, password, hashed)
+        )
+
+
+# Instancia global
+password_hasher = PasswordHasher()
+
+
+def calibrate(target_ms: float, min_rounds: int = 8, max_rounds: int = 16,
+              samples: int = 3) -> tuple[int, dict]:
+    """
+    Medir bcrypt en este host y recomendar el costo
+
+    Returns:
+        (rounds recomendados, {rounds: ms promedio})
+    """
+    from passlib.hash import bcrypt
+
+    timings = {}
+    recommended = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        handler = bcrypt.using(rounds=rounds)
+        start = time.perf_counter()
+        for _ in range(samples):
+            handler.hash("calibracion-Password123")
+        timings[rounds] = (time.perf_counter() - start) / samples * 1000
+        if timings[rounds] <= target_ms:
+            recommended = rounds
+        else:
+            # Cada round duplica el costo: no tiene sentido seguir midiendo
+            break
+    return recommended, timings
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Calibrar el costo de bcrypt para este host")
+    parser.add_argument("--objetivo-ms", type=float, default=250.0,
+                        help="Latencia objetivo por hash en milisegundos")
+    parser.add_argument("--min-rounds", type=int, default=8)
+    parser.add_argument("--max-rounds", type=int, default=16)
+    args = parser.parse_args()
+
+    print(f"🔧 Calibrando bcrypt (objetivo: {args.objetivo_ms:.0f} ms)")
+    recommended, timings = calibrate(args.objetivo_ms, args.min_rounds, args.max_rounds)
+    for rounds, ms in timings.items():
+        marca = "  ←" if rounds == recommended else ""
+        print(f"   rounds={rounds:<3} {ms:8.1f} ms{marca}")
+    print("")
+    print(f"✅ Recomendado: BCRYPT_ROUNDS={recommended} (actual: {BCRYPT_ROUNDS})")
+    print(f"   Capacidad aprox. por worker: {1000 / timings[recommended]:.1f} logins/s")
@@ -0,0 +1,78 @@
+"""
+Política de autorización compilada
+Roles y permisos se compilan al importar a máscaras de bits: verificar un permiso es un AND
+"""
+
+from typing import Iterable
+import hashlib
+
+# Roles disponibles
+class UserRole:
+    ADMIN = "admin"
+    USER = "user"
+    VIEWER = "viewer"
+
+# Permisos por rol
+ROLE_PERMISSIONS = {
+    UserRole.ADMIN: [
+        "create_palette",
+        "delete_palette",
+        "view_palette",
+        "delete_all_palettes",
+        "view_stats",
+        "manage_users"
+    ],
+    UserRole.USER: [
+        "create_palette",
+        "delete_own_palette",
+        "view_palette",
+        "view_stats"
+    ],
+    UserRole.VIEWER: [
+        "view_palette",
+        "view_stats"
+    ]
+}
+
+# Internado de permisos: cada permiso conocido recibe una posición de bit (orden estable)
+PERMISSIONS = tuple(sorted({p for perms in ROLE_PERMISSIONS.values() for p in perms}))
+PERMISSION_BITS = {permission: 1 << i for i, permission in enumerate(PERMISSIONS)}
+
+# Versión de la política: cambia si cambia el conjunto de permisos (y por tanto los bits).
+# Los tokens la incluyen para no interpretar máscaras emitidas con otra asignación de bits.
+POLICY_VERSION = int.from_bytes(
+    hashlib.blake2b(",".join(PERMISSIONS).encode(), digest_size=4).digest(), "big"
+)
+
+
+class UnknownPermission(ValueError):
+    """Permiso que no existe en la política"""
+
+
+def permission_bit(permission: str) -> int:
+    """Bit de un permiso (falla al definir la ruta si el permiso no existe)"""
+    try:
+        return PERMISSION_BITS[permission]
+    except KeyError:
+        raise UnknownPermission(permission) from None
+
+
+def compile_mask(permissions: Iterable[str]) -> int:
+    """Compilar una lista de permisos a máscara"""
+    mask = 0
+    for permission in permissions:
+        mask |= permission_bit(permission)
+    return mask
+
+
+ROLE_MASKS = {role: compile_mask(perms) for role, perms in ROLE_PERMISSIONS.items()}
+
+
+def compile_user_mask(role: str, grants: Iterable[str] = (), denials: Iterable[str] = ()) -> int:
+    """Máscara efectiva: la del rol más permisos concedidos, menos los denegados"""
+    return (ROLE_MASKS.get(role, 0) | compile_mask(grants)) & ~compile_mask(denials)
+
+
+def mask_permissions(mask: int) -> list[str]:
+    """Lista de permisos de una máscara (para respuestas y depuración)"""
+    return [p for p in PERMISSIONS if mask & PERMISSION_BITS[p]]
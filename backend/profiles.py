@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Perfil emocional por usuario
+
+Una fila compacta por usuario (user_profiles) que se actualiza en O(1) por paleta, en la
+misma transacción que la crea o la borra: polaridad media, ánimo reciente, histograma de
+sentimientos y tonos favoritos. Nunca se recalcula desde el historial al leerlo.
+
+El ánimo reciente es una media de polaridad con pesos que decaen exponencialmente con la
+antigüedad de cada paleta (vida media PROFILE_MOOD_HALF_LIFE_HOURS). Se guarda como suma y
+peso referidos a un instante, así que un borrado resta exactamente lo que sumó su paleta.
+
+Reconciliación (si algo escribió paletas por fuera de la API):
+  python backend/profiles.py [--usuario NOMBRE] [--lote 5000]
+"""
+
+from collections import namedtuple
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Iterable, Optional
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+import colorsys
+import json
+import math
+import time
+import sys
+import os
+
+# Agregar el directorio backend al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+import models_auth
+from logger_config import app_logger
+
+PROFILE_MOOD_HALF_LIFE_HOURS = float(os.getenv("PROFILE_MOOD_HALF_LIFE_HOURS", "72"))
+PROFILE_REBUILD_CHUNK_SIZE = int(os.getenv("PROFILE_REBUILD_CHUNK_SIZE", "5000"))
+# Usuarios por transacción en la reconciliación (cada una bloquea las escrituras mientras lee)
+PROFILE_REBUILD_USERS = 100
+PROFILE_TOP_HUES = 3
+
+# Sectores de 30° centrados en cada tono
+HUE_NAMES = ("rojo", "naranja", "amarillo", "lima", "verde", "esmeralda",
+             "cian", "celeste", "azul", "violeta", "magenta", "rosa")
+_HUE_SECTOR = 360 / len(HUE_NAMES)
+# Grises, casi negros y casi blancos no tienen un tono que cuente
+_MIN_SATURATION = 0.15
+_MIN_LIGHTNESS, _MAX_LIGHTNESS = 0.08, 0.95
+
+_TAU = PROFILE_MOOD_HALF_LIFE_HOURS * 3600 / math.log(2)
+
+
+# Paleta sin modelo ORM (importación): los campos que usa el perfil
+PaletteSample = namedtuple("PaletteSample", "user_id polarity sentiment_label colors created_at")
+
+
+@lru_cache(maxsize=4096)
+def _hue_sector(color: str) -> Optional[int]:
+    """Sector de tono de un color '#rrggbb' (None si es gris o no es válido)"""
+    if len(color) != 7 or color[0] != "#":
+        return None
+    try:
+        r, g, b = (int(color[i:i + 2], 16) / 255 for i in (1, 3, 5))
+    except ValueError:
+        return None
+    hue, lightness, saturation = colorsys.rgb_to_hls(r, g, b)
+    if saturation < _MIN_SATURATION or not _MIN_LIGHTNESS <= lightness <= _MAX_LIGHTNESS:
+        return None
+    return int((hue * 360 + _HUE_SECTOR / 2) // _HUE_SECTOR) % len(HUE_NAMES)
+
+
+def palette_hues(colors: Optional[str]) -> list[int]:
+    """Sectores de tono de los colores de la paleta (se omiten los grises)"""
+    sectors = (_hue_sector(color.strip()) for color in (colors or "").split(","))
+    return [sector for sector in sectors if sector is not None]
+
+
+def _epoch(value) -> float:
+    """created_at (datetime o texto ISO, UTC) en segundos; sin valor, ahora"""
+    if value is None:
+        return time.time()
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _polarity(value) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _new_profile(user_id: int) -> models_auth.UserProfile:
+    return models_auth.UserProfile(
+        user_id=user_id, palettes=0, polarity_n=0, polarity_sum=0.0, mood_sum=0.0,
+        mood_weight=0.0, mood_at=0.0, sentiments="{}", hues=json.dumps([0] * len(HUE_NAMES)),
+        updated_at=time.time(),
+    )
+
+
+def _lock_profile(db: Session, user_id: int) -> models_auth.UserProfile:
+    """
+    Perfil del usuario con el bloqueo de escritura tomado (la fila se crea si falta)
+
+    El INSERT va antes de leer: en SQLite abre la transacción de escritura (FOR UPDATE no
+    existe), así dos requests del mismo usuario no leen el mismo perfil para pisarse luego.
+    """
+    db.execute(text(
+        "INSERT INTO user_profiles (user_id, palettes, polarity_n, polarity_sum, mood_sum, "
+        "mood_weight, mood_at, sentiments, hues, updated_at) "
+        "VALUES (:user_id, 0, 0, 0, 0, 0, 0, '{}', :hues, :now) ON CONFLICT(user_id) DO NOTHING"
+    ), {"user_id": user_id, "hues": json.dumps([0] * len(HUE_NAMES)), "now": time.time()})
+    return db.query(models_auth.UserProfile).filter(
+        models_auth.UserProfile.user_id == user_id
+    ).with_for_update().populate_existing().one()
+
+
+_FIELDS = ("palettes", "polarity_n", "polarity_sum", "mood_sum", "mood_weight", "mood_at")
+
+
+class _Accumulator:
+    """Estado de un perfil en memoria mientras se le aplican paletas (store() lo vuelca)"""
+
+    def __init__(self, profile: models_auth.UserProfile):
+        self.profile = profile
+        for name in _FIELDS:
+            setattr(self, name, getattr(profile, name))
+        self.sentiments = json.loads(profile.sentiments)
+        self.hues = json.loads(profile.hues) or [0] * len(HUE_NAMES)
+
+    def apply(self, polarity, sentiment_label, colors, created_at, sign: int):
+        self.palettes += sign
+        label = sentiment_label or "unknown"
+        self.sentiments[label] = self.sentiments.get(label, 0) + sign
+        if not self.sentiments[label]:
+            del self.sentiments[label]
+        for sector in palette_hues(colors):
+            self.hues[sector] += sign
+
+        polarity = _polarity(polarity)
+        if polarity is None:
+            return
+        self.polarity_n += sign
+        self.polarity_sum += sign * polarity
+        t = _epoch(created_at)
+        if sign > 0 and t > self.mood_at:
+            # Paleta más reciente que la referencia: llevar la suma y el peso a su instante
+            decay = math.exp((self.mood_at - t) / _TAU) if self.mood_weight else 0.0
+            self.mood_sum *= decay
+            self.mood_weight *= decay
+            self.mood_at = t
+        # min(): al restar, una paleta posterior a la referencia (perfil desfasado) pesa 1
+        weight = math.exp(min(0.0, t - self.mood_at) / _TAU)
+        self.mood_sum += sign * weight * polarity
+        self.mood_weight += sign * weight
+        if self.polarity_n <= 0 or self.mood_weight <= 1e-12:
+            self.mood_sum = self.mood_weight = 0.0
+
+    def store(self):
+        for name in _FIELDS:
+            setattr(self.profile, name, getattr(self, name))
+        self.profile.sentiments = json.dumps(self.sentiments, sort_keys=True)
+        self.profile.hues = json.dumps(self.hues)
+        self.profile.updated_at = time.time()
+
+
+def update_profiles(db: Session, palettes: Iterable, sign: int = 1):
+    """
+    Sumar (sign=1) o restar (sign=-1) paletas a los perfiles de sus dueños
+
+    Acepta objetos PaletteWithUser, filas de consulta con esas columnas o PaletteSample. No confirma: el llamador lo hace junto con el INSERT/DELETE de las paletas.
+    """
+    accumulators = {}
+    for palette in palettes:
+        acc = accumulators.get(palette.user_id)
+        if acc is None:
+            acc = accumulators[palette.user_id] = _Accumulator(_lock_profile(db, palette.user_id))
+        acc.apply(palette.polarity, palette.sentiment_label, palette.colors, palette.created_at, sign)
+    for acc in accumulators.values():
+        acc.store()
+
+
+def get_profile(db: Session, user_id: int) -> dict:
+    """Perfil para /users/me/profile (vacío si el usuario aún no tiene paletas)"""
+    profile = db.get(models_auth.UserProfile, user_id) or _new_profile(user_id)
+    hues = json.loads(profile.hues)
+    colored = sum(hues)
+    favorite = sorted(((n, i) for i, n in enumerate(hues) if n > 0), reverse=True)[:PROFILE_TOP_HUES]
+    now = time.time()
+    return {
+        "user_id": user_id,
+        "palettes": profile.palettes,
+        "mean_polarity": round(profile.polarity_sum / profile.polarity_n, 4) if profile.polarity_n else None,
+        "mood": {
+            "polarity": round(profile.mood_sum / profile.mood_weight, 4) if profile.mood_weight else None,
+            # Paletas "equivalentes" recientes: el peso acumulado decaído hasta ahora
+            "weight": round(profile.mood_weight * math.exp(min(0.0, profile.mood_at - now) / _TAU), 4),
+            "half_life_hours": PROFILE_MOOD_HALF_LIFE_HOURS,
+        },
+        "sentiments": json.loads(profile.sentiments),
+        "favorite_hues": [
+            {"hue": round(i * _HUE_SECTOR), "name": HUE_NAMES[i], "share": round(n / colored, 4)}
+            for n, i in favorite
+        ],
+        "updated_at": datetime.fromtimestamp(profile.updated_at, timezone.utc).isoformat() if profile.palettes else None,
+    }
+
+
+def rebuild_profiles(session_factory, user_ids: Optional[list[int]] = None,
+                     chunk_size: int = PROFILE_REBUILD_CHUNK_SIZE) -> int:
+    """
+    Reconstruir perfiles desde el historial de paletas, en streaming
+
+    Se procesan PROFILE_REBUILD_USERS usuarios por transacción: primero se borran sus
+    perfiles (eso toma el bloqueo de escritura, así ningún /analyze concurrente se pierde)
+    y luego se leen sus paletas por lotes de chunk_size. Devuelve las paletas leídas.
+    """
+    Palette = models_auth.PaletteWithUser
+    columns = (Palette.user_id, Palette.polarity, Palette.sentiment_label, Palette.colors, Palette.created_at)
+    db = session_factory()
+    processed = 0
+    try:
+        if user_ids is None:
+            user_ids = [row[0] for row in db.query(models_auth.User.id).order_by(models_auth.User.id)]
+        for i in range(0, len(user_ids), PROFILE_REBUILD_USERS):
+            chunk = user_ids[i:i + PROFILE_REBUILD_USERS]
+            db.query(models_auth.UserProfile).filter(
+                models_auth.UserProfile.user_id.in_(chunk)
+            ).delete(synchronize_session=False)
+            accumulators = {}
+            rows = db.query(*columns).filter(Palette.user_id.in_(chunk)).order_by(Palette.id).yield_per(chunk_size)
+            for row in rows:
+                acc = accumulators.get(row.user_id)
+                if acc is None:
+                    acc = accumulators[row.user_id] = _Accumulator(_new_profile(row.user_id))
+                acc.apply(row.polarity, row.sentiment_label, row.colors, row.created_at, 1)
+                processed += 1
+            for acc in accumulators.values():
+                acc.store()
+                db.add(acc.profile)
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    app_logger.info(f"Perfiles reconstruidos: {len(user_ids)} usuarios, {processed} paletas")
+    return processed
+
+
+if __name__ == "__main__":
+    import argparse
+    from database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Reconstruir los perfiles emocionales desde el historial")
+    parser.add_argument("--usuario", help="Solo este usuario (nombre)")
+    parser.add_argument("--lote", type=int, default=PROFILE_REBUILD_CHUNK_SIZE, help="Paletas por lote de lectura")
+    args = parser.parse_args()
+
+    models_auth.Base.metadata.create_all(bind=engine)
+    ids = None
+    if args.usuario:
+        db = SessionLocal()
+        user = db.query(models_auth.User).filter(models_auth.User.username == args.usuario).first()
+        db.close()
+        if user is None:
+            print(f"❌ No existe el usuario {args.usuario}")
+            sys.exit(1)
+        ids = [user.id]
+    paletas = rebuild_profiles(SessionLocal, ids, args.lote)
+    print(f"✅ Perfiles reconstruidos ({paletas} paletas)")
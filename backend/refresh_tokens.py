@@ -0,0 +1,126 @@
+"""
+Refresh tokens rotativos
+Permiten renovar access tokens cortos sin volver a verificar la contraseña (sin bcrypt)
+"""
+
+from datetime import timedelta
+from typing import Optional
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+import hashlib
+import secrets
+import time
+import os
+
+import models_auth
+
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+
+
+def _hash(token: str) -> str:
+    """Los refresh tokens son aleatorios de 256 bits: SHA-256 basta (no hace falta bcrypt)"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _invalid():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Refresh token inválido o expirado",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def issue_refresh_token(db: Session, user_id: int, family_id: Optional[str] = None) -> str:
+    """Crear un refresh token (se agrega a la sesión; el llamador hace commit)"""
+    token = secrets.token_urlsafe(32)
+    now = time.time()
+    db.add(models_auth.RefreshToken(
+        token_hash=_hash(token),
+        family_id=family_id or secrets.token_hex(16),
+        user_id=user_id,
+        issued_at=now,
+        expires_at=now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS).total_seconds(),
+    ))
+    return token
+
+
+def rotate_refresh_token(db: Session, token: str) -> tuple[models_auth.User, str]:
+    """
+    Consumir un refresh token y emitir su reemplazo en la misma familia
+
+    Reusar un token ya rotado revoca toda la familia (posible robo del token).
+    """
+    RefreshToken = models_auth.RefreshToken
+    now = time.time()
+    record = db.query(
+        RefreshToken.id, RefreshToken.family_id, RefreshToken.user_id,
+        RefreshToken.expires_at, RefreshToken.revoked_at
+    ).filter(RefreshToken.token_hash == _hash(token)).first()
+
+    if record is None or record.expires_at <= now:
+        raise _invalid()
+
+    # UPDATE condicional: solo una rotación concurrente puede ganar
+    consumed = db.query(RefreshToken).filter(
+        RefreshToken.id == record.id, RefreshToken.revoked_at.is_(None)
+    ).update({RefreshToken.revoked_at: now}, synchronize_session=False)
+    if not consumed:
+        revoke_family(db, record.family_id)
+        db.commit()
+        raise _invalid()
+
+    user = db.get(models_auth.User, record.user_id)
+    if user is None or not user.is_active:
+        revoke_family(db, record.family_id)
+        db.commit()
+        raise _invalid()
+
+    new_token = issue_refresh_token(db, user.id, record.family_id)
+    db.commit()
+    return user, new_token
+
+
+def revoke_family(db: Session, family_id: str):
+    """Revocar todas las rotaciones vigentes de un login"""
+    db.query(models_auth.RefreshToken).filter(
+        models_auth.RefreshToken.family_id == family_id,
+        models_auth.RefreshToken.revoked_at.is_(None)
+    ).update({models_auth.RefreshToken.revoked_at: time.time()}, synchronize_session=False)
+
+
+def revoke_refresh_token(db: Session, token: str):
+    """Revocar la familia de un refresh token (logout)"""
+    family_id = db.query(models_auth.RefreshToken.family_id).filter(
+        models_auth.RefreshToken.token_hash == _hash(token)
+    ).scalar()
+    if family_id is not None:
+        revoke_family(db, family_id)
+        db.commit()
+
+
+def revoke_user_refresh_tokens(db: Session, user_id: int):
+    """Revocar todos los refresh tokens de un usuario (desactivación o eliminación)"""
+    db.query(models_auth.RefreshToken).filter(
+        models_auth.RefreshToken.user_id == user_id,
+        models_auth.RefreshToken.revoked_at.is_(None)
+    ).update({models_auth.RefreshToken.revoked_at: time.time()}, synchronize_session=False)
+    db.commit()
+
+
+def revoke_users_refresh_tokens(db: Session, user_ids: list[int], chunk_size: int = 500):
+    """Revocar los refresh tokens de muchos usuarios (sin commit: lo hace el llamador)"""
+    now = time.time()
+    for i in range(0, len(user_ids), chunk_size):
+        db.query(models_auth.RefreshToken).filter(
+            models_auth.RefreshToken.user_id.in_(user_ids[i:i + chunk_size]),
+            models_auth.RefreshToken.revoked_at.is_(None)
+        ).update({models_auth.RefreshToken.revoked_at: now}, synchronize_session=False)
+
+
+def prune_refresh_tokens(db: Session) -> int:
+    """Eliminar refresh tokens expirados (los revocados se guardan hasta expirar para detectar reuso)"""
+    deleted = db.query(models_auth.RefreshToken).filter(
+        models_auth.RefreshToken.expires_at <= time.time()
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
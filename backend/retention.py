@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Retención y archivado de palettes_with_users
+
+Política (días de antigüedad por rol del dueño; 0 = conservar siempre):
+  RETENTION_DAYS=365                        # roles sin entrada propia
+  RETENTION_DAYS_BY_ROLE="viewer:90,admin:0"
+
+El archivador recorre la tabla por lotes en orden de id. Cada lote se copia primero a la
+BD de archivo (ARCHIVE_DATABASE_URL, idempotente por id) y después se borra de la tabla
+viva en una transacción corta: si se interrumpe entre ambos pasos, la siguiente ejecución
+vuelve a copiar el mismo lote sin duplicarlo. Los agregados por intervalo (rollups.py)
+conservan las paletas archivadas; contadores, búsqueda y perfiles pasan a reflejar solo la
+tabla viva. Al terminar: PRAGMA incremental_vacuum (si la BD tiene auto_vacuum=INCREMENTAL)
+y PRAGMA optimize.
+
+Lo archivado se consulta (más despacio) con GET /palettes/archive.
+
+El mantenimiento en segundo plano lo ejecuta cada MAINTENANCE_ARCHIVE_SECONDS en ventanas de
+poca carga (tarea archive, maintenance.py) y lo pausa entre lotes si la carga sube.
+A mano: python backend/retention.py [--lote 500] [--vacuum-completo]  (o POST /admin/retention)
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+from sqlalchemy import (Column, Float, Index, Integer, MetaData, String, Table, and_,
+                        create_engine, event, or_, select)
+from sqlalchemy.engine import Engine
+import threading
+import time
+import sys
+import os
+
+# Agregar el directorio backend al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+import models_auth
+import rollups
+from database import set_sqlite_pragmas
+from jobs import RateLimiter
+from logger_config import app_logger
+from maintenance import incremental_vacuum, optimize, vacuum
+from metrics import record_pages_reclaimed, record_palette_deleted
+from palette_export import EXPORT_COLUMNS, FIELDNAMES
+from profiles import update_profiles
+from triggers import archiving_palettes
+
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "0"))
+RETENTION_DAYS_BY_ROLE = os.getenv("RETENTION_DAYS_BY_ROLE", "")
+ARCHIVE_DATABASE_URL = os.getenv("ARCHIVE_DATABASE_URL", "sqlite:///./data/palettes_archive.db")
+ARCHIVE_CHUNK_SIZE = int(os.getenv("ARCHIVE_CHUNK_SIZE", "500"))
+ARCHIVE_MAX_ROWS_PER_SECOND = float(os.getenv("ARCHIVE_MAX_ROWS_PER_SECOND", "2000"))
+# Páginas liberadas por ejecución (incremental_vacuum bloquea escrituras mientras dura)
+ARCHIVE_VACUUM_PAGES = int(os.getenv("ARCHIVE_VACUUM_PAGES", "5000"))
+
+_P = models_auth.PaletteWithUser
+_U = models_auth.User
+
+# BD de archivo: MetaData propia (no se crea en la BD principal)
+archive_metadata = MetaData()
+archived_palettes = Table(
+    "archived_palettes", archive_metadata,
+    Column("id", Integer, primary_key=True, autoincrement=False),
+    Column("user_id", Integer, nullable=False),
+    *(Column(name, String) for name in FIELDNAMES if name not in ("id", "user_id")),
+    Column("archived_at", Float, nullable=False),  # epoch, segundos
+    Index("ix_archived_palettes_user_id_id", "user_id", "id"),
+)
+
+
+def parse_retention(spec: str) -> dict:
+    """Parsear RETENTION_DAYS_BY_ROLE ("rol:días,...")"""
+    days = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        role, _, value = item.partition(":")
+        if not value.strip().isdigit():
+            raise ValueError(f"Retención inválida para el rol {role!r}: {value!r}")
+        days[role.strip()] = int(value)
+    return days
+
+
+def retention_condition(now: datetime, default_days: Optional[int] = None,
+                        by_role: Optional[dict] = None):
+    """Condición SQL de las paletas vencidas (requiere JOIN con users); None si no vence nada"""
+    default_days = RETENTION_DAYS if default_days is None else default_days
+    by_role = parse_retention(RETENTION_DAYS_BY_ROLE) if by_role is None else by_role
+    clauses = [
+        and_(_U.role == role, _P.created_at < now - timedelta(days=days))
+        for role, days in by_role.items() if days > 0
+    ]
+    if default_days > 0:
+        clauses.append(and_(_U.role.not_in(list(by_role)), _P.created_at < now - timedelta(days=default_days)))
+    return or_(*clauses) if clauses else None
+
+
+_archive_engine: Optional[Engine] = None
+_archive_lock = threading.Lock()
+
+
+def get_archive_engine() -> Engine:
+    """Engine de la BD de archivo (perezoso; también es la dependencia de FastAPI)"""
+    global _archive_engine
+    with _archive_lock:
+        if _archive_engine is None:
+            engine = create_engine(ARCHIVE_DATABASE_URL, connect_args={"check_same_thread": False}
+                                   if ARCHIVE_DATABASE_URL.startswith("sqlite") else {})
+            if engine.dialect.name == "sqlite":
+                event.listen(engine, "connect", set_sqlite_pragmas)
+            archive_metadata.create_all(bind=engine)
+            _archive_engine = engine
+    return _archive_engine
+
+
+def compact_database(engine: Engine, pages: int = ARCHIVE_VACUUM_PAGES, full: bool = False) -> int:
+    """
+    Devolver al sistema el espacio libre tras un archivado; devuelve páginas liberadas
+
+    incremental_vacuum solo funciona con auto_vacuum=INCREMENTAL (las BD nuevas lo tienen,
+    ver database.py). Una BD existente se convierte una sola vez con full=True (VACUUM
+    completo: reescribe el archivo y bloquea la BD mientras dura).
+    """
+    if engine.dialect.name != "sqlite":
+        return 0
+    freed = (vacuum(engine) if full else incremental_vacuum(engine, pages))["pages_reclaimed"]
+    optimize(engine)
+    record_pages_reclaimed(freed)
+    return freed
+
+
+class ArchiveJob:
+    """Archivado por lotes; una sola ejecución a la vez por proceso"""
+
+    def __init__(self, session_factory, archive_engine: Optional[Engine] = None,
+                 chunk_size: int = ARCHIVE_CHUNK_SIZE,
+                 max_rows_per_second: float = ARCHIVE_MAX_ROWS_PER_SECOND):
+        self.session_factory = session_factory
+        self.archive_engine = archive_engine
+        self.chunk_size = chunk_size
+        self.max_rows_per_second = max_rows_per_second
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.status = {"state": "idle"}
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def run(self, full_vacuum: bool = False, should_pause: Optional[Callable[[], bool]] = None) -> dict:
+        """
+        Ejecutar hasta terminar (o hasta stop()); devuelve el estado final
+
+        should_pause se consulta entre lotes: si devuelve True se para con state "paused"
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("El archivado ya está en curso")
+        try:
+            self._stop.clear()
+            self._run(full_vacuum, should_pause)
+        except Exception as e:
+            self.status["state"] = "failed"
+            self.status["error"] = str(e)
+            app_logger.error(f"Archivado fallido: {e}")
+            raise
+        finally:
+            self._lock.release()
+        return dict(self.status)
+
+    def start(self) -> bool:
+        """Ejecutar en un hilo de fondo (False si ya hay una ejecución en curso)"""
+        if self.running:
+            return False
+
+        def target():
+            try:
+                self.run()
+            except Exception:
+                pass  # ya registrado en el estado
+
+        self._thread = threading.Thread(target=target, name="archive", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """Detener tras el lote en curso (lo archivado ya salió de la tabla viva)"""
+        self._stop.set()
+
+    def _run(self, full_vacuum: bool, should_pause: Optional[Callable[[], bool]]):
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        condition = retention_condition(now)
+        self.status = {"state": "running", "archived": 0, "last_id": 0, "freed_pages": 0}
+        if condition is None:
+            self.status["state"] = "disabled"
+            return
+        archive_engine = self.archive_engine or get_archive_engine()
+        archive_metadata.create_all(bind=archive_engine)
+
+        db = self.session_factory()
+        try:
+            if rollups.backfill_pending(db):
+                # El backfill agregará esas filas: archivarlas antes las perdería de los agregados
+                # (el mantenimiento lo completa; el archivado sigue en la próxima ejecución)
+                self.status["state"] = "backfill_pending"
+                return
+
+            limiter = RateLimiter(self.max_rows_per_second)
+            query = select(*EXPORT_COLUMNS).join(_U, _U.id == _P.user_id).order_by(_P.id).limit(self.chunk_size)
+            last_id = 0
+            while not self._stop.is_set():
+                if should_pause is not None and should_pause():
+                    self.status["state"] = "paused"
+                    break
+                rows = db.execute(query.where(_P.id > last_id, condition)).all()
+                if not rows:
+                    self.status["state"] = "finished"
+                    break
+                ids = [row.id for row in rows]
+                # 1. Copiar (borrar antes hace idempotente el reintento de un lote ya copiado)
+                archived_at = time.time()
+                with archive_engine.begin() as conn:
+                    conn.execute(archived_palettes.delete().where(archived_palettes.c.id.in_(ids)))
+                    conn.execute(archived_palettes.insert(),
+                                 [{**row._mapping, "archived_at": archived_at} for row in rows])
+                # 2. Borrar de la tabla viva, con los perfiles, en una transacción corta
+                with archiving_palettes(db.connection()):
+                    update_profiles(db, rows, sign=-1)
+                    db.query(_P).filter(_P.id.in_(ids)).delete(synchronize_session=False)
+                db.commit()
+                record_palette_deleted("archive", len(ids))
+
+                last_id = ids[-1]
+                self.status.update(archived=self.status["archived"] + len(ids), last_id=last_id)
+                limiter.throttle(len(ids))
+            else:
+                self.status["state"] = "stopped"
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        # Pausado por carga no se compacta (incremental_vacuum bloquea las escrituras)
+        if (self.status["archived"] or full_vacuum) and self.status["state"] != "paused":
+            self.status["freed_pages"] = compact_database(db.get_bind(), full=full_vacuum)
+        app_logger.info(
+            f"Archivado {self.status['state']}: {self.status['archived']} paletas, "
+            f"{self.status['freed_pages']} páginas liberadas"
+        )
+
+
+def archived_page(engine: Engine, user_id: Optional[int] = None, start: Optional[datetime] = None,
+                  end: Optional[datetime] = None, cursor: Optional[int] = None,
+                  limit: int = 50) -> tuple[list[dict], Optional[int]]:
+    """
+    Página de paletas archivadas en orden de id (cursor = último id devuelto)
+
+    Camino lento: lee la BD de archivo, no la tabla viva ni sus índices por fecha.
+    """
+    t = archived_palettes
+    query = select(t).order_by(t.c.id).limit(limit)
+    if user_id is not None:
+        query = query.where(t.c.user_id == user_id)
+    if cursor is not None:
+        query = query.where(t.c.id > cursor)
+    # created_at se guarda como texto 'YYYY-MM-DD HH:MM:SS': se compara como texto
+    if start is not None:
+        query = query.where(t.c.created_at >= start.isoformat(" "))
+    if end is not None:
+        query = query.where(t.c.created_at < end.isoformat(" "))
+    with engine.connect() as conn:
+        rows = conn.execute(query).all()
+    palettes = [{
+        **{name: getattr(row, name) for name in FIELDNAMES},
+        "created_at": row.created_at.replace(" ", "T", 1) if row.created_at else None,
+        "archived_at": datetime.fromtimestamp(row.archived_at, timezone.utc).isoformat(),
+    } for row in rows]
+    return palettes, (rows[-1].id if len(rows) == limit else None)
+
+
+_job: Optional[ArchiveJob] = None
+
+
+def get_archive_job() -> ArchiveJob:
+    """Trabajo global del proceso (lo usan el endpoint de administración y el mantenimiento)"""
+    global _job
+    if _job is None:
+        from database import SessionLocal
+        _job = ArchiveJob(SessionLocal)
+    return _job
+
+
+if __name__ == "__main__":
+    import argparse
+    from database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Archivar las paletas vencidas según la política de retención")
+    parser.add_argument("--lote", type=int, default=ARCHIVE_CHUNK_SIZE, help="Paletas por lote")
+    parser.add_argument("--filas-por-segundo", type=float, default=ARCHIVE_MAX_ROWS_PER_SECOND,
+                        help="Límite de ritmo (0 = sin límite)")
+    parser.add_argument("--vacuum-completo", action="store_true",
+                        help="Al terminar, VACUUM completo (convierte la BD a auto_vacuum incremental)")
+    args = parser.parse_args()
+
+    models_auth.Base.metadata.create_all(bind=engine)
+    job = ArchiveJob(SessionLocal, chunk_size=args.lote, max_rows_per_second=args.filas_por_segundo)
+    try:
+        status = job.run(full_vacuum=args.vacuum_completo)
+    except KeyboardInterrupt:
+        print("\n⏸️  Interrumpido: lo ya archivado salió de la tabla viva; el resto queda para la próxima")
+        sys.exit(1)
+    except (RuntimeError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    if status["state"] == "disabled":
+        print("ℹ️  Sin política de retención (RETENTION_DAYS / RETENTION_DAYS_BY_ROLE)")
+    elif status["state"] == "backfill_pending":
+        print("ℹ️  Backfill de agregados pendiente: ejecuta antes python backend/rollups.py")
+    else:
+        print(f"✅ {status['archived']} paletas archivadas, {status['freed_pages']} páginas liberadas")
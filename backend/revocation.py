@@ -0,0 +1,232 @@
+"""
+Lista de revocación de tokens JWT
+Filtro de Bloom en memoria para el chequeo negativo de la ruta caliente,
+conjunto exacto consultado solo ante aciertos del filtro y persistencia en SQLite
+"""
+
+from typing import Optional
+from sqlalchemy.orm import Session
+import math
+import threading
+import time
+import os
+
+import models_auth
+
+# Capacidad inicial del filtro y tasa de falsos positivos objetivo
+REVOCATION_BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "100000"))
+REVOCATION_BLOOM_FP_RATE = float(os.getenv("REVOCATION_BLOOM_FP_RATE", "0.001"))
+# Intervalos del hilo de sincronización (revocaciones de otros workers) y de purga
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "5"))
+REVOCATION_PRUNE_SECONDS = float(os.getenv("REVOCATION_PRUNE_SECONDS", "300"))
+
+_MASK32 = 0xFFFFFFFF
+
+
+class BloomFilter:
+    """
+    Filtro de Bloom sobre un bytearray con doble hashing
+
+    Usa hash() de Python (SipHash, cacheado en el propio str): el filtro vive solo en
+    memoria y se reconstruye al arrancar, así que la semilla por proceso no importa.
+    """
+
+    def __init__(self, capacity: int, fp_rate: float = REVOCATION_BLOOM_FP_RATE):
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def add(self, item: str):
+        h = hash(item)
+        h1, h2 = h & _MASK32, ((h >> 32) & _MASK32) | 1
+        bits, size = self._bits, self.size
+        for i in range(self.hashes):
+            pos = (h1 + i * h2) % size
+            bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        h = hash(item)
+        h1 = h & _MASK32
+        bits, size = self._bits, self.size
+        # Primera sonda fuera del bucle: casi todos los tokens no revocados terminan aquí
+        pos = h1 % size
+        if not bits[pos >> 3] & (1 << (pos & 7)):
+            return False
+        h2 = ((h >> 32) & _MASK32) | 1
+        for i in range(1, self.hashes):
+            pos = (h1 + i * h2) % size
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class RevocationList:
+    """Tokens revocados por jti y cortes por usuario (tokens emitidos antes de una fecha)"""
+
+    def __init__(self, capacity: int = REVOCATION_BLOOM_CAPACITY):
+        self._lock = threading.Lock()
+        self._capacity = capacity
+        self._bloom = BloomFilter(capacity)
+        self._jtis: dict[str, float] = {}            # jti -> expires_at
+        self._user_cutoffs: dict[int, tuple[float, float]] = {}  # user_id -> (revoked_at, expires_at)
+        self._last_id = 0
+        self._sync_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # ---------- Ruta caliente ----------
+
+    def is_revoked(self, jti: Optional[str], user_id: Optional[int] = None,
+                   issued_at: Optional[float] = None) -> bool:
+        """Verificar si un token está revocado (sin I/O)"""
+        # Solo ante un acierto del filtro se consulta el conjunto exacto
+        if jti is not None and jti in self._bloom and jti in self._jtis:
+            return True
+        if self._user_cutoffs and user_id is not None:
+            cutoff = self._user_cutoffs.get(user_id)
+            if cutoff is not None and (issued_at is None or issued_at <= cutoff[0]):
+                return True
+        return False
+
+    # ---------- Altas ----------
+
+    def revoke(self, db: Session, jti: str, expires_at: float, user_id: Optional[int] = None):
+        """Revocar un token concreto hasta su expiración"""
+        row = models_auth.RevokedToken(
+            jti=jti, user_id=user_id, revoked_at=time.time(), expires_at=expires_at
+        )
+        db.add(row)
+        db.commit()
+        self._apply(row.id, jti, row.user_id, row.revoked_at, row.expires_at)
+
+    def revoke_user(self, db: Session, user_id: int, max_token_age: float):
+        """Revocar todos los tokens emitidos hasta ahora para un usuario"""
+        now = time.time()
+        row = models_auth.RevokedToken(
+            jti=None, user_id=user_id, revoked_at=now, expires_at=now + max_token_age
+        )
+        db.add(row)
+        db.commit()
+        self._apply(row.id, None, user_id, row.revoked_at, row.expires_at)
+
+    def revoke_users(self, db: Session, user_ids: list[int], max_token_age: float):
+        """
+        Corte por usuario para muchos usuarios en un solo commit
+
+        Confirma la transacción en curso del llamador: un cambio masivo y sus
+        revocaciones se confirman juntos.
+        """
+        now = time.time()
+        rows = [models_auth.RevokedToken(jti=None, user_id=user_id, revoked_at=now,
+                                         expires_at=now + max_token_age) for user_id in user_ids]
+        db.add_all(rows)
+        db.commit()
+        for row in rows:
+            self._apply(row.id, None, row.user_id, row.revoked_at, row.expires_at)
+
+    def _apply(self, row_id: int, jti: Optional[str], user_id: Optional[int],
+               revoked_at: float, expires_at: float):
+        with self._lock:
+            if jti is not None:
+                if len(self._jtis) >= self._bloom.capacity:
+                    self._rebuild(self._bloom.capacity * 2)
+                self._jtis[jti] = expires_at
+                self._bloom.add(jti)
+            elif user_id is not None:
+                previous = self._user_cutoffs.get(user_id, (0.0, 0.0))
+                self._user_cutoffs[user_id] = (max(revoked_at, previous[0]), max(expires_at, previous[1]))
+            self._last_id = max(self._last_id, row_id or 0)
+
+    def _rebuild(self, capacity: int):
+        """Reconstruir el filtro (Bloom no admite borrados); llamar con el lock tomado"""
+        bloom = BloomFilter(max(capacity, self._capacity))
+        for jti in self._jtis:
+            bloom.add(jti)
+        self._bloom = bloom
+
+    # ---------- Carga, sincronización y purga ----------
+
+    def load(self, db: Session):
+        """Carga completa al arrancar: solo filas vigentes, por índice de expires_at"""
+        with self._lock:
+            self._jtis.clear()
+            self._user_cutoffs.clear()
+            self._last_id = 0
+        self.sync(db)
+        with self._lock:
+            self._rebuild(max(self._capacity, len(self._jtis) * 2))
+
+    def sync(self, db: Session):
+        """Incorporar revocaciones hechas por otros workers (incremental por id)"""
+        now = time.time()
+        rows = db.query(
+            models_auth.RevokedToken.id, models_auth.RevokedToken.jti,
+            models_auth.RevokedToken.user_id, models_auth.RevokedToken.revoked_at,
+            models_auth.RevokedToken.expires_at
+        ).filter(
+            models_auth.RevokedToken.id > self._last_id,
+            models_auth.RevokedToken.expires_at > now
+        ).order_by(models_auth.RevokedToken.id).all()
+        for row in rows:
+            self._apply(row.id, row.jti, row.user_id, row.revoked_at, row.expires_at)
+
+    def prune(self, db: Session) -> int:
+        """Eliminar revocaciones de tokens ya expirados (en BD y en memoria)"""
+        now = time.time()
+        deleted = db.query(models_auth.RevokedToken).filter(
+            models_auth.RevokedToken.expires_at <= now
+        ).delete(synchronize_session=False)
+        db.commit()
+        with self._lock:
+            expired = [jti for jti, exp in self._jtis.items() if exp <= now]
+            for jti in expired:
+                del self._jtis[jti]
+            # Un corte por usuario deja de importar cuando expiró el token más largo posible
+            self._user_cutoffs = {
+                uid: cutoff for uid, cutoff in self._user_cutoffs.items() if cutoff[1] > now
+            }
+            if expired:
+                self._rebuild(max(self._capacity, len(self._jtis) * 2))
+        return deleted
+
+    def start_background_sync(self, session_factory, extra_prune=()):
+        """Hilo daemon que sincroniza y purga periódicamente (extra_prune: purgas adicionales)"""
+        if self._sync_thread is not None:
+            return
+
+        def run():
+            last_prune = time.monotonic()
+            while not self._stop.wait(REVOCATION_SYNC_SECONDS):
+                db = session_factory()
+                try:
+                    self.sync(db)
+                    if time.monotonic() - last_prune >= REVOCATION_PRUNE_SECONDS:
+                        self.prune(db)
+                        for prune in extra_prune:
+                            prune(db)
+                        last_prune = time.monotonic()
+                except Exception:
+                    db.rollback()
+                finally:
+                    db.close()
+
+        self._stop.clear()
+        self._sync_thread = threading.Thread(target=run, name="revocation-sync", daemon=True)
+        self._sync_thread.start()
+
+    def stop_background_sync(self):
+        self._stop.set()
+        self._sync_thread = None
+
+    def clear(self):
+        """Vaciar el estado en memoria (no toca la BD)"""
+        with self._lock:
+            self._bloom = BloomFilter(self._capacity)
+            self._jtis.clear()
+            self._user_cutoffs.clear()
+            self._last_id = 0
+
+
+# Instancia global
+revocation_list = RevocationList()
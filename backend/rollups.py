@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Agregados de sentimiento por hora y por día (por usuario y global)
+
+Triggers de SQLite actualizan sentiment_rollup_hourly / sentiment_rollup_daily en la misma
+transacción que cada INSERT/UPDATE/DELETE de palettes_with_users. Las paletas que ya existían
+al instalar los triggers se agregan con el backfill, por lotes y reanudable: lo ejecuta el
+mantenimiento en segundo plano (tarea rollup_backfill, maintenance.py) o, a mano,
+python backend/rollups.py. Mientras está pendiente, los triggers ignoran las filas de su rango
+de ids (last_id, high_water], así ninguna fila se cuenta dos veces ni se descuenta sin haberse
+sumado, y /analytics/sentiment lo indica con backfill_pending.
+"""
+
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+from sqlalchemy import event, func, select, text
+from sqlalchemy.orm import Session
+import json
+import math
+import time
+import sys
+import os
+
+# Agregar el directorio backend al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+import models_auth
+from database import Base
+from jobs import RateLimiter
+from triggers import NOT_ARCHIVING, NOT_DEFERRED, install_triggers, on_bulk_insert
+from logger_config import app_logger
+
+ROLLUP_BACKFILL_CHUNK_SIZE = int(os.getenv("ROLLUP_BACKFILL_CHUNK_SIZE", "5000"))
+ROLLUP_BACKFILL_MAX_ROWS_PER_SECOND = float(os.getenv("ROLLUP_BACKFILL_MAX_ROWS_PER_SECOND", "20000"))
+# Rango máximo de una consulta por hora (por día no hay límite: un año son 365 intervalos)
+ROLLUP_MAX_HOURLY_DAYS = 31
+
+JOB_NAME = "backfill_rollups"
+GLOBAL_USER_ID = 0
+
+# granularidad -> (tabla, formato strftime del intervalo)
+GRANULARITIES = {
+    "hour": (models_auth.SentimentRollupHourly.__table__, "%Y-%m-%d %H:00"),
+    "day": (models_auth.SentimentRollupDaily.__table__, "%Y-%m-%d"),
+}
+
+_KEY = ("user_id", "bucket", "sentiment_label", "analysis_method")
+_VALUES = ("count", "polarity_n", "polarity_sum", "polarity_sumsq",
+           "confidence_n", "confidence_sum", "confidence_sumsq")
+_ON_CONFLICT = (
+    f"ON CONFLICT({', '.join(_KEY)}) DO UPDATE SET "
+    + ", ".join(f"{name} = {name} + excluded.{name}" for name in _VALUES)
+)
+
+# Fila fuera del rango pendiente del backfill (si no, el backfill la agregará)
+_NOT_PENDING = (
+    "NOT EXISTS (SELECT 1 FROM job_checkpoints WHERE name = '" + JOB_NAME + "' AND NOT finished "
+    "AND {ref}.id > last_id AND {ref}.id <= json_extract(params, '$.high_water'))"
+)
+
+
+def _upserts(ref: str, sign: str) -> str:
+    """Sumar (o restar) una fila a los cuatro agregados: hora/día x usuario/global"""
+    polarity = f"CAST({ref}.polarity AS REAL)"
+    confidence = f"CAST({ref}.confidence_score AS REAL)"
+    values = (
+        f"{sign}1",
+        f"{sign}({ref}.polarity IS NOT NULL)",
+        f"{sign}coalesce({polarity}, 0)",
+        f"{sign}coalesce({polarity} * {polarity}, 0)",
+        f"{sign}({ref}.confidence_score IS NOT NULL)",
+        f"{sign}coalesce({confidence}, 0)",
+        f"{sign}coalesce({confidence} * {confidence}, 0)",
+    )
+    statements = []
+    for table, fmt in GRANULARITIES.values():
+        for user_id in (f"{ref}.user_id", str(GLOBAL_USER_ID)):
+            key = (
+                user_id,
+                f"strftime('{fmt}', coalesce({ref}.created_at, CURRENT_TIMESTAMP))",
+                f"coalesce({ref}.sentiment_label, 'unknown')",
+                f"coalesce({ref}.analysis_method, 'unknown')",
+            )
+            statements.append(
+                f"INSERT INTO {table.name} ({', '.join(_KEY + _VALUES)}) "
+                f"VALUES ({', '.join(key + values)}) {_ON_CONFLICT};"
+            )
+    return " ".join(statements)
+
+
+_TRIGGERS = {
+    "trg_rollups_insert": (
+        "AFTER INSERT ON palettes_with_users WHEN " + _NOT_PENDING.format(ref="NEW") + " AND " + NOT_DEFERRED,
+        _upserts("NEW", "+"),
+    ),
+    "trg_rollups_delete": (
+        # Las paletas archivadas siguen contando en los agregados (ver retention.py)
+        "AFTER DELETE ON palettes_with_users WHEN " + _NOT_PENDING.format(ref="OLD") + " AND " + NOT_ARCHIVING,
+        _upserts("OLD", "-"),
+    ),
+    "trg_rollups_update": (
+        "AFTER UPDATE OF user_id, created_at, sentiment_label, analysis_method, polarity, "
+        "confidence_score ON palettes_with_users WHEN " + _NOT_PENDING.format(ref="OLD"),
+        _upserts("OLD", "-") + " " + _upserts("NEW", "+"),
+    ),
+}
+
+
+def install_rollup_triggers(target, connection, **kw):
+    """
+    Hook after_create de la metadata: crea los triggers. Si son nuevos y ya hay paletas,
+    deja el backfill pendiente hasta el id más alto actual (no se agrega nada al arrancar)
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    if not install_triggers(connection, _TRIGGERS):
+        return
+    high_water = connection.execute(text("SELECT max(id) FROM palettes_with_users")).scalar()
+    if high_water is not None:
+        _start_backfill(connection, high_water)
+
+
+def _start_backfill(connection, high_water: int):
+    """Vaciar los agregados y marcar (0, high_water] como pendiente de backfill"""
+    for table, _ in GRANULARITIES.values():
+        connection.execute(table.delete())
+    connection.execute(text(
+        "INSERT INTO job_checkpoints (name, last_id, processed, params, finished, updated_at) "
+        "VALUES (:name, 0, 0, :params, 0, :now) ON CONFLICT(name) DO UPDATE SET "
+        "last_id = 0, processed = 0, params = excluded.params, finished = 0, updated_at = excluded.updated_at"
+    ), {"name": JOB_NAME, "params": json.dumps({"high_water": high_water}), "now": time.time()})
+
+
+def _aggregate(connection, where: str, params: dict):
+    """Agregar las paletas que cumplen `where` (GROUP BY + upsert)"""
+    aggregates = (
+        "COUNT(*)", "COUNT(polarity)",
+        "coalesce(SUM(CAST(polarity AS REAL)), 0)",
+        "coalesce(SUM(CAST(polarity AS REAL) * CAST(polarity AS REAL)), 0)",
+        "COUNT(confidence_score)",
+        "coalesce(SUM(CAST(confidence_score AS REAL)), 0)",
+        "coalesce(SUM(CAST(confidence_score AS REAL) * CAST(confidence_score AS REAL)), 0)",
+    )
+    for table, fmt in GRANULARITIES.values():
+        for user_id in ("user_id", str(GLOBAL_USER_ID)):
+            connection.execute(text(
+                f"INSERT INTO {table.name} ({', '.join(_KEY + _VALUES)}) "
+                f"SELECT {user_id}, strftime('{fmt}', coalesce(created_at, CURRENT_TIMESTAMP)), "
+                f"coalesce(sentiment_label, 'unknown'), coalesce(analysis_method, 'unknown'), "
+                f"{', '.join(aggregates)} FROM palettes_with_users "
+                f"WHERE {where} GROUP BY 1, 2, 3, 4 {_ON_CONFLICT}"
+            ), params)
+
+
+def _backfill_chunk(connection, after_id: int, upper_id: int):
+    """Agregar las paletas con id en (after_id, upper_id]"""
+    _aggregate(connection, "id > :after_id AND id <= :upper_id",
+               {"after_id": after_id, "upper_id": upper_id})
+
+
+@on_bulk_insert
+def apply_bulk_insert(connection, after_id: int):
+    """Inserción masiva: agregar las paletas nuevas (salvo las que cubre el backfill)"""
+    _aggregate(connection, "id > :after_id AND " + _NOT_PENDING.format(ref="palettes_with_users"),
+               {"after_id": after_id})
+
+
+def backfill_pending(db: Session) -> bool:
+    """Hay paletas previas a los triggers que aún no están en los agregados"""
+    checkpoint = db.get(models_auth.JobCheckpoint, JOB_NAME)
+    return checkpoint is not None and not checkpoint.finished
+
+
+def backfill_rollups(session_factory, chunk_size: int = ROLLUP_BACKFILL_CHUNK_SIZE,
+                     max_rows_per_second: float = ROLLUP_BACKFILL_MAX_ROWS_PER_SECOND,
+                     restart: bool = False, should_pause: Optional[Callable[[], bool]] = None) -> dict:
+    """
+    Agregar las paletas previas a los triggers, por lotes de ids (reanudable)
+
+    Args:
+        restart: Reconstruir todos los agregados desde cero (reparación). Solo ve la tabla
+            viva: se pierden los intervalos de las paletas ya archivadas
+        should_pause: Consultada entre lotes; si devuelve True se para con state "paused"
+            (la próxima ejecución sigue desde el checkpoint)
+
+    Returns:
+        Estado: state, last_id, high_water, processed
+    """
+    db = session_factory()
+    try:
+        if restart:
+            high_water = db.query(func.max(models_auth.PaletteWithUser.id)).scalar()
+            if high_water is not None:
+                _start_backfill(db.connection(), high_water)
+                db.commit()
+        checkpoint = db.get(models_auth.JobCheckpoint, JOB_NAME)
+        if checkpoint is None or checkpoint.finished:
+            return {"state": "finished"}
+        high_water = json.loads(checkpoint.params)["high_water"]
+        palettes = models_auth.PaletteWithUser.__table__
+        limiter = RateLimiter(max_rows_per_second)
+
+        state = "finished"
+        while True:
+            if should_pause is not None and should_pause():
+                state = "paused"
+                break
+            chunk = select(palettes.c.id).where(
+                palettes.c.id > checkpoint.last_id, palettes.c.id <= high_water
+            ).order_by(palettes.c.id).limit(chunk_size).subquery()
+            row = db.execute(select(func.max(chunk.c.id), func.count())).one()
+            upper_id, rows = row[0], row[1]
+            if upper_id is None:
+                checkpoint.finished = True
+                checkpoint.updated_at = time.time()
+                db.commit()
+                break
+            _backfill_chunk(db.connection(), checkpoint.last_id, upper_id)
+            # El lote y su checkpoint se confirman juntos (los triggers leen last_id)
+            checkpoint.last_id = upper_id
+            checkpoint.processed += rows
+            checkpoint.updated_at = time.time()
+            db.commit()
+            limiter.throttle(rows)
+
+        status = {"state": state, "last_id": checkpoint.last_id,
+                  "high_water": high_water, "processed": checkpoint.processed}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    app_logger.info(f"Backfill de agregados de sentimiento {state}: {status['processed']} paletas")
+    return status
+
+
+# ============================================================================
+# CONSULTA
+# ============================================================================
+
+def bucket_key(value: datetime, granularity: str) -> str:
+    return value.strftime(GRANULARITIES[granularity][1])
+
+
+def _stats(n: int, total: float, sumsq: float) -> Optional[dict]:
+    if not n:
+        return None
+    mean = total / n
+    return {"mean": round(mean, 4), "stddev": round(math.sqrt(max(0.0, sumsq / n - mean * mean)), 4)}
+
+
+def sentiment_series(db: Session, granularity: str, start: datetime, end: datetime,
+                     user_id: int = GLOBAL_USER_ID) -> list[dict]:
+    """
+    Serie temporal de sentimiento entre start y end (ambos incluidos, UTC)
+
+    Lee un rango de la clave primaria (user_id, bucket, ...): filas = intervalos x
+    sentimientos x métodos, sin tocar palettes_with_users.
+    """
+    table, _ = GRANULARITIES[granularity]
+    rows = db.execute(
+        select(table).where(
+            table.c.user_id == user_id,
+            table.c.bucket >= bucket_key(start, granularity),
+            table.c.bucket <= bucket_key(end, granularity),
+            table.c.count > 0,
+        ).order_by(table.c.bucket)
+    ).all()
+
+    series = []
+    for row in rows:
+        if not series or series[-1]["bucket"] != row.bucket:
+            series.append({"bucket": row.bucket, "total": 0, "by_sentiment": {}, "by_method": {},
+                           "_sums": [0, 0.0, 0.0, 0, 0.0, 0.0]})
+        point = series[-1]
+        point["total"] += row.count
+        point["by_sentiment"][row.sentiment_label] = point["by_sentiment"].get(row.sentiment_label, 0) + row.count
+        point["by_method"][row.analysis_method] = point["by_method"].get(row.analysis_method, 0) + row.count
+        sums = point["_sums"]
+        for i, name in enumerate(_VALUES[1:]):
+            sums[i] += getattr(row, name)
+    for point in series:
+        sums = point.pop("_sums")
+        point["polarity"] = _stats(*sums[:3])
+        point["confidence"] = _stats(*sums[3:])
+    return series
+
+
+def check_range(granularity: str, start: datetime, end: datetime):
+    if end < start:
+        raise ValueError("'to' debe ser posterior a 'from'")
+    if granularity == "hour" and end - start > timedelta(days=ROLLUP_MAX_HOURLY_DAYS):
+        raise ValueError(f"Con granularity=hour el rango máximo es de {ROLLUP_MAX_HOURLY_DAYS} días")
+
+
+event.listen(Base.metadata, "after_create", install_rollup_triggers)
+
+
+if __name__ == "__main__":
+    import argparse
+    from database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Backfill de los agregados de sentimiento")
+    parser.add_argument("--lote", type=int, default=ROLLUP_BACKFILL_CHUNK_SIZE, help="Paletas por lote")
+    parser.add_argument("--filas-por-segundo", type=float, default=ROLLUP_BACKFILL_MAX_ROWS_PER_SECOND,
+                        help="Límite de ritmo (0 = sin límite)")
+    parser.add_argument("--reconstruir", action="store_true", help="Recalcular todo desde cero")
+    args = parser.parse_args()
+
+    models_auth.Base.metadata.create_all(bind=engine)
+    status = backfill_rollups(SessionLocal, args.lote, args.filas_por_segundo, restart=args.reconstruir)
+    print(f"✅ Agregados al día ({status.get('processed', 0)} paletas en el backfill)")
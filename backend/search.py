@@ -0,0 +1,176 @@
+"""
+Búsqueda de texto completo sobre paletas
+SQLite: tabla virtual FTS5 (contenido externo) sincronizada por triggers
+PostgreSQL: índice GIN sobre to_tsvector (mismo contrato de resultados y cursor)
+"""
+
+from typing import Optional
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+import re
+
+from database import Base
+from triggers import NOT_DEFERRED, install_triggers, on_bulk_insert
+
+SEARCH_MAX_TERMS = 8
+# Pesos bm25 por columna: input_text pesa más que la traducción
+_BM25 = "bm25(palettes_fts, 2.0, 1.0)"
+# Misma expresión en el índice y en las consultas de PostgreSQL
+_TSVECTOR = "to_tsvector('simple', coalesce(input_text, '') || ' ' || coalesce(translated_text, ''))"
+
+_TOKEN = re.compile(r"\w+\*?")
+
+_FTS_TRIGGERS = {
+    "trg_palettes_fts_insert": (
+        "AFTER INSERT ON palettes_with_users WHEN " + NOT_DEFERRED,
+        "INSERT INTO palettes_fts (rowid, input_text, translated_text) "
+        "VALUES (NEW.id, NEW.input_text, NEW.translated_text);"
+    ),
+    "trg_palettes_fts_delete": (
+        "AFTER DELETE ON palettes_with_users",
+        "INSERT INTO palettes_fts (palettes_fts, rowid, input_text, translated_text) "
+        "VALUES ('delete', OLD.id, OLD.input_text, OLD.translated_text);"
+    ),
+    "trg_palettes_fts_update": (
+        "AFTER UPDATE OF input_text, translated_text ON palettes_with_users",
+        "INSERT INTO palettes_fts (palettes_fts, rowid, input_text, translated_text) "
+        "VALUES ('delete', OLD.id, OLD.input_text, OLD.translated_text); "
+        "INSERT INTO palettes_fts (rowid, input_text, translated_text) "
+        "VALUES (NEW.id, NEW.input_text, NEW.translated_text);"
+    ),
+}
+
+
+class InvalidSearchQuery(ValueError):
+    """Consulta vacía o sin términos utilizables"""
+
+
+def install_search_index(target, connection, **kw):
+    """Hook after_create de la metadata: índice de texto completo según el motor"""
+    if connection.dialect.name == "postgresql":
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_palettes_with_users_tsv "
+            f"ON palettes_with_users USING gin ({_TSVECTOR})"
+        ))
+        return
+    if connection.dialect.name != "sqlite":
+        return
+    connection.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS palettes_fts USING fts5("
+        "input_text, translated_text, content='palettes_with_users', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')"
+    ))
+    if install_triggers(connection, _FTS_TRIGGERS):
+        # Triggers nuevos (primera instalación o tabla recreada): reindexar el contenido actual
+        connection.execute(text("INSERT INTO palettes_fts (palettes_fts) VALUES ('rebuild')"))
+
+
+@on_bulk_insert
+def apply_bulk_insert(connection, after_id: int):
+    """Inserción masiva: indexar las paletas nuevas con un solo INSERT ... SELECT"""
+    connection.execute(text(
+        "INSERT INTO palettes_fts (rowid, input_text, translated_text) "
+        "SELECT id, input_text, translated_text FROM palettes_with_users WHERE id > :after_id"
+    ), {"after_id": after_id})
+
+
+def parse_query(q: str) -> list[tuple[str, bool]]:
+    """Términos de búsqueda: [(término, es_prefijo)]; 'feli*' busca por prefijo"""
+    terms = []
+    for token in _TOKEN.findall(q or ""):
+        prefix = token.endswith("*")
+        term = token.rstrip("*").lower()
+        if term:
+            terms.append((term, prefix))
+    if not terms:
+        raise InvalidSearchQuery("La búsqueda no contiene términos")
+    return terms[:SEARCH_MAX_TERMS]
+
+
+def _fts5_query(terms: list[tuple[str, bool]]) -> str:
+    # Cada término entre comillas: la entrada del usuario nunca se interpreta como sintaxis FTS5
+    return " ".join(f'"{term}"' + ("*" if prefix else "") for term, prefix in terms)
+
+
+def _tsquery(terms: list[tuple[str, bool]]) -> str:
+    return " & ".join(f"'{term}'" + (":*" if prefix else "") for term, prefix in terms)
+
+
+def _parse_cursor(cursor: Optional[str]) -> Optional[tuple[float, int]]:
+    if not cursor:
+        return None
+    try:
+        score, _, last_id = cursor.rpartition(":")
+        return float(score), int(last_id)
+    except ValueError:
+        raise InvalidSearchQuery("Cursor inválido") from None
+
+
+def search_palettes(db: Session, q: str, user_id: Optional[int] = None, limit: int = 20,
+                    cursor: Optional[str] = None, sort: str = "relevance") -> tuple[list[dict], Optional[str]]:
+    """
+    Buscar paletas, paginando por cursor
+
+    Args:
+        user_id: Restringir a las paletas de un usuario (None = todas)
+        cursor: next_cursor de la página anterior
+        sort: "relevance" (mejor primero, pagina por (score, id)) o "recent" (más nuevas
+            primero, pagina por id). "recent" no puntúa todas las coincidencias: con
+            términos muy frecuentes se detiene en cuanto llena la página.
+
+    Returns:
+        (resultados, next_cursor o None si no hay más)
+    """
+    if sort not in ("relevance", "recent"):
+        raise InvalidSearchQuery("Orden inválido")
+    terms = parse_query(q)
+    after = _parse_cursor(cursor)
+    params = {"limit": limit + 1, "user_id": user_id}
+    recent = sort == "recent"
+
+    postgres = db.get_bind().dialect.name == "postgresql"
+    if postgres:
+        params["q"] = _tsquery(terms)
+        score = "0.0" if recent else f"-ts_rank_cd({_TSVECTOR}, to_tsquery('simple', :q))"
+        source, match = "palettes_with_users m", f"{_TSVECTOR} @@ to_tsquery('simple', :q)"
+        row_id = "m.id"
+    else:
+        params["q"] = _fts5_query(terms)
+        score = "0.0" if recent else _BM25
+        # CROSS JOIN fija el orden: FTS5 manda (si no, el planificador puede recorrer
+        # palettes_with_users por el índice de user_id y consultar FTS5 fila a fila)
+        source = "palettes_fts f CROSS JOIN palettes_with_users m ON m.id = f.rowid"
+        match = "palettes_fts MATCH :q"
+        row_id = "f.rowid"  # orden por rowid: FTS5 lo recorre sin ordenar
+
+    conditions = [match]
+    if user_id is not None:
+        conditions.append("m.user_id = :user_id")
+    if after is not None:
+        params["after_score"], params["after_id"] = after
+        conditions.append(f"{row_id} < :after_id" if recent else
+                          f"({score} > :after_score OR ({score} = :after_score AND m.id > :after_id))")
+    order = f"{row_id} DESC" if recent else "score, m.id"
+
+    rows = db.execute(text(
+        f"SELECT m.id, m.input_text, m.translated_text, m.colors, m.sentiment_label, "
+        f"m.created_at, {score} AS score FROM {source} "
+        f"WHERE {' AND '.join(conditions)} ORDER BY {order} LIMIT :limit"
+    ), params).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1].score!r}:{rows[-1].id}"
+    return [{
+        "id": row.id,
+        "input_text": row.input_text,
+        "translated_text": row.translated_text,
+        "colors": row.colors,
+        "sentiment_label": row.sentiment_label,
+        "created_at": row.created_at.isoformat() if hasattr(row.created_at, "isoformat") else row.created_at,
+        "score": -row.score,
+    } for row in rows], next_cursor
+
+
+event.listen(Base.metadata, "after_create", install_search_index)
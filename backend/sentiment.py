@@ -0,0 +1,118 @@
+"""
+Análisis de sentimiento y generación de colores
+Los usa /analyze (un texto, con traducción) y la importación masiva (por lotes, sin traducción)
+"""
+
+from typing import Iterable
+from textblob import TextBlob
+from deep_translator import GoogleTranslator
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+import numpy as np
+import colorsys
+
+from logger_config import app_logger
+from metrics import record_translation
+from color_generator import AdvancedColorGenerator
+
+# Analizadores
+vader_analyzer = SentimentIntensityAnalyzer()
+
+ANALYSIS_METHODS = ("hybrid", "textblob", "vader")
+
+ENHANCED_PALETTES = {
+    "very_positive": {"emotion": "Alegría intensa", "description": "Colores vibrantes"},
+    "positive": {"emotion": "Optimismo", "description": "Colores cálidos"},
+    "slightly_positive": {"emotion": "Satisfacción", "description": "Colores suaves"},
+    "neutral": {"emotion": "Equilibrio", "description": "Colores balanceados"},
+    "slightly_negative": {"emotion": "Melancolía", "description": "Tonos grises"},
+    "negative": {"emotion": "Tristeza", "description": "Colores oscuros"},
+    "very_negative": {"emotion": "Angustia", "description": "Colores intensos oscuros"}
+}
+
+# Funciones auxiliares
+def translate_text(text: str, target_lang: str = 'en') -> str:
+    try:
+        translated = GoogleTranslator(source='auto', target=target_lang).translate(text)
+        record_translation("auto", target_lang)
+        return translated if translated else text
+    except Exception as e:
+        app_logger.warning(f"⚠️ Error traducción: {e}")
+        return text
+
+def analyze_with_textblob(text: str) -> tuple[float, float]:
+    blob = TextBlob(text)
+    return blob.sentiment.polarity, blob.sentiment.subjectivity
+
+def analyze_with_vader(text: str) -> tuple[float, dict]:
+    scores = vader_analyzer.polarity_scores(text)
+    return scores['compound'], scores
+
+def hybrid_analysis(text: str) -> tuple[float, float, dict]:
+    tb_polarity, tb_subjectivity = analyze_with_textblob(text)
+    vader_polarity, vader_scores = analyze_with_vader(text)
+    combined_polarity = (vader_polarity * 0.6) + (tb_polarity * 0.4)
+    agreement = 1 - abs(tb_polarity - vader_polarity) / 2
+    confidence = max(0.3, agreement)
+
+    analysis_details = {
+        "textblob_polarity": round(tb_polarity, 3),
+        "vader_compound": round(vader_polarity, 3),
+        "agreement_score": round(agreement, 3)
+    }
+    return combined_polarity, confidence, analysis_details
+
+def score_text(text: str, method: str = "hybrid") -> tuple[float, float, dict]:
+    """(polaridad, confianza, detalles) con el método pedido"""
+    if method == "textblob":
+        polarity, subjectivity = analyze_with_textblob(text)
+        return polarity, 1 - subjectivity, {"subjectivity": round(subjectivity, 3)}
+    if method == "vader":
+        polarity, vader_scores = analyze_with_vader(text)
+        return polarity, abs(polarity), {"vader_scores": vader_scores}
+    return hybrid_analysis(text)
+
+def score_many(texts: Iterable[str], method: str = "hybrid") -> list[tuple[float, float]]:
+    """(polaridad, confianza) por texto, sin traducir (importaciones por lotes)"""
+    return [score_text(text, method)[:2] for text in texts]
+
+def get_enhanced_sentiment(polarity: float, confidence: float = 1.0) -> tuple[str, str, dict]:
+    intensity_factor = abs(polarity) * confidence
+
+    if polarity > 0.6: sentiment_key = "very_positive"
+    elif polarity > 0.3: sentiment_key = "positive"
+    elif polarity > 0.05: sentiment_key = "slightly_positive"
+    elif polarity < -0.6: sentiment_key = "very_negative"
+    elif polarity < -0.3: sentiment_key = "negative"
+    elif polarity < -0.05: sentiment_key = "slightly_negative"
+    else: sentiment_key = "neutral"
+
+    if intensity_factor > 0.7: intensity = "muy alta"
+    elif intensity_factor > 0.4: intensity = "alta"
+    elif intensity_factor > 0.2: intensity = "media"
+    else: intensity = "baja"
+
+    sentiment_label = sentiment_key.replace("_", " ")
+    return sentiment_label, intensity, ENHANCED_PALETTES[sentiment_key]
+
+def generate_advanced_colors(sentiment_key: str, confidence: float) -> dict:
+    return AdvancedColorGenerator.generate_advanced_palette(sentiment_key, confidence)
+
+def generate_dynamic_palette(polarity: float, confidence: float) -> list[str]:
+    base_hue = np.interp(polarity, [-1, 1], [0, 120]) / 360.0
+    base_saturation = np.interp(confidence, [0, 1], [0.45, 0.95])
+    base_lightness = np.interp(abs(polarity), [0, 1], [0.9, 0.5])
+
+    palette_hsl = [
+        (base_hue, base_saturation, min(0.95, base_lightness + 0.15)),
+        ((base_hue - 30/360.0) % 1.0, base_saturation, base_lightness),
+        (base_hue, base_saturation, base_lightness),
+        ((base_hue + 30/360.0) % 1.0, base_saturation, base_lightness),
+        (base_hue, base_saturation, max(0.2, base_lightness - 0.15))
+    ]
+
+    palette_hex = []
+    for h, s, l in palette_hsl:
+        rgb = colorsys.hls_to_rgb(h, l, s)
+        hex_color = f"#{''.join(f'{int(c * 255):02x}' for c in rgb)}"
+        palette_hex.append(hex_color)
+    return palette_hex
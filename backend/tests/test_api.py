@@ -13,9 +13,10 @@ import sys
 # Agregar el directorio backend al path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from main import app, get_db
+from main import app, get_db, get_read_db
 from database import Base
-from auth import get_password_hash
+from auth import get_password_hash, user_cache
+from revocation import revocation_list
 import models_auth
 
 # ================================================
@@ -42,6 +43,7 @@ def override_get_db():
         db.close()
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
 
 # Cliente de test
 client = TestClient(app)
@@ -55,6 +57,9 @@ def test_db():
     """Fixture que proporciona una base de datos limpia para cada test"""
     Base.metadata.drop_all(bind=test_engine)
     Base.metadata.create_all(bind=test_engine)
+    # El estado en memoria refleja la BD recién recreada
+    user_cache.clear()
+    revocation_list.clear()
     db = TestingSessionLocal()
     try:
         yield db
@@ -566,16 +571,1079 @@ def test_concurrent_palette_creation(auth_token):
     # Todas deberían ser exitosas
     assert all(r.status_code == 200 for r in results)
 
+# ================================================
+# TESTS DE CACHÉ DE USUARIOS
+# ================================================
+
+def test_token_includes_user_id(auth_token, test_user):
+    """Test 32: El token incluye el id del usuario"""
+    from auth import decode_token
+    payload = decode_token(auth_token)
+    assert payload["uid"] == test_user.id
+
+def test_deactivated_user_cache_invalidated(auth_token, admin_token, test_user):
+    """Test 33: Desactivar un usuario invalida su entrada en caché"""
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    assert client.get("/gallery", headers=headers).status_code == 200
+    
+    response = client.put(
+        f"/users/{test_user.id}/status",
+        headers={"Authorization": f"Bearer {admin_token}"},
+        json={"is_active": False}
+    )
+    assert response.status_code == 200
+    # Desactivar revoca sus tokens vigentes
+    assert client.get("/gallery", headers=headers).status_code == 401
+    assert client.get("/stats", headers=headers).status_code == 401
+
+def test_logout_revokes_token(auth_token):
+    """Test 34: Tras logout el token deja de ser válido"""
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    assert client.post("/logout", headers=headers).status_code == 200
+    response = client.get("/stats", headers=headers)
+    assert response.status_code == 401
+    assert "revocado" in response.json()["detail"]
+
+def test_reactivated_user_can_login_again(auth_token, admin_token, test_user):
+    """Test 35: Un usuario reactivado obtiene tokens válidos"""
+    admin_headers = {"Authorization": f"Bearer {admin_token}"}
+    client.put(f"/users/{test_user.id}/status", headers=admin_headers, json={"is_active": False})
+    client.put(f"/users/{test_user.id}/status", headers=admin_headers, json={"is_active": True})
+    
+    response = client.post("/token", data={"username": "testuser", "password": "Password123"})
+    token = response.json()["access_token"]
+    assert client.get("/gallery", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+
+def test_revocations_persist_and_prune(test_db):
+    """Test 36: Las revocaciones se recargan desde SQLite y se purgan al expirar"""
+    import time
+    from revocation import RevocationList
+    revocations = RevocationList(capacity=16)
+    revocations.revoke(test_db, "vigente", time.time() + 60)
+    revocations.revoke(test_db, "expirado", time.time() - 1)
+    
+    reloaded = RevocationList(capacity=16)
+    reloaded.load(test_db)
+    assert reloaded.is_revoked("vigente")
+    assert not reloaded.is_revoked("expirado")
+    
+    assert revocations.prune(test_db) == 1
+    assert test_db.query(models_auth.RevokedToken).count() == 1
+
+def test_refresh_token_rotation(test_user):
+    """Test 37: /token/refresh emite un access token nuevo y rota el refresh token"""
+    login = client.post("/token", data={"username": "testuser", "password": "Password123"}).json()
+    assert login["refresh_token"]
+    
+    response = client.post("/token/refresh", json={"refresh_token": login["refresh_token"]})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["refresh_token"] != login["refresh_token"]
+    headers = {"Authorization": f"Bearer {data['access_token']}"}
+    assert client.get("/gallery", headers=headers).status_code == 200
+
+def test_refresh_token_reuse_revokes_family(test_user):
+    """Test 38: ERROR - Reusar un refresh token rotado revoca toda la familia"""
+    login = client.post("/token", data={"username": "testuser", "password": "Password123"}).json()
+    rotated = client.post("/token/refresh", json={"refresh_token": login["refresh_token"]}).json()
+    
+    reuse = client.post("/token/refresh", json={"refresh_token": login["refresh_token"]})
+    assert reuse.status_code == 401
+    latest = client.post("/token/refresh", json={"refresh_token": rotated["refresh_token"]})
+    assert latest.status_code == 401
+
+def test_role_change_reissues_permissions(auth_token, admin_token, test_user):
+    """Test 39: Cambiar el rol invalida los tokens previos; el refresh trae la máscara nueva"""
+    login = client.post("/token", data={"username": "testuser", "password": "Password123"}).json()
+    response = client.put(
+        f"/users/{test_user.id}/role",
+        headers={"Authorization": f"Bearer {admin_token}"},
+        json={"role": "viewer"}
+    )
+    assert response.status_code == 200
+    
+    old_headers = {"Authorization": f"Bearer {login['access_token']}"}
+    assert client.get("/gallery", headers=old_headers).status_code == 401
+    
+    refreshed = client.post("/token/refresh", json={"refresh_token": login["refresh_token"]}).json()
+    headers = {"Authorization": f"Bearer {refreshed['access_token']}"}
+    assert client.get("/gallery", headers=headers).status_code == 200
+    response = client.post("/analyze", headers=headers, json={"text": "Hola mundo", "method": "vader"})
+    assert response.status_code == 403
+
+def test_permission_override_grants_access(admin_token, test_user):
+    """Test 40: Un override por usuario concede un permiso fuera de su rol"""
+    response = client.put(
+        f"/users/{test_user.id}/permissions",
+        headers={"Authorization": f"Bearer {admin_token}"},
+        json={"grant": ["delete_all_palettes"], "deny": ["create_palette"]}
+    )
+    assert response.status_code == 200
+    permissions = response.json()["permissions"]
+    assert "delete_all_palettes" in permissions
+    assert "create_palette" not in permissions
+
+def test_login_rehashes_password_with_new_cost(test_db):
+    """Test 41: El login re-hashea contraseñas con un costo bcrypt distinto"""
+    from passlib.hash import bcrypt
+    from password_hashing import BCRYPT_ROUNDS
+    user = models_auth.User(
+        username="legacy",
+        email="legacy@example.com",
+        hashed_password=bcrypt.using(rounds=4).hash("Password123"),
+        role="user",
+        is_active=True
+    )
+    test_db.add(user)
+    test_db.commit()
+    
+    response = client.post("/token", data={"username": "legacy", "password": "Password123"})
+    assert response.status_code == 200
+    test_db.refresh(user)
+    assert user.hashed_password.startswith(f"$2b${BCRYPT_ROUNDS:02d}$")
+
+def test_login_waits_for_bcrypt_without_holding_a_connection(test_user, monkeypatch):
+    """Test 42: Mientras bcrypt verifica, /token no retiene hilos del threadpool ni conexiones"""
+    import asyncio
+    import threading
+    import main
+    import password_hashing
+    assert asyncio.iscoroutinefunction(main.login) and asyncio.iscoroutinefunction(main.register_user)
+    
+    hashing, release = threading.Event(), threading.Event()
+    verify = password_hashing.pwd_context.verify_and_update
+    def slow_verify(password, hashed):
+        hashing.set()
+        release.wait(10)
+        return verify(password, hashed)
+    monkeypatch.setattr(password_hashing.pwd_context, "verify_and_update", slow_verify)
+    
+    connections = test_engine.pool.checkedout()
+    responses = []
+    login = threading.Thread(target=lambda: responses.append(
+        client.post("/token", data={"username": "testuser", "password": "Password123"})))
+    login.start()
+    assert hashing.wait(10)
+    assert test_engine.pool.checkedout() == connections
+    release.set()
+    login.join(10)
+    assert responses[0].status_code == 200 and responses[0].json()["user"]["username"] == "testuser"
+
+# ================================================
+# TESTS DE ROTACIÓN DE CLAVES
+# ================================================
+
+def _users_with_old_key(db, count):
+    for i in range(count):
+        db.add(models_auth.User(
+            username=f"rot{i}", email=f"rot{i}@example.com", hashed_password="x",
+            phone=f"555-{i:04d}", address=f"Calle {i}" if i % 2 else None,
+            role="user", is_active=True
+        ))
+    db.commit()
+
+def test_reencryption_job_rotates_and_resumes(test_db, monkeypatch):
+    """Test 43: La re-encriptación rota la clave por lotes y se reanuda desde el checkpoint"""
+    import key_rotation
+    from encryption import KeyRing, get_keyring, set_keyring, ciphertext_key_id
+    original = get_keyring()
+    _users_with_old_key(test_db, 5)
+    try:
+        set_keyring(KeyRing({0: original.keys[0], 5: os.urandom(32)}, active_id=5))
+        job = key_rotation.ReencryptionJob(TestingSessionLocal, chunk_size=2, workers=2,
+                                           max_rows_per_second=0)
+        # Detener tras el primer lote
+        monkeypatch.setattr(key_rotation, "record_reencryption_chunk", lambda *args: job.stop())
+        assert job.run()["state"] == "stopped"
+        assert job.status["processed"] == 2
+        
+        monkeypatch.undo()
+        status = job.run()
+        assert status["state"] == "finished"
+        assert status["processed"] == 5 and status["updated"] == 3
+        
+        test_db.expire_all()
+        for user in test_db.query(models_auth.User).order_by(models_auth.User.id):
+            assert ciphertext_key_id(user.phone_encrypted) == 5
+            assert user.phone.startswith("555-")
+            assert user.address is None or ciphertext_key_id(user.address_encrypted) == 5
+    finally:
+        set_keyring(original)
+
+def test_reencryption_skips_undecryptable_rows(test_db):
+    """Test 44: ERROR - Un valor que no se puede descifrar no se re-cifra"""
+    import key_rotation
+    from encryption import KeyRing, get_keyring, set_keyring
+    original = get_keyring()
+    _users_with_old_key(test_db, 2)
+    user = test_db.query(models_auth.User).first()
+    try:
+        # La clave 0 cambió: los valores viejos ya no se pueden descifrar
+        set_keyring(KeyRing({0: os.urandom(32), 5: os.urandom(32)}, active_id=5))
+        phone_before = user.phone_encrypted
+        status = key_rotation.ReencryptionJob(TestingSessionLocal, max_rows_per_second=0).run()
+        assert status["failed"] == 2 and status["updated"] == 0
+        test_db.refresh(user)
+        assert user.phone_encrypted == phone_before
+    finally:
+        set_keyring(original)
+
+def test_reencrypt_endpoint_requires_admin(auth_token):
+    """Test 45: ERROR - Solo un admin puede lanzar la re-encriptación"""
+    response = client.post("/admin/reencrypt", headers={"Authorization": f"Bearer {auth_token}"})
+    assert response.status_code == 403
+
+# ================================================
+# TESTS DE LISTADO DE ADMINISTRACIÓN
+# ================================================
+
+def _bulk_users(db, count, prefix="bulk", role="user"):
+    db.add_all([models_auth.User(
+        username=f"{prefix}{i:03d}", email=f"{prefix}{i}@example.com", hashed_password="x",
+        role=role, is_active=i % 3 != 0
+    ) for i in range(count)])
+    db.commit()
+
+def test_list_users_keyset_pagination_and_counts(admin_token, test_db):
+    """Test 46: El listado se pagina por id y los totales vienen de los contadores"""
+    _bulk_users(test_db, 12)
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    seen, after_id = [], 0
+    while True:
+        page = client.get(f"/users?limit=5&after_id={after_id}", headers=headers).json()
+        seen += [u["id"] for u in page["items"]]
+        if page["next_after_id"] is None:
+            break
+        after_id = page["next_after_id"]
+    assert len(seen) == 13 and seen == sorted(seen)
+    assert page["counts"]["total"] == 13
+    assert page["counts"]["by_role"] == {"admin": 1, "user": 12}
+    assert page["counts"]["active"] == 9
+
+def test_list_users_filters_and_prefix_search(admin_token, test_db):
+    """Test 47: Filtros por rol y estado y búsqueda por prefijo de username"""
+    _bulk_users(test_db, 4, prefix="ana")
+    _bulk_users(test_db, 3, prefix="beto", role="viewer")
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    
+    names = lambda url: [u["username"] for u in client.get(url, headers=headers).json()["items"]]
+    assert names("/users?q=ana") == ["ana000", "ana001", "ana002", "ana003"]
+    assert names("/users?role=viewer&is_active=true") == ["beto001", "beto002"]
+    assert names("/users?q=zz") == []
+
+def test_counters_follow_updates_and_deletes(test_db):
+    """Test 48: Los triggers mantienen los contadores en UPDATE y DELETE masivos"""
+    from counters import user_counts
+    _bulk_users(test_db, 6)
+    test_db.query(models_auth.User).filter(models_auth.User.username < "bulk002").update(
+        {models_auth.User.role: "viewer", models_auth.User.is_active: False}, synchronize_session=False)
+    test_db.query(models_auth.User).filter(models_auth.User.username == "bulk005").delete()
+    test_db.commit()
+    counts = user_counts(test_db)
+    assert counts["total"] == 5
+    assert counts["by_role"] == {"user": 3, "viewer": 2}
+    assert counts["active"] == test_db.query(models_auth.User).filter(models_auth.User.is_active).count()
+
+# ================================================
+# TESTS DE OPERACIONES MASIVAS
+# ================================================
+
+def test_bulk_status_by_filter_excludes_self(admin_token, test_db):
+    """Test 49: Desactivación masiva por filtro; el admin que la ejecuta queda excluido"""
+    _bulk_users(test_db, 6)
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = client.put("/users/bulk/status", headers=headers,
+                          json={"selection": {"is_active": True}, "is_active": False})
+    assert response.status_code == 200
+    assert response.json()["affected"] == 4  # 4 usuarios activos, sin contar al admin
+    assert client.get("/users?is_active=true", headers=headers).json()["items"][0]["username"] == "admin"
+    assert test_db.query(models_auth.User).filter(models_auth.User.is_active).count() == 1
+
+def test_bulk_role_revokes_existing_tokens(auth_token, admin_token, test_user):
+    """Test 50: El cambio masivo de rol invalida los tokens emitidos con el rol anterior"""
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = client.put("/users/bulk/role", headers=headers,
+                          json={"selection": {"ids": [test_user.id, 9999]}, "role": "viewer"})
+    assert response.json()["affected"] == 1
+    assert client.get("/users/me", headers={"Authorization": f"Bearer {auth_token}"}).status_code == 401
+
+def test_bulk_operations_protect_self(admin_token, test_admin):
+    """Test 51: ERROR - No se puede incluir explícitamente al propio admin"""
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = client.post("/users/bulk/delete", headers=headers, json={"ids": [test_admin.id]})
+    assert response.status_code == 400
+    response = client.put("/users/bulk/role", headers=headers, json={"selection": {}, "role": "user"})
+    assert response.status_code == 400
+
+def test_bulk_delete_removes_users_and_palettes(admin_token, test_db):
+    """Test 52: Eliminación masiva con sus paletas, en una transacción"""
+    from counters import user_counts
+    _bulk_users(test_db, 5, prefix="spam")
+    spam = test_db.query(models_auth.User).filter(models_auth.User.username.startswith("spam")).all()
+    test_db.add_all([models_auth.PaletteWithUser(input_text="x", polarity="0", colors="[]", user_id=u.id) for u in spam])
+    test_db.commit()
+    
+    response = client.post("/users/bulk/delete", headers={"Authorization": f"Bearer {admin_token}"},
+                           json={"q": "spam"})
+    assert response.json()["affected"] == 5
+    assert test_db.query(models_auth.PaletteWithUser).count() == 0
+    assert user_counts(test_db)["total"] == 1
+
+def _palettes(db, user_id, labels):
+    db.add_all([models_auth.PaletteWithUser(input_text=f"p{i}", polarity="0", colors="[]",
+                                            sentiment_label=label, user_id=user_id)
+                for i, label in enumerate(labels)])
+    db.commit()
+
+def test_bulk_delete_palettes_chunked(admin_token, test_user, test_db, monkeypatch):
+    """Test 53: Borrado masivo por sentimiento en lotes, con métrica bulk y contadores"""
+    import palette_admin
+    from metrics import palettes_deleted_total
+    _palettes(test_db, test_user.id, ["Positivo", "Negativo"] * 7)
+    commits = []
+    original = palette_admin._delete_chunk
+    monkeypatch.setattr(palette_admin, "_delete_chunk", lambda db, ids: commits.append(len(ids)) or original(db, ids))
+    monkeypatch.setattr(palette_admin, "PALETTE_DELETE_CHUNK_SIZE", 3)
+    before = palettes_deleted_total.labels(deletion_type="bulk")._value.get()
+    
+    response = client.post("/palettes/bulk/delete", headers={"Authorization": f"Bearer {admin_token}"},
+                           json={"sentiment": "Negativo", "user_id": test_user.id})
+    assert response.json()["deleted"] == 7
+    assert commits == [3, 3, 1]
+    assert palettes_deleted_total.labels(deletion_type="bulk")._value.get() - before == 7
+    stats = client.get("/stats", headers={"Authorization": f"Bearer {admin_token}"}).json()
+    assert stats["total_palettes"] == 7
+
+def test_bulk_delete_palettes_requires_permission(auth_token, test_user, test_db):
+    """Test 54: ERROR - Sin delete_all_palettes no se permite el borrado masivo"""
+    _palettes(test_db, test_user.id, ["Positivo"])
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    response = client.post("/palettes/bulk/delete", headers=headers, json={"user_id": test_user.id})
+    assert response.status_code == 403
+    assert test_db.query(models_auth.PaletteWithUser).count() == 1
+
+# ================================================
+# TESTS DE BÚSQUEDA
+# ================================================
+
+def test_search_palettes_ranked_prefix_and_pages(auth_token, test_user, test_db):
+    """Test 55: Búsqueda FTS5 con prefijos, acentos, ranking y paginación por cursor"""
+    texts = ["Día feliz en la playa", "Feliz feliz cumpleaños", "Un día triste", "Felicidad total"]
+    test_db.add_all([models_auth.PaletteWithUser(input_text=t, translated_text=None, polarity="0",
+                                                 colors="[]", user_id=test_user.id) for t in texts])
+    test_db.commit()
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    
+    results = client.get("/palettes/search?q=feliz", headers=headers).json()["results"]
+    assert [r["input_text"] for r in results][0] == "Feliz feliz cumpleaños"
+    assert len(results) == 2
+    assert len(client.get("/palettes/search?q=dia", headers=headers).json()["results"]) == 2
+    
+    seen, cursor = [], ""
+    while True:
+        page = client.get(f"/palettes/search?q=feli*&limit=2&cursor={cursor}", headers=headers).json()
+        seen += [r["id"] for r in page["results"]]
+        if not page["next_cursor"]:
+            break
+        cursor = page["next_cursor"]
+    assert len(seen) == len(set(seen)) == 3
+    
+    recent = client.get("/palettes/search?q=feli*&sort=recent&limit=2", headers=headers).json()
+    ids = [r["id"] for r in recent["results"]]
+    assert ids == sorted(ids, reverse=True) and recent["next_cursor"]
+
+def test_search_respects_visibility_and_updates(auth_token, test_user, test_admin, test_db):
+    """Test 56: Solo se ven paletas propias y el índice sigue a updates y deletes"""
+    own = models_auth.PaletteWithUser(input_text="cielo azul", polarity="0", colors="[]", user_id=test_user.id)
+    other = models_auth.PaletteWithUser(input_text="cielo gris", polarity="0", colors="[]", user_id=test_admin.id)
+    test_db.add_all([own, other])
+    test_db.commit()
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    assert [r["input_text"] for r in client.get("/palettes/search?q=cielo", headers=headers).json()["results"]] == ["cielo azul"]
+    
+    own.input_text = "mar azul"
+    test_db.commit()
+    assert client.get("/palettes/search?q=cielo", headers=headers).json()["results"] == []
+    assert client.get("/palettes/search?q=%22%29%28", headers=headers).status_code == 400
+
+# ================================================
+# TESTS DE EXPORTACIÓN
+# ================================================
+
+def test_export_ndjson_only_own_palettes(auth_token, test_user, test_admin, test_db):
+    """Test 57: La exportación NDJSON solo incluye las paletas del usuario"""
+    import json
+    _palettes(test_db, test_user.id, ["Positivo", "Negativo", "Neutral"])
+    _palettes(test_db, test_admin.id, ["Positivo"])
+    response = client.get("/palettes/export?format=ndjson", headers={"Authorization": f"Bearer {auth_token}"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["sentiment_label"] for r in records] == ["Positivo", "Negativo", "Neutral"]
+    assert {r["user_id"] for r in records} == {test_user.id}
+
+def test_export_csv_gzip_streams_in_chunks(admin_token, test_user, test_db, monkeypatch):
+    """Test 58: CSV comprimido con gzip, generado por trozos"""
+    import csv, gzip, io
+    import palette_export
+    monkeypatch.setattr(palette_export, "EXPORT_CHUNK_BYTES", 256)
+    _palettes(test_db, test_user.id, ["Positivo"] * 50)
+    
+    chunks = list(palette_export.export_palettes(test_db.get_bind(), "csv", None, compress=True))
+    assert len(chunks) > 1
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(b"".join(chunks)).decode())))
+    assert len(rows) == 50 and rows[0]["input_text"] == "p0"
+    
+    response = client.get("/palettes/export?format=csv", headers={
+        "Authorization": f"Bearer {admin_token}", "Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.text.splitlines()) == 51
+
+# ================================================
+# TESTS DE IMPORTACIÓN
+# ================================================
+
+def _upload(token, content, filename="palettes.ndjson", **params):
+    query = "&".join(f"{k}={v}" for k, v in params.items())
+    return client.post(f"/palettes/import?{query}", files={"file": (filename, content)},
+                       headers={"Authorization": f"Bearer {token}"})
+
+def test_import_ndjson_validates_rows(auth_token, test_user, test_db):
+    """Test 59: Importación NDJSON: filas válidas insertadas, inválidas reportadas"""
+    import json
+    from counters import get_counters
+    lines = [
+        json.dumps({"input_text": "día soleado", "colors": ["#ffd700", "#ffa500"], "polarity": 0.7,
+                    "sentiment_label": "very positive", "created_at": "2024-05-01T10:00:00Z"}),
+        json.dumps({"input_text": "lluvia", "colors": "#000000,#333333", "polarity": "-0.4"}),
+        json.dumps({"input_text": "sin colores"}),
+        "{no es json",
+        json.dumps({"input_text": "fuera de rango", "colors": ["#ffffff"], "polarity": 3}),
+    ]
+    response = _upload(auth_token, "\n".join(lines))
+    assert response.status_code == 200
+    result = response.json()
+    assert (result["state"], result["rows"], result["inserted"], result["rejected"]) == ("finished", 5, 2, 3)
+    assert [e["row"] for e in result["errors"]] == [3, 4, 5]
+    
+    palettes = test_db.query(models_auth.PaletteWithUser).order_by(models_auth.PaletteWithUser.id).all()
+    assert [p.user_id for p in palettes] == [test_user.id] * 2
+    assert palettes[0].colors == "#ffd700,#ffa500" and palettes[0].polarity == "0.700"
+    assert palettes[0].created_at.isoformat().startswith("2024-05-01T10:00:00")
+    assert palettes[1].analysis_method == "import"
+    assert get_counters(test_db)["palettes"] == 2
+
+def test_import_csv_round_trip_from_export(auth_token, test_user, test_db):
+    """Test 60: Un CSV de /palettes/export se vuelve a importar tal cual"""
+    _palettes(test_db, test_user.id, ["Positivo", "Negativo"])
+    test_db.query(models_auth.PaletteWithUser).update({"colors": "#112233,#445566"})
+    test_db.commit()
+    exported = client.get("/palettes/export?format=csv", headers={"Authorization": f"Bearer {auth_token}"}).content
+    
+    result = _upload(auth_token, exported, filename="palettes.csv").json()
+    assert (result["inserted"], result["rejected"]) == (2, 0)
+    labels = [p.sentiment_label for p in test_db.query(models_auth.PaletteWithUser).order_by(models_auth.PaletteWithUser.id)]
+    assert labels == ["Positivo", "Negativo"] * 2
+    assert _upload(auth_token, b"texto\nhola", filename="x.csv").status_code == 400
+
+def test_import_resumes_from_checkpoint(auth_token, test_user, test_db, monkeypatch):
+    """Test 61: Una importación interrumpida se reanuda sin duplicar filas"""
+    import palette_import
+    monkeypatch.setattr(palette_import, "IMPORT_BATCH_SIZE", 2)
+    content = "\n".join(f'{{"input_text": "texto {i}", "colors": ["#abcdef"]}}' for i in range(5))
+    calls = []
+    
+    def fail_after_first_batch(counts):
+        calls.append(counts)
+        if len(calls) == 1:
+            raise RuntimeError("worker caído")
+    monkeypatch.setattr(palette_import, "record_palettes_imported", fail_after_first_batch)
+    with pytest.raises(RuntimeError):
+        _upload(auth_token, content, import_id="lote-1")
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    progress = client.get("/palettes/import/lote-1", headers=headers).json()
+    assert (progress["state"], progress["rows"], progress["inserted"]) == ("in_progress", 2, 2)
+    
+    result = _upload(auth_token, content, import_id="lote-1").json()
+    assert (result["state"], result["rows"], result["inserted"]) == ("finished", 5, 5)
+    assert _upload(auth_token, content, import_id="lote-1").json()["inserted"] == 5
+    texts = [p.input_text for p in test_db.query(models_auth.PaletteWithUser).order_by(models_auth.PaletteWithUser.id)]
+    assert texts == [f"texto {i}" for i in range(5)]
+    assert client.get("/palettes/import/otro", headers=headers).status_code == 404
+
+def test_import_recompute_missing_fields(auth_token, test_db):
+    """Test 62: Con recompute se calculan sentimiento y colores que falten"""
+    content = '{"input_text": "I love this wonderful day"}\n{"input_text": "nota", "polarity": -0.8}'
+    result = _upload(auth_token, content, recompute="true").json()
+    assert (result["inserted"], result["rejected"]) == (2, 0)
+    happy, sad = test_db.query(models_auth.PaletteWithUser).order_by(models_auth.PaletteWithUser.id).all()
+    assert float(happy.polarity) > 0.3 and happy.sentiment_label.endswith("positive")
+    assert sad.sentiment_label == "very negative" and sad.emotion_type == "Angustia"
+    assert all(len(p.colors.split(",")) == 5 for p in (happy, sad))
+
+# ================================================
+# TESTS DE MIGRACIÓN DE LA TABLA HEREDADA
+# ================================================
+
+@pytest.fixture
+def legacy_palettes(test_db):
+    """Tabla `palettes` con el esquema de models.Palette (ya no está en la metadata)"""
+    from sqlalchemy import text
+    with test_engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE palettes (id INTEGER PRIMARY KEY, input_text VARCHAR, translated_text VARCHAR, "
+            "polarity VARCHAR, colors VARCHAR, created_at DATETIME DEFAULT CURRENT_TIMESTAMP, "
+            "analysis_method VARCHAR, confidence_score FLOAT, sentiment_label VARCHAR, "
+            "intensity VARCHAR, emotion_type VARCHAR)"
+        ))
+        conn.execute(text(
+            "INSERT INTO palettes (input_text, polarity, colors, confidence_score, sentiment_label) "
+            "VALUES (:t, '0.5', '#ffffff', 0.75, 'positive')"
+        ), [{"t": f"heredada {i}"} for i in range(5)])
+    yield
+    with test_engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS palettes"))
+
+class _StopAfter:
+    """Evento de parada que se activa tras n consultas"""
+    def __init__(self, n):
+        self.calls, self.n = 0, n
+    def is_set(self):
+        self.calls += 1
+        return self.calls > self.n
+
+def test_legacy_migration_resumes_in_chunks(legacy_palettes, test_admin, test_db):
+    """Test 63: La migración copia por lotes y se reanuda desde el checkpoint"""
+    import legacy_migration
+    from counters import get_counters
+    status = legacy_migration.migrate_legacy_palettes(
+        TestingSessionLocal, test_admin.id, chunk_size=2, max_rows_per_second=0, stop=_StopAfter(2))
+    assert (status["state"], status["migrated"], status["total"]) == ("stopped", 4, 5)
+    
+    status = legacy_migration.migrate_legacy_palettes(TestingSessionLocal, test_admin.id, chunk_size=2,
+                                                      max_rows_per_second=0)
+    assert (status["state"], status["migrated"]) == ("finished", 5)
+    migrated = test_db.query(models_auth.PaletteWithUser).order_by(models_auth.PaletteWithUser.id).all()
+    assert [p.input_text for p in migrated] == [f"heredada {i}" for i in range(5)]
+    assert {(p.user_id, p.confidence_score) for p in migrated} == {(test_admin.id, "0.75")}
+    assert get_counters(test_db)["palettes"] == 5
+    with pytest.raises(legacy_migration.LegacyMigrationError):
+        legacy_migration.migrate_legacy_palettes(TestingSessionLocal, test_admin.id + 1)
+
+def test_legacy_archive_drops_table(legacy_palettes, test_admin, tmp_path):
+    """Test 64: El archivado exige la migración completa, guarda el CSV y elimina la tabla"""
+    import csv, gzip
+    import legacy_migration
+    path = str(tmp_path / "legacy.csv.gz")
+    with pytest.raises(legacy_migration.LegacyMigrationError):
+        legacy_migration.archive_legacy_table(TestingSessionLocal, path)
+    legacy_migration.migrate_legacy_palettes(TestingSessionLocal, test_admin.id, max_rows_per_second=0)
+    
+    assert legacy_migration.archive_legacy_table(TestingSessionLocal, path) == 5
+    with gzip.open(path, "rt") as f:
+        rows = list(csv.DictReader(f))
+    assert [r["input_text"] for r in rows] == [f"heredada {i}" for i in range(5)]
+    assert legacy_migration.legacy_table(test_engine) is None
+
+# ================================================
+# TESTS DE AGREGADOS DE SENTIMIENTO
+# ================================================
+
+def _dated_palettes(db, user_id, rows):
+    """rows: [(created_at, label, polarity)]"""
+    from datetime import datetime
+    palettes = [models_auth.PaletteWithUser(
+        input_text="t", colors="#ffffff", sentiment_label=label, polarity=polarity,
+        confidence_score="0.5", analysis_method="hybrid", user_id=user_id,
+        created_at=datetime.fromisoformat(created_at)) for created_at, label, polarity in rows]
+    db.add_all(palettes)
+    db.commit()
+    return palettes
+
+def test_sentiment_rollups_follow_inserts_and_deletes(auth_token, admin_token, test_user, test_admin, test_db):
+    """Test 65: Los agregados por día/hora se mantienen al insertar y borrar"""
+    mine = _dated_palettes(test_db, test_user.id, [
+        ("2024-03-01 10:15:00", "positive", "0.500"),
+        ("2024-03-01 10:45:00", "positive", "0.300"),
+        ("2024-03-02 08:00:00", "negative", "-0.400"),
+    ])
+    _dated_palettes(test_db, test_admin.id, [("2024-03-01 11:00:00", "neutral", "0.000")])
+    url = "/analytics/sentiment?granularity=day&from=2024-03-01T00:00:00&to=2024-03-31T00:00:00"
+    
+    own = client.get(url, headers={"Authorization": f"Bearer {auth_token}"}).json()["series"]
+    assert [(p["bucket"], p["total"]) for p in own] == [("2024-03-01", 2), ("2024-03-02", 1)]
+    assert own[0]["by_sentiment"] == {"positive": 2} and own[0]["polarity"]["mean"] == 0.4
+    assert own[0]["polarity"]["stddev"] == 0.1 and own[0]["confidence"]["mean"] == 0.5
+    
+    admin_headers = {"Authorization": f"Bearer {admin_token}"}
+    assert client.get(url, headers=admin_headers).json()["series"][0]["total"] == 3
+    hourly = client.get("/analytics/sentiment?granularity=hour&from=2024-03-01T00:00:00&to=2024-03-01T23:00:00",
+                        headers=admin_headers).json()["series"]
+    assert [(p["bucket"], p["total"]) for p in hourly] == [("2024-03-01 10:00", 2), ("2024-03-01 11:00", 1)]
+    
+    test_db.delete(mine[0])
+    test_db.commit()
+    own = client.get(url, headers={"Authorization": f"Bearer {auth_token}"}).json()["series"]
+    assert own[0]["total"] == 1 and own[0]["polarity"]["mean"] == 0.3
+    assert client.get("/analytics/sentiment?granularity=hour&from=2024-01-01T00:00:00&to=2024-03-01T00:00:00",
+                      headers=admin_headers).status_code == 400
+
+def test_sentiment_rollup_backfill_is_resumable(test_user, test_db):
+    """Test 66: El backfill agrega las paletas previas sin contar dos veces las nuevas"""
+    from datetime import datetime
+    from sqlalchemy import text
+    import rollups
+    old = _dated_palettes(test_db, test_user.id, [(f"2024-04-0{i + 1} 09:00:00", "positive", "0.5") for i in range(5)])
+    # Simular una BD anterior a los agregados: sin triggers ni filas
+    with test_engine.begin() as conn:
+        for name in rollups._TRIGGERS:
+            conn.execute(text(f"DROP TRIGGER {name}"))
+        conn.execute(text("DELETE FROM sentiment_rollup_daily"))
+        conn.execute(text("DELETE FROM sentiment_rollup_hourly"))
+        rollups.install_rollup_triggers(None, conn)
+    
+    _dated_palettes(test_db, test_user.id, [("2024-04-01 12:00:00", "negative", "-0.5")])
+    test_db.delete(old[1])  # pendiente de backfill: el trigger no debe descontarla
+    test_db.commit()
+    status = rollups.backfill_rollups(TestingSessionLocal, chunk_size=2, max_rows_per_second=0)
+    assert status["state"] == "finished" and status["processed"] == 4
+    
+    series = rollups.sentiment_series(test_db, "day", datetime(2024, 4, 1), datetime(2024, 4, 30), test_user.id)
+    assert [(p["bucket"], p["total"]) for p in series] == [
+        ("2024-04-01", 2), ("2024-04-03", 1), ("2024-04-04", 1), ("2024-04-05", 1)]
+    assert series[0]["by_sentiment"] == {"positive": 1, "negative": 1}
+    assert rollups.backfill_rollups(TestingSessionLocal) == {"state": "finished"}
+
+def test_import_applies_deferred_triggers(auth_token, test_user, test_db, monkeypatch):
+    """Test 67: La importación aplica por lote contadores, búsqueda y agregados"""
+    import json
+    import palette_import
+    monkeypatch.setattr(palette_import, "IMPORT_BATCH_SIZE", 2)
+    from counters import get_counters
+    from triggers import BULK_INSERT_JOB
+    _dated_palettes(test_db, test_user.id, [("2024-06-01 09:00:00", "positive", "0.5")])
+    lines = [json.dumps({"input_text": f"girasol {i}", "colors": ["#ffd700"], "polarity": 0.5,
+                         "sentiment_label": "positive", "created_at": "2024-06-01T10:00:00"}) for i in range(3)]
+    assert _upload(auth_token, "\n".join(lines)).json()["inserted"] == 3
+
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    assert get_counters(test_db)["palettes"] == 4
+    assert len(client.get("/palettes/search?q=girasol", headers=headers).json()["results"]) == 3
+    series = client.get("/analytics/sentiment?granularity=hour&from=2024-06-01T00:00:00&to=2024-06-01T23:00:00",
+                        headers=headers).json()["series"]
+    assert [(p["bucket"], p["total"]) for p in series] == [("2024-06-01 09:00", 1), ("2024-06-01 10:00", 3)]
+    assert test_db.get(models_auth.JobCheckpoint, BULK_INSERT_JOB) is None
+
+# ================================================
+# TESTS DE PERFIL EMOCIONAL
+# ================================================
+
+def test_profile_follows_analyze_and_delete(auth_token, test_user, test_db):
+    """Test 68: El perfil se actualiza con cada /analyze y cada borrado"""
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    empty = client.get("/users/me/profile", headers=headers).json()
+    assert empty["palettes"] == 0 and empty["mean_polarity"] is None and empty["favorite_hues"] == []
+
+    for text in ("Hoy es un gran día", "Todo me sale mal"):
+        assert client.post("/analyze", headers=headers, json={"text": text, "method": "hybrid"}).status_code == 200
+    profile = client.get("/users/me/profile", headers=headers).json()
+    assert profile["palettes"] == 2 and sum(profile["sentiments"].values()) == 2
+    assert profile["mood"]["polarity"] is not None and profile["favorite_hues"]
+
+    palette = test_db.query(models_auth.PaletteWithUser).first()
+    assert client.delete(f"/palettes/{palette.id}", headers=headers).status_code == 200
+    assert client.get("/users/me/profile", headers=headers).json()["palettes"] == 1
+
+def test_profile_rebuild_matches_incremental(auth_token, admin_token, test_user, test_db):
+    """Test 69: La reconciliación reconstruye el mismo perfil que las actualizaciones"""
+    import json
+    from profiles import rebuild_profiles
+    lines = [json.dumps({"input_text": f"texto {i}", "colors": colors, "polarity": polarity,
+                         "sentiment_label": label, "created_at": f"2024-07-0{i + 1}T10:00:00"})
+             for i, (colors, polarity, label) in enumerate([
+                 ("#ff0000,#ff3300", 0.8, "positive"), ("#0000ff", -0.6, "negative"),
+                 ("#ff0000,#808080", 0.4, "positive"), ("#00ff00", 0.0, "neutral")])]
+    assert _upload(auth_token, "\n".join(lines)).json()["inserted"] == 4
+    newest = test_db.query(models_auth.PaletteWithUser).order_by(models_auth.PaletteWithUser.id.desc()).first()
+    response = client.post("/palettes/bulk/delete", json={"ids": [newest.id]},
+                           headers={"Authorization": f"Bearer {admin_token}"})
+    assert response.json()["deleted"] == 1
+
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    incremental = client.get("/users/me/profile", headers=headers).json()
+    assert incremental["palettes"] == 3 and incremental["mean_polarity"] == 0.2
+    assert incremental["sentiments"] == {"negative": 1, "positive": 2}
+    assert [(h["name"], h["share"]) for h in incremental["favorite_hues"]] == [("rojo", 0.75), ("azul", 0.25)]
+    # El ánimo pesa más lo reciente: la paleta del 3 de julio (0.4) más que la del 1 (0.8)
+    assert 0.0 < incremental["mood"]["polarity"] < 0.2
+
+    assert rebuild_profiles(TestingSessionLocal, chunk_size=2) == 3
+    rebuilt = client.get("/users/me/profile", headers=headers).json()
+    assert rebuilt["mood"]["polarity"] == pytest.approx(incremental["mood"]["polarity"], abs=1e-4)
+    for key in ("palettes", "mean_polarity", "sentiments", "favorite_hues"):
+        assert rebuilt[key] == incremental[key]
+
+# ================================================
+# TESTS DE RETENCIÓN Y ARCHIVADO
+# ================================================
+
+@pytest.fixture
+def archive_engine(test_db):
+    """BD de archivo de test, también para GET /palettes/archive"""
+    from retention import archive_metadata, get_archive_engine
+    engine = create_engine("sqlite:///./test_archive.db", connect_args={"check_same_thread": False})
+    archive_metadata.drop_all(bind=engine)
+    archive_metadata.create_all(bind=engine)
+    app.dependency_overrides[get_archive_engine] = lambda: engine
+    yield engine
+    del app.dependency_overrides[get_archive_engine]
+    engine.dispose()
+
+def test_retention_archives_by_role(archive_engine, auth_token, admin_token, test_user, test_admin, test_db, monkeypatch):
+    """Test 70: Se archivan las paletas vencidas según el rol; los agregados las conservan"""
+    from datetime import datetime
+    from counters import get_counters
+    from rollups import sentiment_series
+    import retention
+    monkeypatch.setattr(retention, "RETENTION_DAYS_BY_ROLE", "user:30,admin:0")
+    _dated_palettes(test_db, test_user.id, [("2020-01-01 10:00:00", "positive", "0.5"),
+                                            ("2020-01-02 10:00:00", "negative", "-0.5")])
+    _dated_palettes(test_db, test_admin.id, [("2020-01-01 10:00:00", "neutral", "0.0")])
+    recent = _dated_palettes(test_db, test_user.id, [(datetime.utcnow().isoformat(" ", "seconds"), "positive", "0.5")])
+
+    status = retention.ArchiveJob(TestingSessionLocal, archive_engine, chunk_size=1, max_rows_per_second=0).run()
+    assert (status["state"], status["archived"]) == ("finished", 2)
+    remaining = {p.id for p in test_db.query(models_auth.PaletteWithUser)}
+    assert len(remaining) == 2 and recent[0].id in remaining
+    assert get_counters(test_db)["palettes"] == 2
+    series = sentiment_series(test_db, "day", datetime(2020, 1, 1), datetime(2020, 1, 31), test_user.id)
+    assert [(p["bucket"], p["total"]) for p in series] == [("2020-01-01", 1), ("2020-01-02", 1)]
+
+    page = client.get("/palettes/archive?limit=1", headers={"Authorization": f"Bearer {auth_token}"}).json()
+    assert [p["sentiment_label"] for p in page["palettes"]] == ["positive"]
+    assert page["palettes"][0]["created_at"].startswith("2020-01-01T10:00:00")
+    page = client.get(f"/palettes/archive?limit=1&cursor={page['next_cursor']}",
+                      headers={"Authorization": f"Bearer {auth_token}"}).json()
+    assert [p["sentiment_label"] for p in page["palettes"]] == ["negative"]
+    admin_page = client.get(f"/palettes/archive?user_id={test_admin.id}",
+                            headers={"Authorization": f"Bearer {admin_token}"}).json()
+    assert admin_page == {"palettes": [], "next_cursor": None}
+
+def test_retention_retry_is_idempotent(archive_engine, test_user, test_db, monkeypatch):
+    """Test 71: Un lote copiado pero no borrado (interrupción) se vuelve a archivar sin duplicar"""
+    import retention
+    monkeypatch.setattr(retention, "RETENTION_DAYS", 30)
+    old = _dated_palettes(test_db, test_user.id, [("2020-01-01 10:00:00", "positive", "0.5")])
+    with archive_engine.begin() as conn:
+        conn.execute(retention.archived_palettes.insert(), [{"id": old[0].id, "user_id": test_user.id,
+                                                             "input_text": "copia parcial", "archived_at": 0.0}])
+    assert retention.ArchiveJob(TestingSessionLocal, archive_engine, max_rows_per_second=0).run()["archived"] == 1
+    palettes, _ = retention.archived_page(archive_engine, test_user.id)
+    assert [p["input_text"] for p in palettes] == ["t"]
+    with pytest.raises(ValueError):
+        retention.parse_retention("user:treinta")
+
+# ================================================
+# TESTS DE MANTENIMIENTO
+# ================================================
+
+def test_maintenance_runs_once_across_workers_on_low_load(test_db, monkeypatch, tmp_path):
+    """Test 72: Cada tarea la ejecuta un solo worker, y solo con poca carga (salvo un WAL enorme)"""
+    import backup
+    import maintenance
+    monkeypatch.setattr(backup, "BACKUP_DIR", str(tmp_path))
+    busy = maintenance.LoadMonitor(window=10)
+    for _ in range(100):
+        busy.record(now=1000)
+    assert busy.rate(now=1005) == 10.0 and busy.rate(now=1010) == 0.0
+    
+    assert maintenance.MaintenanceScheduler(test_engine, monitor=busy).run_pending(now=1005) == []
+    worker_a = maintenance.MaintenanceScheduler(test_engine, monitor=maintenance.LoadMonitor())
+    worker_b = maintenance.MaintenanceScheduler(test_engine, monitor=maintenance.LoadMonitor())
+    assert worker_a.run_pending() == list(maintenance.MAINTENANCE_INTERVALS)
+    assert worker_b.run_pending() == []
+    assert all(task["ok"] for task in worker_a.status.values())
+    
+    # Con carga, un WAL por encima del límite fuerza el checkpoint (y nada más)
+    import time
+    monkeypatch.setattr(maintenance, "wal_size", lambda engine: maintenance.MAINTENANCE_WAL_MAX_BYTES + 1)
+    later = time.time() + maintenance.MAINTENANCE_TICK_SECONDS + 1
+    for _ in range(100):
+        busy.record(now=later)
+    assert maintenance.MaintenanceScheduler(test_engine, monitor=busy).run_pending(now=later) == ["wal_checkpoint"]
+
+def test_online_backup_verified_compressed_and_rotated(test_db, test_user, admin_token, auth_token,
+                                                       monkeypatch, tmp_path):
+    """Test 73: La copia en línea se verifica, se comprime y solo se conservan las más recientes"""
+    import backup
+    import gzip
+    import sqlite3
+    _dated_palettes(test_db, test_user.id, [("2024-01-01 10:00:00", "positive", "0.5")] * 3)
+    results = [backup.run_backup(test_engine, str(tmp_path), keep=2) for _ in range(3)]
+    assert results[2]["rotated"] == [results[0]["name"]]
+    assert [b["name"] for b in backup.list_backups(str(tmp_path))] == [results[2]["name"], results[1]["name"]]
+    assert sorted(os.listdir(tmp_path)) == sorted([results[1]["name"], results[2]["name"]])
+    
+    restored = tmp_path / "restored.db"
+    with gzip.open(tmp_path / results[2]["name"]) as src:
+        restored.write_bytes(src.read())
+    copy = sqlite3.connect(restored)
+    assert copy.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    assert copy.execute("SELECT COUNT(*) FROM palettes_with_users").fetchone()[0] == 3
+    copy.close()
+    
+    # Bajo demanda desde el endpoint de admin
+    monkeypatch.setattr(backup, "BACKUP_DIR", str(tmp_path / "admin"))
+    monkeypatch.setattr(backup, "_job", backup.BackupJob(test_engine))
+    assert client.post("/admin/backups", headers={"Authorization": f"Bearer {auth_token}"}).status_code == 403
+    assert client.post("/admin/backups", headers={"Authorization": f"Bearer {admin_token}"}).status_code == 202
+    backup._job._thread.join(timeout=30)
+    response = client.get("/admin/backups", headers={"Authorization": f"Bearer {admin_token}"})
+    assert response.json()["job"]["state"] == "finished"
+    assert [b["name"] for b in response.json()["backups"]] == [response.json()["job"]["name"]]
+
+def test_read_routes_use_read_only_engine(test_db, test_user, auth_token):
+    """Test 74: Los GET de consulta leen por un motor de solo lectura que ve cada commit"""
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+    from database import create_read_engine
+    read_engine = create_read_engine("sqlite:///./test_database.db", pool_size=2)
+    ReadSession = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+    
+    def read_db():
+        db = ReadSession()
+        try:
+            yield db
+        finally:
+            db.close()
+    
+    app.dependency_overrides[get_read_db] = read_db
+    try:
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        assert client.post("/analyze", json={"text": "Un día feliz"}, headers=headers).status_code == 200
+        response = client.get("/gallery", headers=headers)
+        assert response.status_code == 200 and response.json()["total"] == 1
+        with read_engine.connect() as conn:
+            with pytest.raises(OperationalError, match="readonly"):
+                conn.execute(text("DELETE FROM palettes_with_users"))
+    finally:
+        app.dependency_overrides[get_read_db] = override_get_db
+        read_engine.dispose()
+
+def test_sharded_palettes_route_by_user(test_db, test_user, test_admin, auth_token, admin_token,
+                                        monkeypatch, tmp_path):
+    """Test 75: Con particiones, cada usuario escribe en la suya y las consultas globales se mezclan"""
+    import main
+    from database import ShardRouter
+    router = ShardRouter([f"sqlite:///{tmp_path}/shard{i}.db" for i in range(3)], read_pool_size=2)
+    router.create_all(models_auth.Base.metadata)
+    monkeypatch.setattr(main, "shards", router)
+    user_headers = {"Authorization": f"Bearer {auth_token}"}
+    admin_headers = {"Authorization": f"Bearer {admin_token}"}
+    try:
+        for headers in (user_headers, user_headers, admin_headers):
+            assert client.post("/analyze", json={"text": "Un día feliz"}, headers=headers).status_code == 200
+        
+        shard = router.shard_for_user(test_user.id)
+        db = router.read_session(shard)
+        ids = [p.id for p in db.query(models_auth.PaletteWithUser).filter(
+            models_auth.PaletteWithUser.user_id == test_user.id)]
+        db.close()
+        assert len(ids) == 2 and all(router.shard_for_palette(i) == shard for i in ids)
+        assert test_db.query(models_auth.PaletteWithUser).count() == 0
+        
+        assert client.get("/gallery", headers=user_headers).json()["total"] == 2
+        assert client.get("/gallery", headers=admin_headers).json()["total"] == 3
+        assert client.get("/stats", headers=admin_headers).json()["total_palettes"] == 3
+        assert client.get("/users/me/profile", headers=user_headers).json()["palettes"] == 2
+        
+        assert client.delete(f"/palettes/{ids[0]}", headers=admin_headers).status_code == 200
+        assert client.get("/gallery", headers=user_headers).json()["total"] == 1
+        assert client.get("/palettes/search?q=feliz", headers=user_headers).status_code == 501
+    finally:
+        router.dispose()
+
+def test_list_endpoints_select_only_returned_columns(test_db, test_user, admin_token):
+    """Test 76: /gallery y /users leen solo las columnas que devuelven"""
+    from sqlalchemy import event
+    _dated_palettes(test_db, test_user.id, [("2024-01-01 10:00:00", "positive", "0.5")])
+    statements = []
+    capture = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(test_engine, "before_cursor_execute", capture)
+    try:
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        gallery = client.get("/gallery", headers=headers).json()
+        users = client.get("/users", headers=headers).json()
+    finally:
+        event.remove(test_engine, "before_cursor_execute", capture)
+    
+    assert gallery["palettes"][0]["created_at"] == "2024-01-01T10:00:00"
+    assert set(gallery["palettes"][0]) == {"id", "input_text", "colors", "sentiment_label", "created_at"}
+    assert {u["username"] for u in users["items"]} >= {"testuser", "admin"}
+    listing = [sql for sql in statements if "FROM palettes_with_users" in sql or "FROM users" in sql]
+    assert listing and not any("translated_text" in sql or "hashed_password" in sql for sql in listing)
+
+def test_profile_updates_are_serialized_under_concurrency(test_db, test_user):
+    """Test 77: Escrituras concurrentes del mismo usuario no pierden actualizaciones del perfil"""
+    import threading
+    from profiles import get_profile, rebuild_profiles, update_profiles
+    errors = []
+    
+    def create_palettes():
+        for i in range(10):
+            db = TestingSessionLocal()
+            try:
+                palette = models_auth.PaletteWithUser(input_text=f"p{i}", polarity="0.5", colors="#ff0000",
+                                                      sentiment_label="positive", user_id=test_user.id)
+                db.add(palette)
+                update_profiles(db, [palette])
+                db.commit()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.close()
+    
+    threads = [threading.Thread(target=create_palettes) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    
+    db = TestingSessionLocal()
+    live = get_profile(db, test_user.id)
+    db.close()
+    assert live["palettes"] == 80 and live["sentiments"] == {"positive": 80}
+    rebuild_profiles(TestingSessionLocal, [test_user.id])
+    db = TestingSessionLocal()
+    rebuilt = get_profile(db, test_user.id)
+    db.close()
+    for key in ("palettes", "mean_polarity", "sentiments", "favorite_hues"):
+        assert live[key] == rebuilt[key]
+    assert live["mood"]["polarity"] == rebuilt["mood"]["polarity"]
+
+def _login(username, password):
+    return client.post("/token", data={"username": username, "password": password}).json()["access_token"]
+
+def test_status_update_keeps_earlier_tokens_revoked(admin_token, test_user, test_db):
+    """Test 78: Reactivar un usuario no revive tokens emitidos antes de un cambio de rol o desactivación"""
+    from auth import decode_token
+    from revocation import RevocationList
+    admin_headers = {"Authorization": f"Bearer {admin_token}"}
+    client.put(f"/users/{test_user.id}/role", headers=admin_headers, json={"role": "admin"})
+    promoted = {"Authorization": f"Bearer {_login('testuser', 'Password123')}"}
+    assert client.get("/users", headers=promoted).status_code == 200
+
+    client.put(f"/users/{test_user.id}/role", headers=admin_headers, json={"role": "viewer"})
+    assert client.get("/users", headers=promoted).status_code == 401
+    # Ya activo: actualizar el estado no quita el corte del cambio de rol
+    assert client.put(f"/users/{test_user.id}/status", headers=admin_headers,
+                      json={"is_active": True}).status_code == 200
+    assert client.get("/users", headers=promoted).status_code == 401
+
+    viewer_token = _login("testuser", "Password123")
+    client.put(f"/users/{test_user.id}/status", headers=admin_headers, json={"is_active": False})
+    client.put(f"/users/{test_user.id}/status", headers=admin_headers, json={"is_active": True})
+    assert client.get("/gallery", headers={"Authorization": f"Bearer {viewer_token}"}).status_code == 401
+    # Otro worker, que carga las revocaciones desde la BD, también los rechaza
+    other_worker = RevocationList(capacity=16)
+    other_worker.load(test_db)
+    for token in (promoted["Authorization"].split()[1], viewer_token):
+        payload = decode_token(token)
+        assert other_worker.is_revoked(payload["jti"], payload["uid"], payload["iat"])
+
+    fresh = {"Authorization": f"Bearer {_login('testuser', 'Password123')}"}
+    assert client.get("/gallery", headers=fresh).status_code == 200
+
+def test_bulk_activation_keeps_earlier_tokens_revoked(auth_token, admin_token, test_user, test_db):
+    """Test 79: La activación masiva no revive tokens emitidos antes de un cambio de rol o desactivación"""
+    from auth import decode_token
+    from revocation import RevocationList
+    admin_headers = {"Authorization": f"Bearer {admin_token}"}
+    selection = {"ids": [test_user.id]}
+    client.put("/users/bulk/role", headers=admin_headers, json={"selection": selection, "role": "viewer"})
+    viewer_token = _login("testuser", "Password123")
+    client.put("/users/bulk/status", headers=admin_headers, json={"selection": selection, "is_active": False})
+    response = client.put("/users/bulk/status", headers=admin_headers, json={"selection": selection, "is_active": True})
+    assert response.json()["affected"] == 1
+
+    other_worker = RevocationList(capacity=16)
+    other_worker.load(test_db)
+    for token in (auth_token, viewer_token):
+        assert client.get("/gallery", headers={"Authorization": f"Bearer {token}"}).status_code == 401
+        payload = decode_token(token)
+        assert other_worker.is_revoked(payload["jti"], payload["uid"], payload["iat"])
+
+    fresh = {"Authorization": f"Bearer {_login('testuser', 'Password123')}"}
+    assert client.get("/gallery", headers=fresh).status_code == 200
+
+def test_maintenance_runs_pending_rollup_backfill(auth_token, test_user, test_db):
+    """Test 80: El mantenimiento completa el backfill de agregados; mientras tanto la API lo indica"""
+    from sqlalchemy import text
+    import maintenance
+    import rollups
+    _dated_palettes(test_db, test_user.id, [(f"2024-05-0{i + 1} 09:00:00", "positive", "0.5") for i in range(3)])
+    with test_engine.begin() as conn:
+        for name in rollups._TRIGGERS:
+            conn.execute(text(f"DROP TRIGGER {name}"))
+        rollups.install_rollup_triggers(None, conn)
+    url = "/analytics/sentiment?granularity=day&from=2024-05-01T00:00:00&to=2024-05-31T00:00:00"
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    data = client.get(url, headers=headers).json()
+    assert data["series"] == [] and data["backfill_pending"] is True
+
+    # Si sube la carga se detiene entre lotes; la siguiente ejecución sigue desde el checkpoint
+    calls = iter([False, True])
+    status = rollups.backfill_rollups(TestingSessionLocal, chunk_size=1, max_rows_per_second=0,
+                                      should_pause=lambda: next(calls))
+    assert (status["state"], status["processed"]) == ("paused", 1)
+    assert len(client.get(url, headers=headers).json()["series"]) == 1
+
+    scheduler = maintenance.MaintenanceScheduler(test_engine, intervals={"rollup_backfill": 300},
+                                                 monitor=maintenance.LoadMonitor())
+    assert scheduler.run_pending() == ["rollup_backfill"]
+    assert scheduler.status["rollup_backfill"]["state"] == "finished"
+    data = client.get(url, headers=headers).json()
+    assert [p["total"] for p in data["series"]] == [1, 1, 1] and data["backfill_pending"] is False
+
+def test_maintenance_archives_by_retention_policy(archive_engine, admin_token, test_user, test_db, monkeypatch):
+    """Test 81: El mantenimiento aplica la retención por su cuenta y cede el paso si sube la carga"""
+    import time
+    import maintenance
+    import retention
+    monkeypatch.setattr(retention, "RETENTION_DAYS", 30)
+    monkeypatch.setattr(retention, "_job", retention.ArchiveJob(TestingSessionLocal, archive_engine,
+                                                                chunk_size=1, max_rows_per_second=0))
+    _dated_palettes(test_db, test_user.id, [(f"2020-01-0{i + 1} 10:00:00", "positive", "0.5") for i in range(3)])
+
+    class Monitor:
+        """Poca carga al decidir la ventana y durante el primer lote; después, carga"""
+        rates = iter([0.0, 0.0, 10.0])
+        def rate(self, now=None):
+            return next(self.rates, 0.0)
+
+    scheduler = maintenance.MaintenanceScheduler(test_engine, intervals={"archive": 3600}, monitor=Monitor())
+    assert scheduler.run_pending() == ["archive"]
+    assert (scheduler.status["archive"]["state"], scheduler.status["archive"]["archived"]) == ("paused", 1)
+    assert test_db.query(models_auth.PaletteWithUser).count() == 2
+
+    # La próxima ventana sigue donde quedó; /admin/retention ve el mismo trabajo
+    assert scheduler.run_pending(now=time.time() + 3601) == ["archive"]
+    status = client.get("/admin/retention", headers={"Authorization": f"Bearer {admin_token}"}).json()
+    assert (status["state"], status["archived"]) == ("finished", 2)
+    assert test_db.query(models_auth.PaletteWithUser).count() == 0
+
 # ================================================
 # CLEANUP
 # ================================================
 
 def teardown_module(module):
     """Limpieza después de todos los tests"""
-    try:
-        os.remove("test_database.db")
-    except:
-        pass
+    for path in ("test_database.db", "test_archive.db"):
+        try:
+            os.remove(path)
+        except:
+            pass
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "--cov=.", "--cov-report=html"])
\ No newline at end of file
@@ -0,0 +1,123 @@
+"""
+Tests del sistema de autenticación
+Tokens JWT, cachés de verificación y control de acceso
+"""
+
+import pytest
+from datetime import timedelta
+from fastapi import HTTPException
+import os
+import sys
+import time
+
+# Agregar el directorio backend al path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from auth import create_access_token, decode_token, token_cache, _token_digest
+from password_hashing import PasswordHasher, PasswordHasherBusy, calibrate
+from revocation import BloomFilter, RevocationList
+
+# ================================================
+# TESTS DE CACHÉ DE TOKENS VERIFICADOS
+# ================================================
+
+def test_decode_token_is_cached():
+    """Test 1: Un token válido queda en caché tras la primera verificación"""
+    token = create_access_token({"sub": "cacheuser", "role": "user", "uid": 7})
+    first = decode_token(token)
+    assert _token_digest(token) in token_cache
+    second = decode_token(token)
+    assert first == second
+    assert second["uid"] == 7
+
+def test_cached_claims_are_copies():
+    """Test 2: Modificar los claims devueltos no altera el caché"""
+    token = create_access_token({"sub": "copyuser", "role": "user"})
+    decode_token(token)["role"] = "admin"
+    assert decode_token(token)["role"] == "user"
+
+def test_expired_token_rejected():
+    """Test 3: ERROR - Un token expirado no se acepta ni se cachea"""
+    token = create_access_token({"sub": "old"}, expires_delta=timedelta(seconds=-1))
+    with pytest.raises(HTTPException) as exc:
+        decode_token(token)
+    assert exc.value.status_code == 401
+    assert _token_digest(token) not in token_cache
+
+def test_cached_token_expires():
+    """Test 4: ERROR - Un token cacheado deja de ser válido al expirar"""
+    token = create_access_token({"sub": "short"}, expires_delta=timedelta(seconds=1))
+    decode_token(token)
+    time.sleep(2.1)
+    with pytest.raises(HTTPException):
+        decode_token(token)
+
+def test_tampered_token_rejected():
+    """Test 5: ERROR - Un token alterado no comparte entrada de caché"""
+    token = create_access_token({"sub": "victim", "role": "user"})
+    decode_token(token)
+    header, payload, signature = token.split(".")
+    tampered = ".".join([header, payload, signature[:-2] + ("AA" if signature[-2:] != "AA" else "BB")])
+    with pytest.raises(HTTPException):
+        decode_token(tampered)
+
+# ================================================
+# TESTS DEL EXECUTOR DE CONTRASEÑAS
+# ================================================
+
+def test_password_hasher_rejects_when_saturated():
+    """Test 6: ERROR - El executor rechaza de inmediato al superar su capacidad"""
+    import threading
+    hasher = PasswordHasher(workers=1, max_pending=1)
+    gate = threading.Event()
+    running = hasher.submit("verify", gate.wait)
+    queued = hasher.submit("verify", gate.wait)
+    
+    start = time.perf_counter()
+    with pytest.raises(PasswordHasherBusy):
+        hasher.submit("verify", gate.wait)
+    assert time.perf_counter() - start < 0.1
+    
+    gate.set()
+    running.result()
+    queued.result()
+    # Con capacidad liberada vuelve a aceptar
+    assert hasher.submit("verify", lambda: True).result()
+
+def test_calibrate_recommends_rounds_within_target():
+    """Test 7: La calibración recomienda el mayor costo dentro del objetivo"""
+    recommended, timings = calibrate(target_ms=10_000, min_rounds=4, max_rounds=5, samples=1)
+    assert recommended == 5
+    assert set(timings) == {4, 5}
+
+# ================================================
+# TESTS DE REVOCACIÓN
+# ================================================
+
+def test_bloom_filter_has_no_false_negatives():
+    """Test 8: El filtro de Bloom nunca olvida un elemento añadido"""
+    bloom = BloomFilter(capacity=1000, fp_rate=0.01)
+    items = [f"jti-{i}" for i in range(1000)]
+    for item in items:
+        bloom.add(item)
+    assert all(item in bloom for item in items)
+    false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+
+def test_revocation_list_checks_jti_and_user_cutoff():
+    """Test 9: Revocación por jti y por usuario (tokens emitidos antes del corte)"""
+    revocations = RevocationList(capacity=16)
+    revocations._apply(1, "revoked-jti", 1, 100.0, time.time() + 60)
+    revocations._apply(2, None, 2, 200.0, time.time() + 60)
+    
+    assert revocations.is_revoked("revoked-jti")
+    assert not revocations.is_revoked("valid-jti")
+    assert revocations.is_revoked("valid-jti", user_id=2, issued_at=150)
+    assert not revocations.is_revoked("valid-jti", user_id=2, issued_at=250)
+
+def test_revocation_list_grows_beyond_capacity():
+    """Test 10: El filtro se reconstruye al superar su capacidad"""
+    revocations = RevocationList(capacity=4)
+    for i in range(20):
+        revocations._apply(i + 1, f"jti-{i}", None, 0.0, time.time() + 60)
+    assert all(revocations.is_revoked(f"jti-{i}") for i in range(20))
@@ -0,0 +1,101 @@
+"""
+Tests de la política de autorización compilada
+Bits de permisos, máscaras por rol, overrides por usuario y dependencias
+"""
+
+import pytest
+from fastapi import HTTPException
+import asyncio
+import os
+import sys
+
+# Agregar el directorio backend al path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from policy import (
+    ROLE_PERMISSIONS, ROLE_MASKS, PERMISSIONS, PERMISSION_BITS, UnknownPermission,
+    permission_bit, compile_mask, compile_user_mask, mask_permissions
+)
+from auth import check_permission, require_permission, create_access_token
+
+# ================================================
+# TESTS DE COMPILACIÓN
+# ================================================
+
+def test_permission_bits_are_unique_powers_of_two():
+    """Test 1: Cada permiso ocupa un bit distinto"""
+    bits = list(PERMISSION_BITS.values())
+    assert len(set(bits)) == len(PERMISSIONS)
+    assert all(bit & (bit - 1) == 0 for bit in bits)
+
+def test_role_masks_match_role_permissions():
+    """Test 2: La máscara de cada rol equivale a su lista de permisos"""
+    for role, permissions in ROLE_PERMISSIONS.items():
+        assert sorted(mask_permissions(ROLE_MASKS[role])) == sorted(permissions)
+
+@pytest.mark.parametrize("role", list(ROLE_PERMISSIONS))
+@pytest.mark.parametrize("permission", PERMISSIONS)
+def test_mask_check_equals_list_check(role, permission):
+    """Test 3: El AND de bits da el mismo resultado que la búsqueda en la lista"""
+    user = {"role": role, "perm": ROLE_MASKS[role]}
+    assert check_permission(user, permission) == (permission in ROLE_PERMISSIONS[role])
+
+def test_unknown_permission_fails_fast():
+    """Test 4: ERROR - Un permiso inexistente falla al definir la dependencia"""
+    with pytest.raises(UnknownPermission):
+        permission_bit("fly_to_the_moon")
+    with pytest.raises(UnknownPermission):
+        require_permission("fly_to_the_moon")
+
+def test_unknown_role_has_no_permissions():
+    """Test 5: Un rol desconocido no tiene permisos"""
+    assert compile_user_mask("intruder") == 0
+    assert not check_permission({"role": "intruder"}, "view_palette")
+
+# ================================================
+# TESTS DE OVERRIDES POR USUARIO
+# ================================================
+
+def test_grant_override_adds_permission():
+    """Test 6: Conceder un permiso extra a un viewer"""
+    mask = compile_user_mask("viewer", grants=["create_palette"])
+    assert mask & permission_bit("create_palette")
+    assert mask & permission_bit("view_palette")
+
+def test_deny_override_wins_over_role_and_grant():
+    """Test 7: Denegar prevalece sobre el rol"""
+    mask = compile_user_mask("admin", denials=["manage_users"])
+    assert not mask & permission_bit("manage_users")
+    assert mask & permission_bit("delete_all_palettes")
+
+def test_compile_mask_roundtrip():
+    """Test 8: compile_mask y mask_permissions son inversas"""
+    permissions = ["view_stats", "create_palette"]
+    assert sorted(mask_permissions(compile_mask(permissions))) == sorted(permissions)
+
+# ================================================
+# TESTS DE DEPENDENCIAS
+# ================================================
+
+def test_require_permission_is_shared_per_permission():
+    """Test 9: require_permission devuelve la misma dependencia para el mismo permiso"""
+    assert require_permission("view_palette") is require_permission("view_palette")
+    assert require_permission("view_palette") is not require_permission("view_stats")
+
+def test_require_permission_uses_token_mask():
+    """Test 10: La dependencia decide solo con la máscara del token"""
+    checker = require_permission("delete_all_palettes")
+    admin = {"username": "a", "role": "user", "perm": ROLE_MASKS["admin"]}
+    user = {"username": "u", "role": "admin", "perm": ROLE_MASKS["user"]}
+    assert asyncio.run(checker(current_user=admin)) is admin
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(checker(current_user=user))
+    assert exc.value.status_code == 403
+
+def test_token_from_other_policy_version_rejected():
+    """Test 11: ERROR - Máscaras emitidas con otra asignación de bits se rechazan"""
+    from auth import get_current_user
+    token = create_access_token({"sub": "old", "role": "user", "perm": 1, "pv": -1})
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(get_current_user(token))
+    assert exc.value.status_code == 401
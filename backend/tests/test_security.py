@@ -0,0 +1,173 @@
+"""
+Tests de encriptación de datos sensibles
+Formato de texto cifrado, compatibilidad con el formato legado y descifrado en lote
+"""
+
+import pytest
+import base64
+import os
+import sys
+
+# Agregar el directorio backend al path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from encryption import (
+    encrypt_data, decrypt_data, decrypt_many, is_encrypted, needs_upgrade,
+    upgrade_ciphertext, upgrade_fields, get_keyring, FORMAT_V1
+)
+
+def legacy_encrypt(text: str) -> str:
+    """Formato anterior: base64 de un token Fernet"""
+    return base64.urlsafe_b64encode(get_keyring().legacy_cipher.encrypt(text.encode())).decode()
+
+# ================================================
+# TESTS DEL FORMATO V1
+# ================================================
+
+def test_roundtrip():
+    """Test 1: Cifrar y descifrar devuelve el texto original"""
+    for text in ["555-1234", "Calle Falsa 123", "Ñandú 🌈 " * 20]:
+        encrypted = encrypt_data(text)
+        assert encrypted.startswith(FORMAT_V1)
+        assert decrypt_data(encrypted) == text
+
+def test_ciphertext_is_randomized():
+    """Test 2: El mismo texto produce cifrados distintos (nonce aleatorio)"""
+    assert encrypt_data("555-1234") != encrypt_data("555-1234")
+
+def test_v1_is_smaller_than_legacy():
+    """Test 3: Una sola capa de base64 reduce el tamaño almacenado"""
+    text = "Calle Falsa 123, Springfield"
+    assert len(encrypt_data(text)) < len(legacy_encrypt(text)) * 0.6
+
+def test_plaintext_passthrough_without_output(capsys):
+    """Test 4: El texto plano se detecta sin excepciones ni escrituras a stdout"""
+    assert not is_encrypted("admin@example.com")
+    assert decrypt_data("admin@example.com") == "admin@example.com"
+    assert capsys.readouterr().out == ""
+
+def test_tampered_ciphertext_not_decrypted():
+    """Test 5: ERROR - Un cifrado alterado no se descifra"""
+    encrypted = encrypt_data("secreto")
+    blob = bytearray(base64.urlsafe_b64decode(encrypted[1:]))
+    blob[-1] ^= 0x01
+    tampered = FORMAT_V1 + base64.urlsafe_b64encode(bytes(blob)).decode()
+    assert decrypt_data(tampered) != "secreto"
+
+def test_empty_values():
+    """Test 6: Valores vacíos se devuelven tal cual"""
+    assert encrypt_data("") == ""
+    assert decrypt_data(None) is None
+
+# ================================================
+# TESTS DE COMPATIBILIDAD Y LOTE
+# ================================================
+
+def test_legacy_values_still_decrypt():
+    """Test 7: Los valores en formato legado siguen siendo legibles"""
+    legacy = legacy_encrypt("555-0000")
+    assert needs_upgrade(legacy)
+    assert decrypt_data(legacy) == "555-0000"
+
+def test_upgrade_legacy_ciphertext():
+    """Test 8: La migración perezosa re-cifra al formato v1"""
+    class Record:
+        phone = legacy_encrypt("555-0000")
+        address = encrypt_data("Oficina Central")
+    record = Record()
+    address_before = record.address
+    
+    assert upgrade_fields(record, ("phone", "address"))
+    assert record.phone.startswith(FORMAT_V1)
+    assert decrypt_data(record.phone) == "555-0000"
+    assert record.address == address_before
+    assert upgrade_ciphertext(record.phone) is None
+
+def test_decrypt_many_mixed_values():
+    """Test 9: decrypt_many acepta mezcla de v1, legado, texto plano y vacíos"""
+    values = [encrypt_data("a"), legacy_encrypt("b"), "c@example.com", None, ""]
+    assert decrypt_many(values) == ["a", "b", "c@example.com", None, ""]
+
+# ================================================
+# TESTS DE GESTIÓN DE CLAVES
+# ================================================
+
+def test_keyfile_caches_derivation(tmp_path, monkeypatch):
+    """Test 10: PBKDF2 se ejecuta una sola vez; luego la clave sale del keyfile"""
+    import encryption
+    calls = []
+    original = encryption.generate_key_from_password
+    monkeypatch.setattr(encryption, "generate_key_from_password",
+                        lambda password: calls.append(password) or original(password))
+    keyfile = str(tmp_path / "keys.json")
+    
+    first = encryption.derive_default_key(b"passphrase", keyfile)
+    second = encryption.derive_default_key(b"passphrase", keyfile)
+    assert first == second
+    assert len(calls) == 1
+    assert oct(os.stat(keyfile).st_mode & 0o777) == "0o600"
+    # Otra passphrase no reutiliza la entrada cacheada
+    assert encryption.derive_default_key(b"otra", keyfile) != first
+
+def test_rotation_keeps_old_ciphertexts_readable():
+    """Test 11: Con una clave activa nueva, los valores viejos siguen descifrándose"""
+    import encryption
+    from encryption import KeyRing, ciphertext_key_id, set_keyring
+    original = get_keyring()
+    old_value = encrypt_data("555-1234")
+    try:
+        new_key = os.urandom(32)
+        set_keyring(KeyRing({0: original.keys[0], 7: new_key}, active_id=7))
+        new_value = encrypt_data("555-1234")
+        assert ciphertext_key_id(old_value) == 0
+        assert ciphertext_key_id(new_value) == 7
+        assert decrypt_data(old_value) == decrypt_data(new_value) == "555-1234"
+    finally:
+        set_keyring(original)
+
+def test_unknown_key_id_not_decrypted():
+    """Test 12: ERROR - Un valor cifrado con una clave no configurada no se descifra"""
+    from encryption import KeyRing, set_keyring
+    original = get_keyring()
+    try:
+        set_keyring(KeyRing({0: original.keys[0], 9: os.urandom(32)}, active_id=9))
+        value = encrypt_data("secreto")
+    finally:
+        set_keyring(original)
+    assert decrypt_data(value) == value
+
+def test_parse_keys_rejects_bad_keys():
+    """Test 13: ERROR - Claves de rotación con tamaño o id inválidos"""
+    from encryption import parse_keys
+    good = base64.urlsafe_b64encode(os.urandom(32)).decode()
+    assert list(parse_keys(f"3:{good}")) == [3]
+    with pytest.raises(ValueError):
+        parse_keys(f"0:{good}")
+    with pytest.raises(ValueError):
+        parse_keys("2:" + base64.urlsafe_b64encode(b"corta").decode())
+
+# ================================================
+# TESTS DE ATRIBUTOS CIFRADOS DEL MODELO
+# ================================================
+
+def test_user_fields_encrypt_on_assignment_and_decrypt_lazily(monkeypatch):
+    """Test 14: Asignar cifra; solo leer el atributo descifra, una vez por instancia"""
+    import encryption
+    from models_auth import User
+    user = User(username="lazy", email="lazy@example.com", hashed_password="x", phone="555-1234")
+    assert user.phone_encrypted.startswith(FORMAT_V1)
+    
+    calls = []
+    original = encryption._decrypt_v1
+    monkeypatch.setattr(encryption, "_decrypt_v1", lambda value: calls.append(value) or original(value))
+    # Simular una instancia cargada desde la BD (sin memo)
+    loaded = User(username="lazy", email="lazy@example.com", hashed_password="x")
+    loaded.phone_encrypted = user.phone_encrypted
+    assert loaded.username == "lazy" and calls == []
+    assert loaded.phone == "555-1234"
+    assert loaded.phone == "555-1234"
+    assert len(calls) == 1
+    # Cambiar la columna invalida la memo
+    loaded.phone_encrypted = encrypt_data("555-9999")
+    assert loaded.phone == "555-9999"
+    assert loaded.address is None
@@ -0,0 +1,106 @@
+"""
+Triggers de SQLite sobre palettes_with_users (contadores, búsqueda y agregados)
+
+Cada INSERT de una paleta dispara varios triggers por fila. En inserciones masivas
+(importación) eso domina el tiempo: dentro de deferred_palette_triggers los triggers
+AFTER INSERT ignoran las filas nuevas y cada módulo las aplica al final del lote con una
+sentencia por rango de ids. El marcador vive solo dentro de la transacción del lote.
+
+El archivado (retention.py) usa otro marcador igual: los agregados por intervalo conservan
+las paletas que salen de la tabla viva.
+"""
+
+from contextlib import contextmanager
+from typing import Callable
+from sqlalchemy import text
+import time
+
+BULK_INSERT_JOB = "bulk_insert:palettes_with_users"
+# Condición WHEN de los triggers AFTER INSERT ON palettes_with_users
+NOT_DEFERRED = (
+    "NOT EXISTS (SELECT 1 FROM job_checkpoints WHERE name = '" + BULK_INSERT_JOB + "' AND NEW.id > last_id)"
+)
+
+ARCHIVE_JOB = "archive:palettes_with_users"
+# Condición WHEN de los triggers AFTER DELETE que no deben restar las paletas archivadas
+NOT_ARCHIVING = "NOT EXISTS (SELECT 1 FROM job_checkpoints WHERE name = '" + ARCHIVE_JOB + "')"
+
+_bulk_appliers: list[Callable] = []
+
+
+def install_triggers(connection, triggers: dict) -> set:
+    """
+    Crear los triggers que falten y recrear los que cambiaron de definición
+
+    Args:
+        triggers: {nombre: (evento, cuerpo)}
+
+    Returns:
+        Nombres de los triggers que no existían (para recalcular lo que mantienen)
+    """
+    existing = dict(connection.execute(text(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger'"
+    )).all())
+    created = set()
+    for name, (event_, body) in triggers.items():
+        sql = f"CREATE TRIGGER {name} {event_} BEGIN {body} END"
+        if existing.get(name) == sql:
+            continue
+        if name in existing:
+            connection.execute(text(f"DROP TRIGGER {name}"))
+        else:
+            created.add(name)
+        connection.execute(text(sql))
+    return created
+
+
+def on_bulk_insert(applier: Callable) -> Callable:
+    """Registrar applier(connection, after_id): aplica las paletas con id > after_id"""
+    _bulk_appliers.append(applier)
+    return applier
+
+
+@contextmanager
+def deferred_palette_triggers(connection):
+    """
+    Insertar paletas en bloque sin disparar los triggers por fila
+
+    Los ids nuevos son mayores que el máximo actual (SQLite serializa las escrituras y
+    el marcador toma el bloqueo de escritura antes de leerlo). Aunque el bloque falle, lo
+    insertado se aplica y el marcador se borra: el estado queda consistente tanto si
+    el llamador confirma como si revierte.
+    """
+    if connection.dialect.name != "sqlite":
+        yield
+        return
+    params = {"name": BULK_INSERT_JOB}
+    connection.execute(text(
+        "INSERT INTO job_checkpoints (name, last_id, processed, params, finished, updated_at) "
+        "SELECT :name, coalesce(max(id), 0), 0, NULL, 0, :now FROM palettes_with_users"
+    ), {**params, "now": time.time()})
+    after_id = connection.execute(text(
+        "SELECT last_id FROM job_checkpoints WHERE name = :name"
+    ), params).scalar()
+    try:
+        yield
+    finally:
+        for applier in _bulk_appliers:
+            applier(connection, after_id)
+        connection.execute(text("DELETE FROM job_checkpoints WHERE name = :name"), params)
+
+
+@contextmanager
+def archiving_palettes(connection):
+    """Borrar paletas archivadas: los triggers con NOT_ARCHIVING no las restan"""
+    if connection.dialect.name != "sqlite":
+        yield
+        return
+    params = {"name": ARCHIVE_JOB}
+    connection.execute(text(
+        "INSERT INTO job_checkpoints (name, last_id, processed, params, finished, updated_at) "
+        "VALUES (:name, 0, 0, NULL, 0, :now)"
+    ), {**params, "now": time.time()})
+    try:
+        yield
+    finally:
+        connection.execute(text("DELETE FROM job_checkpoints WHERE name = :name"), params)
@@ -0,0 +1,100 @@
+"""
+Operaciones de administración sobre conjuntos de usuarios
+Filtros compartidos por el listado paginado y las operaciones masivas (UPDATE/DELETE por conjuntos)
+"""
+
+from datetime import datetime
+from typing import Optional
+from sqlalchemy.orm import Session
+
+import models_auth
+from auth import revoke_users_tokens, refresh_users_permissions, invalidate_cached_user
+
+# Tamaño de las listas IN (...) (lejos del límite de variables de SQLite)
+BULK_CHUNK_SIZE = 500
+
+
+def _chunks(ids: list[int], size: int = BULK_CHUNK_SIZE):
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def user_filter_conditions(role: Optional[str] = None, is_active: Optional[bool] = None,
+                           created_from: Optional[datetime] = None,
+                           created_to: Optional[datetime] = None,
+                           q: Optional[str] = None) -> list:
+    """Condiciones SQL de los filtros de administración (cada una tiene índice de apoyo)"""
+    User = models_auth.User
+    conditions = []
+    if role is not None:
+        conditions.append(User.role == role)
+    if is_active is not None:
+        conditions.append(User.is_active == is_active)
+    if created_from is not None:
+        conditions.append(User.created_at >= created_from)
+    if created_to is not None:
+        conditions.append(User.created_at < created_to)
+    if q:
+        # Rango sobre el índice de username (LIKE 'x%' no usa el índice en SQLite)
+        conditions.extend([User.username >= q, User.username < q + "\U0010ffff"])
+    return conditions
+
+
+def select_user_ids(db: Session, ids: Optional[list[int]], conditions: list,
+                    exclude_id: Optional[int] = None) -> list[int]:
+    """Resolver la selección (lista de ids y/o filtros) a ids existentes"""
+    User = models_auth.User
+    query = db.query(User.id).filter(*conditions)
+    if exclude_id is not None:
+        query = query.filter(User.id != exclude_id)
+    if ids is None:
+        return [row.id for row in query.order_by(User.id)]
+    selected = []
+    for chunk in _chunks(sorted(set(ids))):
+        selected.extend(row.id for row in query.filter(User.id.in_(chunk)).order_by(User.id))
+    return selected
+
+
+def bulk_set_role(db: Session, user_ids: list[int], role: str) -> list[int]:
+    """Cambiar el rol; devuelve los ids que realmente cambiaron (una sola transacción)"""
+    User = models_auth.User
+    changed = []
+    for chunk in _chunks(user_ids):
+        changed.extend(row.id for row in db.query(User.id).filter(User.id.in_(chunk), User.role != role))
+    for chunk in _chunks(changed):
+        db.query(User).filter(User.id.in_(chunk)).update({User.role: role}, synchronize_session=False)
+    # Los tokens emitidos antes llevan la máscara vieja; revoke_users confirma todo junto
+    refresh_users_permissions(db, changed)
+    return changed
+
+
+def bulk_set_status(db: Session, user_ids: list[int], is_active: bool) -> list[int]:
+    """Activar o desactivar; devuelve los ids que realmente cambiaron (una sola transacción)"""
+    User = models_auth.User
+    changed = []
+    for chunk in _chunks(user_ids):
+        changed.extend(row.id for row in db.query(User.id).filter(User.id.in_(chunk), User.is_active != is_active))
+    for chunk in _chunks(changed):
+        db.query(User).filter(User.id.in_(chunk)).update({User.is_active: is_active}, synchronize_session=False)
+    if is_active:
+        # Los cortes por usuario se conservan: los tokens emitidos antes siguen revocados
+        db.commit()
+        for user_id in changed:
+            invalidate_cached_user(user_id)
+    else:
+        revoke_users_tokens(db, changed)
+    return changed
+
+
+def bulk_delete(db: Session, user_ids: list[int]) -> int:
+    """Eliminar usuarios con sus paletas, refresh tokens y overrides (una sola transacción)"""
+    for chunk in _chunks(user_ids):
+        for model in (models_auth.PaletteWithUser, models_auth.RefreshToken,
+                      models_auth.UserPermissionOverride, models_auth.UserProfile):
+            db.query(model).filter(model.user_id.in_(chunk)).delete(synchronize_session=False)
+        db.query(models_auth.User).filter(
+            models_auth.User.id.in_(chunk)
+        ).delete(synchronize_session=False)
+    # Los access tokens vigentes dejan de valer; revoke_users confirma todo junto
+    revoke_users_tokens(db, user_ids)
+    return len(user_ids)
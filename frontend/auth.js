@@ -22,6 +22,7 @@ const AUTH = {
     // Cerrar sesión
     logout() {
         localStorage.removeItem('token');
+        localStorage.removeItem('refresh_token');
         localStorage.removeItem('user');
         window.location.href = 'login.html';
     },
@@ -71,6 +72,29 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 });
 
+// Renovar el access token con el refresh token (sin volver a pedir contraseña)
+async function refreshAccessToken(url) {
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (!refreshToken) {
+        return null;
+    }
+
+    const response = await fetch(`${new URL(url).origin}/token/refresh`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ refresh_token: refreshToken })
+    });
+    if (!response.ok) {
+        return null;
+    }
+
+    const data = await response.json();
+    localStorage.setItem('token', data.access_token);
+    localStorage.setItem('refresh_token', data.refresh_token);
+    localStorage.setItem('user', JSON.stringify(data.user));
+    return data.access_token;
+}
+
 // Función para hacer peticiones autenticadas
 async function authenticatedFetch(url, options = {}) {
     const token = AUTH.getToken();
@@ -80,15 +104,21 @@ async function authenticatedFetch(url, options = {}) {
         throw new Error('No autenticado');
     }
 
-    const defaultOptions = {
-        headers: {
-            'Authorization': `Bearer ${token}`,
-            'Content-Type': 'application/json',
-            ...options.headers
-        }
-    };
+    const buildHeaders = (accessToken) => ({
+        'Authorization': `Bearer ${accessToken}`,
+        'Content-Type': 'application/json',
+        ...options.headers
+    });
+
+    let response = await fetch(url, { ...options, headers: buildHeaders(token) });
 
-    const response = await fetch(url, { ...options, headers: defaultOptions.headers });
+    // Access token expirado: renovar una vez y reintentar
+    if (response.status === 401) {
+        const newToken = await refreshAccessToken(url);
+        if (newToken) {
+            response = await fetch(url, { ...options, headers: buildHeaders(newToken) });
+        }
+    }
 
     // Si el token expiró o es inválido
     if (response.status === 401) {